@@ -0,0 +1,314 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import functools
+from helpers import get_env_var, get_env_int, get_env_float
+from legal_index import normalizar
+from manifest import CollectionManifest, MANIFEST_FILENAME, SHARDS_DIRNAME
+from tracing import get_logger, span
+
+log = get_logger("answer_cache")
+
+
+def normalizar_consulta(query: str) -> str:
+    """Minúsculas, sin acentos ni puntuación y con espacios colapsados."""
+    return " ".join(re.findall(r"\w+", normalizar(query)))
+
+
+def _numeros(query: str) -> tuple:
+    # Dos consultas casi idénticas que citan artículos o leyes distintas no son la misma pregunta
+    return tuple(sorted(re.findall(r"\d+", query)))
+
+
+_fingerprint_memo = {}
+_fingerprint_lock = threading.Lock()
+
+
+def fuente_fingerprint(path: str) -> str:
+    """
+    Huella de una fuente de datos: para un directorio de colección usa el hash de corpus de
+    su manifiesto (y los de sus shards por ley); para otros directorios, nombres y mtimes de sus
+    archivos; para un archivo, su mtime.
+    """
+    shards_dir = os.path.join(path, SHARDS_DIRNAME)
+    if os.path.isdir(shards_dir):
+        partes = [(e.name, fuente_fingerprint(e.path)) for e in os.scandir(shards_dir) if e.is_dir()]
+        partes.append(("", _fuente_fingerprint(path)))
+        return hashlib.sha256(json.dumps(sorted(partes)).encode("utf-8")).hexdigest()
+    return _fuente_fingerprint(path)
+
+
+def _fuente_fingerprint(path: str) -> str:
+    manifest_path = os.path.join(path, MANIFEST_FILENAME)
+    if os.path.isfile(manifest_path):
+        mtime = os.path.getmtime(manifest_path)
+        with _fingerprint_lock:
+            memo = _fingerprint_memo.get(manifest_path)
+        if memo and memo[0] == mtime:
+            return memo[1]
+        digest = CollectionManifest(path).corpus_hash()
+        with _fingerprint_lock:
+            _fingerprint_memo[manifest_path] = (mtime, digest)
+        return digest
+    if os.path.isdir(path):
+        entries = sorted((e.name, e.stat().st_mtime, e.stat().st_size) for e in os.scandir(path) if e.is_file())
+        return hashlib.sha256(json.dumps(entries).encode("utf-8")).hexdigest()
+    if os.path.exists(path):
+        st = os.stat(path)
+        return f"{st.st_size}-{st.st_mtime}"
+    return "ausente"
+
+
+def fingerprint(fuentes: list) -> str:
+    h = hashlib.sha256()
+    for path in fuentes:
+        h.update(path.encode("utf-8"))
+        h.update(fuente_fingerprint(path).encode("utf-8"))
+    return h.hexdigest()
+
+
+class AnswerCache:
+    """
+    Cache de respuestas en SQLite. Busca primero por consulta normalizada exacta y luego por
+    similitud coseno de embeddings sobre el umbral configurado. Cada entrada guarda la huella
+    de las fuentes de las que dependía: si el corpus o las plantillas cambian, deja de valer.
+    La búsqueda por similitud se puede desactivar por llamada (semantic=False) donde dos
+    consultas que solo difieren en un nombre piden cosas distintas, como los datos de un cliente.
+    """
+
+    def __init__(self, path: str, embedder=None, ttl: float = 86400.0, max_entries: int = 5000,
+                 threshold: float = 0.95):
+        self.path = path
+        self.embedder = embedder
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._matrices = {}  # namespace -> (ids, numeros, matriz normalizada)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY,"
+            " namespace TEXT NOT NULL,"
+            " query_norm TEXT NOT NULL,"
+            " numeros TEXT NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " embedding BLOB,"
+            " fingerprint TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " UNIQUE (namespace, query_norm))"
+        )
+        self._conn.commit()
+
+    def _embed(self, query: str):
+        if self.embedder is None:
+            return None
+        import numpy as np
+        try:
+            vec = np.asarray(self.embedder.embed_query(query), dtype=np.float32)
+        except Exception as e:
+            log.warning(f"Cache de respuestas sin búsqueda semántica: {e}")
+            return None
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+
+    def _matrix(self, namespace: str):
+        import numpy as np
+        if namespace not in self._matrices:
+            rows = self._conn.execute(
+                "SELECT id, numeros, embedding FROM answers WHERE namespace = ? AND embedding IS NOT NULL",
+                (namespace,)
+            ).fetchall()
+            if rows:
+                matrix = np.vstack([np.frombuffer(blob, dtype=np.float32) for _, _, blob in rows])
+                self._matrices[namespace] = ([r[0] for r in rows], [r[1] for r in rows], matrix)
+            else:
+                self._matrices[namespace] = ([], [], None)
+        return self._matrices[namespace]
+
+    def _delete(self, entry_id: int, namespace: str):
+        self._conn.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+        self._matrices.pop(namespace, None)
+
+    def get(self, namespace: str, query: str, fp: str, semantic: bool = True):
+        """Respuesta cacheada vigente o None; con semantic=False solo vale la consulta normalizada exacta."""
+        query_norm = normalizar_consulta(query)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, answer, fingerprint, created FROM answers WHERE namespace = ? AND query_norm = ?",
+                (namespace, query_norm)
+            ).fetchone()
+            if row:
+                entry_id, answer, entry_fp, created = row
+                if entry_fp == fp and now - created <= self.ttl:
+                    self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, entry_id))
+                    self._conn.commit()
+                    self.exact_hits += 1
+                    return answer
+                self._delete(entry_id, namespace)
+                self._conn.commit()
+                self.invalidations += 1
+        vec = self._embed(query) if semantic else None
+        if vec is not None:
+            import numpy as np
+            numeros = json.dumps(_numeros(query))
+            with self._lock:
+                ids, entry_numeros, matrix = self._matrix(namespace)
+                if matrix is not None and matrix.shape[1] == vec.shape[0]:
+                    scores = matrix @ vec
+                    for idx in np.argsort(-scores):
+                        if scores[idx] < self.threshold:
+                            break
+                        if entry_numeros[idx] != numeros:
+                            continue
+                        row = self._conn.execute(
+                            "SELECT answer, fingerprint, created FROM answers WHERE id = ?", (ids[idx],)
+                        ).fetchone()
+                        if row is None:
+                            continue
+                        answer, entry_fp, created = row
+                        if entry_fp != fp or now - created > self.ttl:
+                            self._delete(ids[idx], namespace)
+                            self._conn.commit()
+                            self.invalidations += 1
+                            break
+                        self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, ids[idx]))
+                        self._conn.commit()
+                        self.semantic_hits += 1
+                        return answer
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, namespace: str, query: str, answer: str, fp: str, semantic: bool = True):
+        # Sin embedding la entrada nunca es candidata a un acierto por similitud
+        vec = self._embed(query) if semantic else None
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (namespace, query_norm, numeros, answer, embedding, fingerprint, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (namespace, normalizar_consulta(query), json.dumps(_numeros(query)), answer,
+                 vec.tobytes() if vec is not None else None, fp, now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                self._matrices.clear()
+            else:
+                self._matrices.pop(namespace, None)
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / total, 3) if total else 0.0,
+        }
+
+
+def es_cacheable(respuesta: str) -> bool:
+    # Los errores y los documentos generados (que apuntan a un archivo concreto) no se reutilizan
+    return bool(respuesta) and not respuesta.startswith("Error") and "[Documento generado:" not in respuesta
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Cache de respuestas compartido por proceso (None si ANSWER_CACHE=0)."""
+    global _cache
+    if (get_env_var("ANSWER_CACHE") or "1").lower() in ("0", "false", "no"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            embedder = None
+            if (get_env_var("ANSWER_CACHE_SEMANTIC") or "1").lower() not in ("0", "false", "no"):
+                from embeddings import LMStudioEmbeddings
+                embedder = LMStudioEmbeddings(
+                    api_base=get_env_var("OPENAI_API_BASE"),
+                    model_name=get_env_var("EMBEDDING_MODEL_NAME")
+                )
+            _cache = AnswerCache(
+                get_env_var("ANSWER_CACHE_PATH") or os.path.join("cache", "answers.sqlite"),
+                embedder=embedder,
+                ttl=get_env_float("ANSWER_CACHE_TTL", 86400.0),
+                max_entries=get_env_int("ANSWER_CACHE_MAX_ENTRIES", 5000),
+                threshold=get_env_float("ANSWER_CACHE_THRESHOLD", 0.95),
+            )
+        return _cache
+
+
+def cached_answer(namespace: str, fuentes: list, semantic: bool = True):
+    """
+    Decorador para funciones query -> str: consulta el cache antes de ejecutarlas. Con
+    semantic=False solo se reutiliza la respuesta de la misma consulta normalizada.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(query, *args, **kwargs):
+            with span(f"tool_{namespace}") as s:
+                cache = get_answer_cache()
+                if cache is None or args or kwargs:
+                    return func(query, *args, **kwargs)
+                fp = fingerprint(fuentes)
+                answer = cache.get(namespace, query, fp, semantic=semantic)
+                s.set(cache_hit=answer is not None)
+                if answer is not None:
+                    return answer
+                answer = func(query)
+                if es_cacheable(answer):
+                    # La huella se recalcula: la ejecución pudo haber sincronizado la colección
+                    cache.put(namespace, query, answer, fingerprint(fuentes), semantic=semantic)
+                return answer
+        return wrapper
+    return decorator
+
+
+class CachedAgent:
+    """Envuelve al AgentExecutor con el cache de respuestas manteniendo la interfaz invoke()."""
+
+    def __init__(self, executor, fuentes: list, namespace: str = "agente", semantic: bool = True):
+        self.executor = executor
+        self.fuentes = fuentes
+        self.namespace = namespace
+        self.semantic = semantic
+
+    def invoke(self, input, config=None, **kwargs):
+        query = input["input"] if isinstance(input, dict) else input
+        with span("agent") as s:
+            cache = get_answer_cache()
+            fp = fingerprint(self.fuentes) if cache is not None else None
+            if cache is not None:
+                answer = cache.get(self.namespace, query, fp, semantic=self.semantic)
+                s.set(cache_hit=answer is not None)
+                if answer is not None:
+                    return {"input": query, "output": answer}
+            result = self.executor.invoke(input, config=config, **kwargs)
+            output = result["output"] if isinstance(result, dict) and "output" in result else str(result)
+            if cache is not None and es_cacheable(output):
+                cache.put(self.namespace, query, output, fingerprint(self.fuentes), semantic=self.semantic)
+            return result
+
+    def __getattr__(self, name):
+        return getattr(self.executor, name)
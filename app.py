@@ -1,9 +1,37 @@
 import streamlit as st
 import os
-from main import agent, guardar_documento_generado
+import main as legisbot
+from streaming import stream_agent
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+@st.cache_resource
+def iniciar_componentes():
+    # Una sola vez por proceso: los reruns de Streamlit reutilizan el mismo warm-up
+    return legisbot.start_warmup()
+
+def mostrar_estado(warmup):
+    estado = warmup.report()
+    with st.sidebar:
+        if estado["listo"]:
+            st.success(f"Componentes listos ({estado['transcurrido_s']} s)")
+        else:
+            st.info("Inicializando componentes en segundo plano...")
+        for nombre, s in estado["componentes"].items():
+            detalle = f" ({s['segundos']} s)" if "segundos" in s else ""
+            st.caption(f"{nombre}: {s['estado']}{detalle}")
+        st.caption(f"Importación: {estado['importacion_s']} s")
 
 def main():
+    try:
+        legisbot.get_index_bundle()
+    except legisbot.BundleError as e:
+        # Modo de solo lectura con un bundle de otro modelo de embeddings: no se inicia
+        st.error(str(e))
+        st.stop()
+    warmup = iniciar_componentes()
     st.title("Agente Jurídico Inteligente")
+    mostrar_estado(warmup)
     consulta = st.text_area("Ingrese su consulta:")
     consultar = st.button("Consultar")
     
@@ -13,36 +41,54 @@ def main():
             return
             
         try:
-            with st.spinner("Procesando su consulta..."):
-                respuesta = agent.invoke(consulta)
-                respuesta_str = respuesta["output"] if isinstance(respuesta, dict) and "output" in respuesta else str(respuesta)
-                
-                if respuesta_str.startswith("Error:"):
-                    st.error(respuesta_str)
-                    return
-                    
-                st.subheader("Respuesta:")
-                st.write(respuesta_str)
-                
-                if respuesta_str.startswith("[Plantilla seleccionada: "):
-                    try:
-                        output_path = guardar_documento_generado(respuesta_str)
-                        if output_path and os.path.exists(output_path):
-                            st.success(f"Documento generado y guardado exitosamente en: {output_path}")
-                            
-                            # Mostrar el contenido del archivo guardado
-                            with open(output_path, "r", encoding="utf-8") as f:
-                                contenido = f.read()
-                                st.download_button(
-                                    "Descargar documento",
-                                    contenido,
-                                    file_name=os.path.basename(output_path),
-                                    mime="text/plain"
-                                )
-                        else:
-                            st.error("El documento se generó pero no se pudo guardar correctamente.")
-                    except Exception as e:
-                        st.error(f"Error al guardar el documento: {str(e)}")
+            resultado = {}
+            status = st.status("Procesando su consulta...", expanded=False)
+
+            def respuesta_stream():
+                # Pasos del agente en el panel de estado; la respuesta final token a token
+                for evento, dato in stream_agent(legisbot.get_agent(), consulta):
+                    if evento == "step":
+                        status.write(f"Herramienta: {dato}")
+                    elif evento == "answer":
+                        yield dato
+                    elif evento == "final":
+                        resultado["respuesta"] = dato
+                    elif evento == "metrics":
+                        resultado["metrics"] = dato
+
+            st.subheader("Respuesta:")
+            st.write_stream(respuesta_stream())
+            status.update(label="Consulta procesada", state="complete")
+            respuesta_str = resultado.get("respuesta", "")
+            metrics = resultado.get("metrics", {})
+            st.caption(f"Primer token: {metrics.get('time_to_first_token')} s · "
+                       f"Primer token de respuesta: {metrics.get('time_to_first_answer_token')} s · "
+                       f"Total: {metrics.get('total')} s")
+
+            if respuesta_str.startswith("Error:"):
+                st.error(respuesta_str)
+                return
+
+            if respuesta_str.startswith("[Plantilla seleccionada: "):
+                try:
+                    output_path = legisbot.guardar_documento_generado(respuesta_str)
+                    if output_path and os.path.exists(output_path):
+                        st.success(f"Documento generado y guardado exitosamente en: {output_path}")
+                        
+                        # Mostrar el contenido del archivo guardado
+                        es_docx = output_path.lower().endswith(".docx")
+                        with open(output_path, "rb") as f:
+                            contenido = f.read()
+                            st.download_button(
+                                "Descargar documento",
+                                contenido,
+                                file_name=os.path.basename(output_path),
+                                mime=DOCX_MIME if es_docx else "text/plain"
+                            )
+                    else:
+                        st.error("El documento se generó pero no se pudo guardar correctamente.")
+                except Exception as e:
+                    st.error(f"Error al guardar el documento: {str(e)}")
         except Exception as e:
             st.error(f"Error al procesar la consulta: {str(e)}")
 
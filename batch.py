@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from helpers import get_env_int
+from manifest import sha256_file
+from plantillas import get_template_registry
+from client_registry import get_client_registry
+from docx_fill import OUTPUT_DIR, ruta_lote
+from tracing import get_logger, get_tracer, span
+import main as legisbot
+
+# Registro de cada documento terminado (una línea JSON por trabajo, se agrega a medida que terminan)
+LOTE_FILENAME = "lote.jsonl"
+RESUMEN_FILENAME = "resumen.json"
+CONSULTA_POR_DEFECTO = "Completar la plantilla con los datos del cliente"
+
+log = get_logger("batch")
+
+
+def listar_clientes(rutas: list) -> list:
+    """
+    Clientes del lote (ClienteRegistrado) leídos del registro de clientes, igual que en la
+    herramienta de plantillas: archivos DOCX sueltos, todos los .docx de los directorios
+    indicados, o clientes del registro principal indicados por nombre, DNI, CUIT o expediente.
+    """
+    clientes = {}
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            registry = get_client_registry(ruta)
+            archivos = [os.path.join(ruta, f) for f in sorted(os.listdir(ruta))
+                        if f.lower().endswith(".docx") and not f.startswith("~$")]
+        elif os.path.isfile(ruta):
+            registry = get_client_registry(os.path.dirname(ruta) or ".")
+            archivos = [ruta]
+        else:
+            registrado = legisbot.get_clientes().resolver("", ruta)
+            if registrado is None:
+                log.warning(f"No se encontró el cliente {ruta}")
+            else:
+                clientes.setdefault(registrado.path, registrado)
+            continue
+        for archivo in archivos:
+            registrado = registry.por_path(archivo)
+            if registrado is None:
+                log.warning(f"No se pudieron leer los datos del cliente {archivo}")
+            else:
+                clientes.setdefault(registrado.path, registrado)
+    return list(clientes.values())
+
+
+def clave_trabajo(cliente_hash: str, plantilla, consulta: str) -> str:
+    """Identifica el contenido de un trabajo: si cambian el cliente, la plantilla o la consulta, se regenera."""
+    return f"{cliente_hash[:16]}:{plantilla.name}:{plantilla.mtime}:{consulta}"
+
+
+def cargar_lote(output_dir: str) -> dict:
+    """Trabajos ya terminados en una corrida anterior: {ruta de salida: registro}."""
+    hechos = {}
+    path = os.path.join(output_dir, LOTE_FILENAME)
+    if not os.path.exists(path):
+        return hechos
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                registro = json.loads(line)
+            except ValueError:
+                continue  # línea cortada por una interrupción
+            if registro.get("estado") == "ok":
+                hechos[registro["salida"]] = registro
+    return hechos
+
+
+class BatchGenerator:
+    """
+    Genera la combinación clientes x plantillas: los datos de cada cliente se leen una vez,
+    los documentos se generan en un pool de hilos con un límite aparte para las llamadas al LLM,
+    cada resultado se registra en lote.jsonl apenas termina y al reanudar se omiten los que
+    ya existen con el mismo contenido de entrada.
+    """
+
+    def __init__(self, output_dir: str, workers: int = 4, llm_workers: int = 2, force: bool = False):
+        self.output_dir = output_dir
+        self.workers = workers
+        self.limite_llm = threading.BoundedSemaphore(max(llm_workers, 1))
+        self.force = force
+        self._lock = threading.Lock()
+
+    def _registrar(self, registro: dict):
+        with self._lock:
+            with open(os.path.join(self.output_dir, LOTE_FILENAME), "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+    def _generar(self, plantilla, cliente_path: str, datos: dict, consulta: str, salida: str, clave: str) -> dict:
+        inicio = time.perf_counter()
+        registro = {"cliente": cliente_path, "plantilla": plantilla.name, "salida": salida, "clave": clave}
+        tmp_path = f"{salida}.tmp{os.path.splitext(salida)[1]}"
+        with span("batch_job", plantilla=plantilla.name) as s:
+            try:
+                faltantes = sorted(plantilla.missing(datos))
+                completos = legisbot.completar_datos(plantilla, datos, consulta, limite_llm=self.limite_llm)
+                # Se escribe en un temporal: un documento a medio escribir nunca cuenta como hecho
+                legisbot.generar_documento(plantilla, completos, tmp_path)
+                os.replace(tmp_path, salida)
+                registro.update(estado="ok", campos_redactados=faltantes, bytes=os.path.getsize(salida))
+                s.add(llm_calls=1 if faltantes else 0)
+            except Exception as e:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                log.error(f"{plantilla.name} / {cliente_path}: {e}")
+                registro.update(estado="error", error=str(e))
+        registro["segundos"] = round(time.perf_counter() - inicio, 3)
+        self._registrar(registro)
+        return registro
+
+    def run(self, clientes: list, plantillas: list, consulta: str = CONSULTA_POR_DEFECTO) -> dict:
+        os.makedirs(self.output_dir, exist_ok=True)
+        inicio = time.perf_counter()
+        hechos = {} if self.force else cargar_lote(self.output_dir)
+        resumen = {"generados": 0, "omitidos": 0, "errores": 0, "llamadas_llm": 0, "documentos": []}
+
+        # Datos de cada cliente una sola vez, reutilizados en todas las plantillas
+        datos_clientes = {}
+        for cliente in clientes:
+            try:
+                datos_clientes[cliente.path] = (sha256_file(cliente.path), cliente.datos_plantilla())
+            except Exception as e:
+                log.error(f"No se pudieron leer los datos del cliente {cliente.path}: {e}")
+                resumen["errores"] += len(plantillas)
+
+        trabajos = []
+        for cliente, (cliente_hash, datos) in datos_clientes.items():
+            for plantilla in plantillas:
+                ext = ".docx" if plantilla.path.lower().endswith(".docx") else ".txt"
+                salida = ruta_lote(plantilla.name, cliente, ext, self.output_dir)
+                clave = clave_trabajo(cliente_hash, plantilla, consulta)
+                previo = hechos.get(salida)
+                if previo and previo.get("clave") == clave and os.path.exists(salida):
+                    resumen["omitidos"] += 1
+                    resumen["documentos"].append(previo)
+                    continue
+                trabajos.append((plantilla, cliente, datos, consulta, salida, clave))
+        log.info(f"Lote: {len(trabajos)} documentos a generar, {resumen['omitidos']} ya generados")
+
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as pool:
+            futures = [pool.submit(self._generar, *trabajo) for trabajo in trabajos]
+            for n, future in enumerate(as_completed(futures), 1):
+                registro = future.result()
+                resumen["documentos"].append(registro)
+                if registro["estado"] == "ok":
+                    resumen["generados"] += 1
+                    resumen["llamadas_llm"] += 1 if registro["campos_redactados"] else 0
+                else:
+                    resumen["errores"] += 1
+                log.info(f"[{n}/{len(trabajos)}] {registro['estado']}: {registro['salida']}")
+
+        resumen["segundos"] = round(time.perf_counter() - inicio, 3)
+        resumen["documentos"].sort(key=lambda r: r["salida"])
+        tmp_path = os.path.join(self.output_dir, RESUMEN_FILENAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(resumen, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, os.path.join(self.output_dir, RESUMEN_FILENAME))
+        return resumen
+
+
+def resolver_plantillas(registry, nombres: list) -> list:
+    if not nombres:
+        return [registry.get(name) for name in registry.names()]
+    plantillas = []
+    for nombre in nombres:
+        plantilla = registry.get(os.path.basename(nombre)) or registry.get(registry.select(nombre) or "")
+        if plantilla is None:
+            log.warning(f"No se encontró la plantilla {nombre}")
+        elif plantilla not in plantillas:
+            plantillas.append(plantilla)
+    return plantillas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generación de documentos en lote: clientes x plantillas")
+    parser.add_argument("--clientes", nargs="+", default=[os.path.join("docs", "clientes")],
+                        help="archivos DOCX de datos de cliente, directorios que los contienen o clientes "
+                             "del registro (nombre, DNI, CUIT o expediente)")
+    parser.add_argument("--plantillas", nargs="*", default=[],
+                        help="nombres de plantilla (por defecto todas las de --plantillas-dir)")
+    parser.add_argument("--plantillas-dir", default=os.path.join("docs", "plantillas"))
+    parser.add_argument("--consulta", default=CONSULTA_POR_DEFECTO, help="instrucción para redactar campos faltantes")
+    parser.add_argument("--salida", default=os.path.join(OUTPUT_DIR, "lote"))
+    parser.add_argument("--workers", type=int, default=get_env_int("BATCH_WORKERS", 4))
+    parser.add_argument("--llm-workers", type=int, default=get_env_int("BATCH_LLM_WORKERS", 2),
+                        help="llamadas simultáneas al LLM")
+    parser.add_argument("--force", action="store_true", help="regenerar aunque ya existan")
+    args = parser.parse_args()
+
+    plantillas = resolver_plantillas(get_template_registry(args.plantillas_dir), args.plantillas)
+    clientes = listar_clientes(args.clientes)
+    if not plantillas or not clientes:
+        parser.error("No hay plantillas o clientes para generar")
+    generador = BatchGenerator(args.salida, workers=args.workers, llm_workers=args.llm_workers, force=args.force)
+    resumen = generador.run(clientes, plantillas, args.consulta)
+    get_tracer().flush()
+    print(f"Generados: {resumen['generados']}, omitidos: {resumen['omitidos']}, errores: {resumen['errores']}, "
+          f"llamadas al LLM: {resumen['llamadas_llm']} ({resumen['segundos']} s)")
+    print(f"Resumen en {os.path.join(args.salida, RESUMEN_FILENAME)}")
@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+from docx import Document as DocxDocument
+from fake_server import start_fake_server
+from server import LatencyStats
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# Marca del directorio de trabajo: solo se limpian directorios creados por el benchmark
+MARKER = ".legisbot-benchmark"
+GENERATED = ("docs", "cache", "chroma_db_legislacion", "chroma_db_clientes", "docs_outputs")
+
+CODIGOS = {
+    "Código Civil y Comercial de la Nación": ["contratos", "obligaciones", "prescripción", "sucesiones", "dominio"],
+    "Código Procesal Civil y Comercial": ["demanda", "prueba", "sentencia", "recursos", "plazos procesales"],
+    "Ley de Contrato de Trabajo": ["despido", "remuneración", "vacaciones", "licencias", "indemnización"],
+}
+
+PLANTILLAS = {
+    "Demanda de prescripción adquisitiva": [
+        "PROMUEVE DEMANDA DE PRESCRIPCIÓN ADQUISITIVA",
+        "Señor Juez: {nombre}, DNI {dni}, con domicilio real en {domicilio}, me presento y digo:",
+        "I. OBJETO. Vengo a promover demanda de prescripción adquisitiva sobre el inmueble sito en {inmueble}.",
+        "II. HECHOS. Poseo el inmueble en forma pública, pacífica e ininterrumpida desde {fecha_posesion}.",
+        "III. DERECHO. Fundo el derecho en los artículos 1897 y siguientes del Código Civil y Comercial.",
+        "IV. PETITORIO. Solicito se haga lugar a la demanda con costas. {honorarios}",
+    ],
+    "Contrato de locación": [
+        "CONTRATO DE LOCACIÓN",
+        "Entre {nombre}, DNI {dni}, en adelante LOCADOR, y {locatario}, en adelante LOCATARIO, se celebra el presente.",
+        "PRIMERA. Objeto: el inmueble ubicado en {inmueble}.",
+        "SEGUNDA. Plazo: {plazo} meses a partir de la firma.",
+        "TERCERA. Precio: el canon mensual será de {precio}.",
+    ],
+    "Poder general judicial": [
+        "PODER GENERAL JUDICIAL",
+        "{nombre}, DNI {dni}, otorga poder general judicial a favor de {apoderado}.",
+        "El apoderado queda facultado para intervenir en el expediente {expediente} y en toda otra causa.",
+    ],
+}
+
+CONSULTAS = {
+    "legislacion": [
+        "¿Qué dice el artículo {n} del Código Civil y Comercial?",
+        "art. {n} de la Ley de Contrato de Trabajo",
+        "plazo de prescripción de las obligaciones",
+        "requisitos de la demanda en el código procesal",
+    ],
+    "clientes": [
+        "¿Cuál es el domicilio del cliente del expediente {n}?",
+        "estado del expediente {n}",
+        "DNI del cliente",
+    ],
+    "plantillas": [
+        "qué dice la plantilla de prescripción sobre los hechos",
+        "cuál es el plazo en el contrato de locación",
+        "qué facultades tiene el poder general judicial",
+    ],
+    "agente": [
+        "¿Qué establece el artículo {n} del Código Procesal Civil y Comercial?",
+        "¿Cuál es el estado del expediente {n} del cliente?",
+        "qué dice la plantilla de prescripción sobre los hechos",
+        "cuáles son los derechos del trabajador ante un despido",
+    ],
+}
+
+
+def _guardar_docx(path: str, parrafos: list):
+    doc = DocxDocument()
+    for parrafo in parrafos:
+        doc.add_paragraph(parrafo)
+    doc.save(path)
+
+
+def generar_corpus(base_dir: str, articulos: int = 2000, clientes: int = 50, seed: int = 7) -> dict:
+    """
+    Genera un corpus sintético: códigos con `articulos` artículos cada uno (uno en DOCX y el resto en
+    TXT), un expediente DOCX por cliente, el DOCX de datos del cliente y plantillas con placeholders.
+    """
+    rng = random.Random(seed)
+    legislacion_dir = os.path.join(base_dir, "docs", "legislacionLR")
+    clientes_dir = os.path.join(base_dir, "docs", "clientes")
+    plantillas_dir = os.path.join(base_dir, "docs", "plantillas")
+    for d in (legislacion_dir, clientes_dir, plantillas_dir):
+        os.makedirs(d, exist_ok=True)
+
+    for i, (nombre, temas) in enumerate(CODIGOS.items()):
+        parrafos = [nombre.upper(), "TÍTULO PRELIMINAR"]
+        for n in range(1, articulos + 1):
+            tema = rng.choice(temas)
+            parrafos.append(
+                f"ARTÍCULO {n}.- Régimen de {tema}. El régimen de {tema} se rige por las disposiciones de este "
+                f"código. Las partes deben cumplir las obligaciones a su cargo dentro del plazo de {rng.randint(1, 10)} "
+                f"años, salvo disposición en contrario. En caso de incumplimiento, la parte afectada puede reclamar "
+                f"la reparación del daño conforme a los artículos {rng.randint(1, articulos)} y siguientes."
+            )
+        if i == 0:
+            _guardar_docx(os.path.join(legislacion_dir, f"{nombre}.docx"), parrafos)
+        else:
+            with open(os.path.join(legislacion_dir, f"{nombre}.txt"), "w", encoding="utf-8") as f:
+                f.write("\n\n".join(parrafos))
+
+    _guardar_docx(os.path.join(clientes_dir, "Datos del Cliente.docx"), [
+        "Nombre: Juan Pérez", "DNI: 30111222", "Domicilio: Av. Siempreviva 742", "CUIT: 20-30111222-3",
+        "Expediente: 1234/2024", "Inmueble: Calle Falsa 123", "Locatario: María Gómez", "Plazo: 24",
+        "Precio: $350.000", "Apoderado: Dra. Ana López",
+    ])
+    for n in range(1, clientes + 1):
+        _guardar_docx(os.path.join(clientes_dir, f"Expediente {n}.docx"), [
+            f"EXPEDIENTE {n}/2024",
+            f"Cliente: Cliente {n}", f"DNI: {30000000 + n}", f"Domicilio: Calle {n} número {rng.randint(100, 999)}",
+            f"Estado: {rng.choice(['en trámite', 'con sentencia', 'archivado', 'en prueba'])}",
+            f"Objeto: {rng.choice(['prescripción adquisitiva', 'despido', 'cobro de pesos', 'desalojo'])}",
+        ])
+
+    for nombre, parrafos in PLANTILLAS.items():
+        _guardar_docx(os.path.join(plantillas_dir, f"{nombre}.docx"), parrafos)
+
+    return {"codigos": len(CODIGOS), "articulos_por_codigo": articulos, "expedientes": clientes,
+            "plantillas": len(PLANTILLAS)}
+
+
+def _consultas(tipo: str, rng: random.Random, n: int, maximo: int) -> list:
+    return [rng.choice(CONSULTAS[tipo]).format(n=rng.randint(1, maximo)) for _ in range(n)]
+
+
+def _medir(nombre: str, func, consultas: list, stats: LatencyStats) -> int:
+    errores = 0
+    for consulta in consultas:
+        t0 = time.perf_counter()
+        try:
+            func(consulta)
+        except Exception as e:
+            errores += 1
+            print(f"[ADVERTENCIA] {nombre}: {e}")
+        stats.add(nombre, time.perf_counter() - t0)
+    return errores
+
+
+def _ingestar(rag, data_dir: str, persist_dir: str, server, hybrid: bool, sharded: bool = False) -> dict:
+    from manifest import CollectionManifest
+    antes = dict(server.counters)
+    t0 = time.perf_counter()
+    rag.build_rag_chain(data_dir, persist_path=persist_dir, hybrid=hybrid, sharded=sharded)
+    frio = time.perf_counter() - t0
+    dirs = [os.path.join(persist_dir, rag.SHARDS_DIRNAME, ley) for ley in rag.shard_files(data_dir)] if sharded else [persist_dir]
+    chunks = sum(len(CollectionManifest(d).all_chunk_ids()) for d in dirs)
+    embebidos = server.counters["embedded_texts"] - antes["embedded_texts"]
+    t0 = time.perf_counter()
+    rag.build_rag_chain(data_dir, persist_path=persist_dir, hybrid=hybrid, sharded=sharded)
+    tibio = time.perf_counter() - t0
+    return {
+        "segundos_frio": round(frio, 3),
+        "segundos_sin_cambios": round(tibio, 3),
+        "chunks": chunks,
+        "textos_embebidos": embebidos,
+        "chunks_por_segundo": round(chunks / frio, 1) if frio else None,
+        "shards": len(dirs) if sharded else None,
+    }
+
+
+def run_benchmark(args) -> dict:
+    server = start_fake_server(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                               embedding_latency=args.embedding_latency)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="legisbot-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    if os.path.exists(os.path.join(workdir, "docs")) and not os.path.exists(os.path.join(workdir, MARKER)):
+        raise SystemExit(f"{workdir} ya tiene un directorio docs que no generó el benchmark; use otro --workdir")
+    reutilizar = args.keep and os.path.exists(os.path.join(workdir, MARKER))
+    if not reutilizar:
+        for nombre in GENERATED:
+            shutil.rmtree(os.path.join(workdir, nombre), ignore_errors=True)
+        open(os.path.join(workdir, MARKER), "w").close()
+    os.environ.update({
+        "OPENAI_API_BASE": server.base_url,
+        "OPENAI_API_KEY": "benchmark",
+        "MODEL_NAME": "fake",
+        "EMBEDDING_MODEL_NAME": "fake-embedding",
+        "ANONYMIZED_TELEMETRY": "False",
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "cache", "embeddings.sqlite"),
+        "PARSE_CACHE_DIR": os.path.join(workdir, "cache", "parsed"),
+        "ANSWER_CACHE": "1" if args.answer_cache else "0",
+        "ANSWER_CACHE_PATH": os.path.join(workdir, "cache", "answers.sqlite"),
+    })
+    # main.py y rag.py usan rutas relativas (docs/, chroma_db_*)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    print(f"[INFO] Benchmark en {workdir} contra {server.base_url}")
+
+    t0 = time.perf_counter()
+    corpus = {"reutilizado": True}
+    if not reutilizar:
+        corpus = generar_corpus(workdir, args.articulos, args.clientes, args.seed)
+        corpus["segundos_generacion"] = round(time.perf_counter() - t0, 3)
+
+    import rag
+    from helpers import get_env_var
+    ingesta = {
+        "legislacion": _ingestar(rag, os.path.join("docs", "legislacionLR"), "chroma_db_legislacion", server, hybrid=True,
+                                 sharded=get_env_var("LEGISLACION_SHARDS") != "0"),
+        "clientes": _ingestar(rag, os.path.join("docs", "clientes"), "chroma_db_clientes", server, hybrid=False),
+    }
+
+    t0 = time.perf_counter()
+    import main
+    importacion = time.perf_counter() - t0
+    import llm_client
+    t0 = time.perf_counter()
+    main.warmup()
+    warmup = time.perf_counter() - t0
+
+    rng = random.Random(args.seed)
+    stats = LatencyStats(window=max(args.repeticiones, 1))
+    errores = {}
+    mediciones = [
+        ("rag_legislacion", main.rag_legislacion_tool_func, _consultas("legislacion", rng, args.repeticiones, args.articulos)),
+        ("rag_clientes", main.rag_clientes_tool_func, _consultas("clientes", rng, args.repeticiones, args.clientes)),
+        ("cag_tool_func", main.cag_tool_func, _consultas("plantillas", rng, args.repeticiones, 1)),
+        ("agent.invoke", lambda q: main.agent.invoke({"input": q}), _consultas("agente", rng, args.repeticiones, args.clientes)),
+    ]
+    for nombre, func, consultas in mediciones:
+        print(f"[INFO] Midiendo {nombre} ({len(consultas)} consultas)")
+        errores[nombre] = _medir(nombre, func, consultas, stats)
+
+    latencias = stats.summary()
+    for nombre, cantidad in errores.items():
+        latencias[nombre]["errores"] = cantidad
+    return {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "entorno": {"python": platform.python_version(), "plataforma": platform.platform()},
+        "config": {"latencia_llm": args.latency, "tokens_por_segundo": args.tokens_per_second,
+                   "latencia_embeddings": args.embedding_latency, "repeticiones": args.repeticiones,
+                   "cache_respuestas": args.answer_cache, "seed": args.seed},
+        "corpus": corpus,
+        "ingesta": ingesta,
+        "arranque": {"importar_main_s": round(importacion, 3), "warmup_s": round(warmup, 3)},
+        "latencias": latencias,
+        "router": main.router.stats(),
+        "llm": llm_client.llm_stats(),
+        "shards": rag.shard_stats(),
+        "servidor_simulado": dict(server.counters),
+    }
+
+
+def comparar(resultados: dict, baseline: dict, tolerancia: float) -> list:
+    """Devuelve las métricas de latencia que empeoraron más que la tolerancia respecto del baseline."""
+    regresiones = []
+    for nombre, actual in resultados["latencias"].items():
+        previo = baseline.get("latencias", {}).get(nombre)
+        if not previo:
+            continue
+        for metrica in ("p50_ms", "p95_ms", "p99_ms"):
+            if previo.get(metrica) and actual[metrica] > previo[metrica] * (1 + tolerancia):
+                regresiones.append(f"{nombre} {metrica}: {previo[metrica]} -> {actual[metrica]}")
+    for coleccion, actual in resultados["ingesta"].items():
+        previo = baseline.get("ingesta", {}).get(coleccion, {}).get("chunks_por_segundo")
+        if previo and actual["chunks_por_segundo"] < previo / (1 + tolerancia):
+            regresiones.append(f"ingesta {coleccion} chunks/s: {previo} -> {actual['chunks_por_segundo']}")
+    return regresiones
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline con servidor LLM simulado y corpus sintético")
+    parser.add_argument("--workdir", help="directorio de trabajo (por defecto uno temporal)")
+    parser.add_argument("--keep", action="store_true", help="reutilizar el corpus y las colecciones de --workdir")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.20, help="empeoramiento admitido frente al baseline")
+    parser.add_argument("--articulos", type=int, default=2000, help="artículos por código")
+    parser.add_argument("--clientes", type=int, default=50)
+    parser.add_argument("--repeticiones", type=int, default=30, help="consultas por herramienta")
+    parser.add_argument("--latency", type=float, default=0.05, help="segundos hasta el primer token del LLM simulado")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--answer-cache", action="store_true", help="medir con el cache de respuestas activo")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    resultados = run_benchmark(args)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(json.dumps({"ingesta": resultados["ingesta"], "latencias": resultados["latencias"]}, ensure_ascii=False, indent=2))
+    print(f"Resultados guardados en {output}")
+
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia)
+        if regresiones:
+            print("Regresiones respecto del baseline:")
+            for linea in regresiones:
+                print(f"  - {linea}")
+            sys.exit(1)
+        print("Sin regresiones respecto del baseline.")
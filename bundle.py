@@ -0,0 +1,281 @@
+import os
+import json
+import shutil
+import hashlib
+import zipfile
+import argparse
+import threading
+from datetime import datetime
+from helpers import get_env_var
+from manifest import CollectionManifest, sha256_file
+from plantillas import TemplateRegistry
+from tracing import get_logger, get_tracer, span
+
+# Versión del formato del bundle: un bundle de otra versión no se abre
+BUNDLE_VERSION = 3
+BUNDLE_INFO = "bundle.json"
+PLANTILLAS_INFO = "plantillas.json"
+ARTICULOS_FILENAME = "articulos.json"
+CLIENTES_DB = "clientes.sqlite"
+# Archivos que no se comprimen (las matrices de embeddings casi no ganan y se descomprimen más lento)
+SIN_COMPRIMIR = (".f32", ".i8")
+
+# Colecciones del agente: nombre -> (directorio de documentos, partida por ley con LEGISLACION_SHARDS)
+COLECCIONES = {
+    "clientes": (os.path.join("docs", "clientes"), False),
+    "legislacion": (os.path.join("docs", "legislacionLR"), True),
+}
+
+log = get_logger("bundle")
+
+
+class BundleError(RuntimeError):
+    """Bundle ilegible, de otra versión o armado con otro modelo de embeddings."""
+
+
+# --- Construcción (offline) ---
+
+def _build_index(persist_dir: str, data_dir: str, embedding_model: str, dtype: str, files: list = None) -> dict:
+    from rag import article_table, get_embeddings, sync_collection
+    from vector_store import MmapVectorStore
+    os.makedirs(persist_dir, exist_ok=True)
+    vectordb = MmapVectorStore(os.path.join(persist_dir, "mmap"), get_embeddings(embedding_model), dtype=dtype)
+    with span("ingest", coleccion=persist_dir):
+        manifest = sync_collection(vectordb, data_dir, persist_dir, embedding_model, backend="mmap", files=files)
+    vectordb.compact()
+    with open(os.path.join(persist_dir, ARTICULOS_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(article_table(vectordb), f, ensure_ascii=False)
+    return {"dir": persist_dir, "corpus_hash": manifest.corpus_hash(), "archivos": len(manifest.files),
+            "chunks": len(vectordb), "dim": vectordb.dim, "dtype": vectordb.dtype}
+
+
+def build_collection(nombre: str, data_dir: str, workdir: str, embedding_model: str, dtype: str,
+                     sharded: bool = False) -> dict:
+    """
+    Ingiere data_dir en un índice mmap bajo workdir/nombre (o uno por ley en
+    workdir/nombre/shards/<ley> con sharded), incremental: el manifiesto omite lo que no cambió
+    desde la construcción anterior. Los índices se compactan para empaquetarlos.
+    """
+    persist_dir = os.path.join(workdir, nombre)
+    if not sharded:
+        return _build_index(persist_dir, data_dir, embedding_model, dtype)
+    from rag import SHARDS_DIRNAME, prune_shards, shard_files
+    grupos = shard_files(data_dir)
+    prune_shards(persist_dir, grupos)
+    shards = {ley: _build_index(os.path.join(persist_dir, SHARDS_DIRNAME, ley), data_dir, embedding_model, dtype, files)
+              for ley, files in sorted(grupos.items())}
+    corpus = {ley: c["corpus_hash"] for ley, c in shards.items()}
+    return {"dir": persist_dir, "corpus_hash": hashlib.sha256(json.dumps(corpus).encode("utf-8")).hexdigest(),
+            "archivos": sum(c["archivos"] for c in shards.values()), "chunks": sum(c["chunks"] for c in shards.values()),
+            "dim": next((c["dim"] for c in shards.values() if c["dim"]), None), "dtype": dtype,
+            "shards": {ley: {k: v for k, v in c.items() if k != "dir"} for ley, c in shards.items()}}
+
+
+def _agregar(zf: zipfile.ZipFile, path: str, arcname: str):
+    compresion = zipfile.ZIP_STORED if path.endswith(SIN_COMPRIMIR) else zipfile.ZIP_DEFLATED
+    zf.write(path, arcname, compress_type=compresion)
+
+
+def build_bundle(output_path: str, workdir: str, plantillas_dir: str, embedding_model: str,
+                 dtype: str = "float32", colecciones: dict = COLECCIONES,
+                 clientes_dir: str = os.path.join("docs", "clientes")) -> dict:
+    """
+    Arma el bundle de índices: un único archivo zip con, por colección, el índice mmap
+    (chunks, metadata y embeddings), su manifiesto y la tabla de artículos; las plantillas con
+    su texto ya extraído; el registro de clientes; y bundle.json con versión, modelo de
+    embeddings y hash del corpus.
+    """
+    if not embedding_model:
+        raise BundleError("EMBEDDING_MODEL_NAME no está configurado")
+    info = {"version": BUNDLE_VERSION, "creado": datetime.now().isoformat(timespec="seconds"),
+            "embedding_model": embedding_model, "colecciones": {}, "plantillas": {}}
+    construidas = {}
+    for nombre, (data_dir, por_ley) in colecciones.items():
+        sharded = por_ley and get_env_var("LEGISLACION_SHARDS") != "0"
+        construidas[nombre] = build_collection(nombre, data_dir, workdir, embedding_model, dtype, sharded=sharded)
+        info["colecciones"][nombre] = {k: v for k, v in construidas[nombre].items() if k != "dir"}
+        log.info(f"Colección {nombre}: {construidas[nombre]['chunks']} chunks de {construidas[nombre]['archivos']} archivos")
+
+    registry = TemplateRegistry(plantillas_dir, refresh_interval=0)
+    snapshot = registry.snapshot()
+    for entry in snapshot:
+        info["plantillas"][entry["name"]] = sha256_file(os.path.join(plantillas_dir, entry["name"]))
+
+    from client_registry import ClientRegistry
+    clientes = ClientRegistry(clientes_dir, os.path.join(workdir, CLIENTES_DB), refresh_interval=0)
+    clientes_export = os.path.join(workdir, f"{CLIENTES_DB}.export")
+    clientes.export(clientes_export)
+    info["clientes"] = len(clientes)
+
+    # Hash del corpus (modelo de embeddings y contenido de cada archivo de cada colección) e
+    # identificador por contenido: el mismo corpus, plantillas y formato dan el mismo id
+    corpus = {n: c["corpus_hash"] for n, c in sorted(info["colecciones"].items())}
+    info["corpus_hash"] = hashlib.sha256(json.dumps(corpus).encode("utf-8")).hexdigest()
+    info["id"] = hashlib.sha256(json.dumps([BUNDLE_VERSION, dtype, info["corpus_hash"], info["plantillas"]],
+                                           sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with span("bundle_write") as s:
+        with zipfile.ZipFile(tmp_path, "w") as zf:
+            for nombre, c in construidas.items():
+                # Una colección partida por ley lleva un índice completo por shard
+                indices = [f"shards/{ley}" for ley in sorted(c["shards"])] if "shards" in c else [""]
+                for indice in indices:
+                    origen = os.path.join(c["dir"], indice)
+                    destino = f"colecciones/{nombre}/{indice}".rstrip("/")
+                    for fname in sorted(os.listdir(os.path.join(origen, "mmap"))):
+                        _agregar(zf, os.path.join(origen, "mmap", fname), f"{destino}/mmap/{fname}")
+                    for fname in (ARTICULOS_FILENAME, "manifest.json"):
+                        _agregar(zf, os.path.join(origen, fname), f"{destino}/{fname}")
+            for entry in snapshot:
+                _agregar(zf, os.path.join(plantillas_dir, entry["name"]), f"plantillas/{entry['name']}")
+            _agregar(zf, clientes_export, CLIENTES_DB)
+            zf.writestr(PLANTILLAS_INFO, json.dumps(snapshot, ensure_ascii=False), zipfile.ZIP_DEFLATED)
+            # bundle.json al final: un zip sin él está incompleto
+            zf.writestr(BUNDLE_INFO, json.dumps(info, ensure_ascii=False, indent=1), zipfile.ZIP_DEFLATED)
+        os.replace(tmp_path, output_path)
+        s.add(bytes=os.path.getsize(output_path))
+    return info
+
+
+# --- Lectura (servicio de solo lectura) ---
+
+def read_bundle_info(path: str) -> dict:
+    try:
+        with zipfile.ZipFile(path) as zf:
+            info = json.loads(zf.read(BUNDLE_INFO))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        raise BundleError(f"No se pudo leer el bundle {path}: {e}")
+    if info.get("version") != BUNDLE_VERSION:
+        raise BundleError(f"{path}: versión de bundle {info.get('version')}, se esperaba {BUNDLE_VERSION}")
+    return info
+
+
+class IndexBundle:
+    """
+    Bundle de índices abierto en modo de solo lectura: se extrae una vez a un directorio de cache
+    con el id del bundle (las siguientes aperturas lo reutilizan) y los índices se abren con
+    memory-map desde ahí. Nada se ingiere ni se embebe: los documentos y las plantillas ya
+    vienen procesados.
+    """
+
+    def __init__(self, path: str, cache_dir: str = None, embedding_model: str = None):
+        self.path = path
+        self.info = read_bundle_info(path)
+        self.embedding_model = self.info["embedding_model"]
+        # Se verifica antes de extraer: con otro modelo no se llega a tocar el disco
+        if embedding_model is not None:
+            self.check_embedding_model(embedding_model)
+        self.root = os.path.join(cache_dir or os.path.join("cache", "bundles"), self.info["id"])
+        self._templates = None
+        self._clientes = None
+        self._lock = threading.Lock()
+        if not os.path.isdir(self.root):
+            self._extract()
+
+    def _extract(self):
+        with span("bundle_extract") as s:
+            tmp_dir = f"{self.root}.tmp-{os.getpid()}"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            with zipfile.ZipFile(self.path) as zf:
+                zf.extractall(tmp_dir)
+                s.add(bytes=sum(i.file_size for i in zf.infolist()))
+            try:
+                os.rename(tmp_dir, self.root)
+            except OSError:
+                # Otro proceso lo extrajo al mismo tiempo: vale el suyo
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                if not os.path.isdir(self.root):
+                    raise
+        log.info(f"Bundle {self.path} extraído en {self.root}")
+
+    def check_embedding_model(self, configured: str):
+        if configured != self.embedding_model:
+            raise BundleError(f"El bundle {self.path} se armó con el modelo de embeddings {self.embedding_model!r} "
+                              f"y el configurado es {configured!r}: las consultas no serían comparables")
+
+    def _coleccion_dir(self, nombre: str, ley: str = None) -> str:
+        if nombre not in self.info["colecciones"]:
+            raise BundleError(f"El bundle {self.path} no tiene la colección {nombre}")
+        if ley is None:
+            return os.path.join(self.root, "colecciones", nombre)
+        if ley not in self.shards(nombre):
+            raise BundleError(f"El bundle {self.path} no tiene el shard {ley} de la colección {nombre}")
+        return os.path.join(self.root, "colecciones", nombre, "shards", ley)
+
+    def shards(self, nombre: str) -> list:
+        """Leyes de una colección armada partida por ley (lista vacía si es un único índice)."""
+        return sorted(self.info["colecciones"].get(nombre, {}).get("shards", {}))
+
+    def open_collection(self, nombre: str, embeddings, ley: str = None):
+        from vector_store import MmapVectorStore
+        return MmapVectorStore(os.path.join(self._coleccion_dir(nombre, ley), "mmap"), embeddings,
+                               dtype=self.info["colecciones"][nombre]["dtype"])
+
+    def article_table(self, nombre: str, ley: str = None) -> dict:
+        with open(os.path.join(self._coleccion_dir(nombre, ley), ARTICULOS_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def manifest(self, nombre: str, ley: str = None) -> CollectionManifest:
+        return CollectionManifest(self._coleccion_dir(nombre, ley))
+
+    @property
+    def plantillas_dir(self) -> str:
+        return os.path.join(self.root, "plantillas")
+
+    def template_registry(self) -> TemplateRegistry:
+        """Registro de plantillas fijo con el texto ya extraído al armar el bundle."""
+        with self._lock:
+            if self._templates is None:
+                with open(os.path.join(self.root, PLANTILLAS_INFO), "r", encoding="utf-8") as f:
+                    self._templates = TemplateRegistry(self.plantillas_dir, snapshot=json.load(f))
+            return self._templates
+
+    def client_registry(self):
+        """Registro de clientes armado con el bundle, abierto en modo de solo lectura."""
+        from client_registry import ClientRegistry
+        with self._lock:
+            if self._clientes is None:
+                self._clientes = ClientRegistry(None, os.path.join(self.root, CLIENTES_DB))
+            return self._clientes
+
+
+_bundle_lock = threading.Lock()
+
+
+def get_index_bundle():
+    """
+    Bundle configurado en INDEX_BUNDLE (compartido por proceso), o None si el servicio indexa
+    docs/ por su cuenta. Falla si el bundle no coincide con EMBEDDING_MODEL_NAME.
+    """
+    path = get_env_var("INDEX_BUNDLE")
+    if not path:
+        return None
+    if not hasattr(get_index_bundle, "instance"):
+        with _bundle_lock:
+            if not hasattr(get_index_bundle, "instance"):
+                get_index_bundle.instance = IndexBundle(path, get_env_var("INDEX_BUNDLE_CACHE_DIR"),
+                                                        embedding_model=get_env_var("EMBEDDING_MODEL_NAME") or "")
+    return get_index_bundle.instance
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arma el bundle de índices para servir en modo de solo lectura")
+    parser.add_argument("--salida", default=os.path.join("dist", "legisbot_index.zip"))
+    parser.add_argument("--workdir", default=os.path.join("cache", "bundle_build"),
+                        help="índices intermedios (se reutilizan entre construcciones)")
+    parser.add_argument("--plantillas-dir", default=os.path.join("docs", "plantillas"))
+    parser.add_argument("--dtype", choices=["float32", "int8"], default=(get_env_var("VECTOR_DTYPE") or "float32").lower())
+    args = parser.parse_args()
+
+    info = build_bundle(args.salida, args.workdir, args.plantillas_dir, get_env_var("EMBEDDING_MODEL_NAME"),
+                        dtype=args.dtype)
+    get_tracer().flush()
+    for nombre, c in info["colecciones"].items():
+        shards = f", {len(c['shards'])} shards" if "shards" in c else ""
+        print(f"{nombre}: {c['chunks']} chunks de {c['archivos']} archivos ({c['dtype']}, dim {c['dim']}{shards})")
+    print(f"Plantillas: {len(info['plantillas'])}")
+    print(f"Clientes: {info['clientes']}")
+    print(f"Bundle {info['id']} ({info['embedding_model']}) en {args.salida}, "
+          f"{os.path.getsize(args.salida) / 1e6:.1f} MB")
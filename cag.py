@@ -1,18 +1,25 @@
 import os
-from langchain_community.llms import OpenAI
-from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader, Docx2txtLoader
-from langchain.text_splitter import CharacterTextSplitter
+from parsing import parse_documents, list_supported_files, as_documents, SUPPORTED_EXTENSIONS
+from prefix_cache import PrefixCacheManager, build_backend
+from tracing import get_logger
+
+log = get_logger("cag")
 
 class CAGModule:
     def __init__(self, openai_api_base: str, openai_api_key: str, model_name: str):
+        # Importación diferida: importar cag (vía plantillas) no debe cargar el cliente de OpenAI
+        from llm_client import get_llm
         self.model_name = model_name
-        self.llm = OpenAI(
-            openai_api_base=openai_api_base,
-            openai_api_key=openai_api_key,
+        self.llm = get_llm(
+            api_base=openai_api_base,
+            api_key=openai_api_key,
             model_name=model_name,
             temperature=0.0,
-            max_tokens=300
+            max_tokens=300,
+            # llama.cpp reutiliza el prefill de un prompt idéntico; otros servidores ignoran el campo
+            extra_body={"cache_prompt": True}
         )
+        self.prefix_cache = PrefixCacheManager(build_backend(self.llm, openai_api_base))
 
     def prepare_kvcache(self, documents: str|list, kvcache_path: str = None, answer_instruction: str = None):
         # Optimización: unir documentos y limpiar espacios
@@ -27,50 +34,36 @@ class CAGModule:
         knowledges = f"""
 Dar respuestas precisas según el contexto dado.\n
 La información del contexto se encuentra a continuación.\n------------------------------------------------\n{documents}\n------------------------------------------------\n{answer_instruction}\nPregunta:"""
-        # Simulación de cache: guardar el prompt base
+        # El prefijo se registra por hash de contenido: el servidor hace su prefill una sola vez
+        self.prefix_cache.register(knowledges)
         if kvcache_path:
             with open(kvcache_path, 'w', encoding='utf-8') as f:
                 f.write(knowledges)
         return knowledges
 
     def run_qna(self, question, knowledge_cache):
-        # Optimización: prompt más robusto y limpio
-        prompt = f"{knowledge_cache}\n{question}\nRespuesta:"
-        response = self.llm.invoke(prompt)
-        return response
+        # El conocimiento va primero y sin modificar, la pregunta al final: prefijo reutilizable
+        return self.prefix_cache.complete(knowledge_cache, f"\n{question}\nRespuesta:")
+
+    def stream_qna(self, question, knowledge_cache):
+        # Igual que run_qna pero entregando los tokens a medida que llegan
+        yield from self.prefix_cache.stream(knowledge_cache, f"\n{question}\nRespuesta:")
 
 def load_documents_with_langchain(path: str) -> list:
-    import os
-    docs = []
+    from langchain.text_splitter import CharacterTextSplitter
     if os.path.isdir(path):
-        loaders = [
-            (".txt", TextLoader),
-            (".pdf", PyPDFLoader),
-            (".docx", Docx2txtLoader)
-        ]
-        for ext, Loader in loaders:
-            loader = DirectoryLoader(path, glob=f"*{ext}", loader_cls=Loader)
-            try:
-                docs.extend(loader.load())
-            except Exception as e:
-                print(f"[ADVERTENCIA] No se pudo cargar {ext}: {e}")
+        paths = list_supported_files(path)
     else:
-        # Detecta extensión y usa el loader adecuado
         ext = os.path.splitext(path)[1].lower()
-        try:
-            if ext == ".txt":
-                loader = TextLoader(path, encoding="utf-8")
-                docs = loader.load()
-            elif ext == ".pdf":
-                loader = PyPDFLoader(path)
-                docs = loader.load()
-            elif ext == ".docx":
-                loader = Docx2txtLoader(path)
-                docs = loader.load()
-            else:
-                raise ValueError(f"Extensión de archivo no soportada: {ext}")
-        except Exception as e:
-            print(f"ERROR No se pudo cargar el archivo {path}: {e}")
+        if ext not in SUPPORTED_EXTENSIONS:
+            log.error(f"No se pudo cargar el archivo {path}: Extensión de archivo no soportada: {ext}")
             return []
+        paths = [path]
+    # Capa de carga compartida: parseo en paralelo y texto cacheado por archivo
+    parsed = parse_documents(paths)
+    docs = []
+    for p in paths:
+        if p in parsed:
+            docs.extend(as_documents(p, parsed[p]))
     splitter = CharacterTextSplitter(chunk_size=2000, chunk_overlap=200)
     return splitter.split_documents(docs)
@@ -1,132 +1,210 @@
-import requests
+import re
 import json
+import time
 import base64
+import hashlib
 import os
+from datetime import datetime
 from typing import List
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-import PyPDF2
-import docx
+from parsing import parse_document, parse_documents, list_supported_files
+from tracing import get_logger
 
+log = get_logger("caggemini")
 
-load_dotenv()
-API_KEY = os.getenv("GEMINI_API_KEY")
 MODEL = "models/gemini-1.5-flash-001"
-CACHE_ID_FILE = "cache/gemini_cache_id.txt"
+BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+STATE_FILE = "cache/gemini_cache.json"
 
 def extract_text_from_pdf(pdf_path: str) -> str:
-    text = ""
-    with open(pdf_path, "rb") as f:
-        reader = PyPDF2.PdfReader(f)
-        for page in reader.pages:
-            text += page.extract_text() or ""
-    return text
+    return "".join(parse_document(pdf_path))
 
 def extract_text_from_docx(docx_path: str) -> str:
-    doc = docx.Document(docx_path)
-    return "\n".join([p.text for p in doc.paragraphs])
-
-def load_all_texts_from_data() -> str:
-    data_dir = "docs"
-    all_texts: List[str] = []
-    for fname in os.listdir(data_dir):
-        fpath = os.path.join(data_dir, fname)
-        if fname.lower().endswith(".txt"):
-            with open(fpath, "r", encoding="utf-8") as f:
-                all_texts.append(f.read())
-        elif fname.lower().endswith(".pdf"):
-            all_texts.append(extract_text_from_pdf(fpath))
-        elif fname.lower().endswith(".docx"):
-            all_texts.append(extract_text_from_docx(fpath))
+    return "\n".join(parse_document(docx_path))
+
+def load_all_texts_from_data(data_dir: str = "docs") -> str:
+    paths = list_supported_files(data_dir)
+    parsed = parse_documents(paths)
+    all_texts: List[str] = ["".join(parsed[p]) for p in paths if p in parsed]
     return "\n\n".join(all_texts)
 
-def is_cache_valid(cache_id: str) -> bool:
-    #verificacion de cache almacenada
-    query_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-001:generateContent?key={API_KEY}"
-    query_body = {
-        "contents": [
-            {"role": "user", "parts": [{"text": "ping"}]}
-        ],
-        "cachedContent": cache_id
-    }
-    resp = requests.post(query_url, json=query_body)
-    if resp.status_code == 200:
-        return True
-    # Si el error es por expiración o cache inválido, retorna False
-    try:
-        err = resp.json().get("error", {})
-        if err.get("status", "").upper() in ["NOT_FOUND", "FAILED_PRECONDITION", "INVALID_ARGUMENT"]:
-            return False
-    except Exception:
-        pass
-    return False
-
-# 1. Leer todos los documentos y codificarlos en base64
-all_text = load_all_texts_from_data()
-documento_bytes = all_text.encode("utf-8")
-documento_b64 = base64.b64encode(documento_bytes).decode("utf-8")
-
-# 2. Reutilizar cache si existe
-if os.path.exists(CACHE_ID_FILE):
-    with open(CACHE_ID_FILE) as f:
-        cache_id = f.read().strip()
-    if is_cache_valid(cache_id):
-        print(f"Reutilizando cache existente: {cache_id}")
-    else:
-        print("Cache expirado o inválido, creando uno nuevo...")
-        cache_id = None
-else:
-    cache_id = None
-#crear cache si no existe o es inválido
-if not cache_id:
-    cache_url = f"https://generativelanguage.googleapis.com/v1beta/cachedContents?key={API_KEY}"
-    cache_body = {
-        "model": MODEL,
-        "contents": [
-            {
-                "parts": [
-                    {
-                        "inline_data": {
-                            "mime_type": "text/plain",
-                            "data": documento_b64
+def _parse_expire_time(value: str) -> float:
+    """Convierte el expireTime RFC 3339 de la API (hasta nanosegundos, sufijo Z) a epoch."""
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))
+    return datetime.fromisoformat(value).timestamp()
+
+
+class GeminiContextCache:
+    """
+    Cache de contexto de Gemini para el corpus de documentos. Guarda junto al id del cache
+    el hash del corpus y su vencimiento: la validez se verifica con la metadata del cache
+    (sin llamadas de generación), el TTL se extiende antes de vencer y el corpus solo se
+    vuelve a subir cuando cambia su contenido.
+    """
+
+    def __init__(self, api_key: str, model: str = MODEL, base_url: str = BASE_URL, state_file: str = STATE_FILE,
+                 ttl_seconds: int = 3600, refresh_margin: int = 300, timeout: float = 60.0,
+                 system_instruction: str = "You are an expert analyzing transcripts."):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.state_file = state_file
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.system_instruction = system_instruction
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=4, max_retries=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.state = self._load_state()
+        self._digest_memo = None
+
+    # --- estado local ---
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        if os.path.dirname(self.state_file):
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp_path = self.state_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_file)
+
+    @staticmethod
+    def corpus_hash(corpus_text: str) -> str:
+        return hashlib.sha256(corpus_text.encode("utf-8")).hexdigest()
+
+    # --- API ---
+
+    def _url(self, path: str) -> str:
+        return f"{self.base_url}/{path}"
+
+    def _params(self, **extra) -> dict:
+        return {"key": self.api_key, **extra}
+
+    def get_metadata(self, cache_id: str):
+        """Metadata del cache (incluye expireTime) o None si ya no existe."""
+        resp = self.session.get(self._url(cache_id), params=self._params(), timeout=self.timeout)
+        if resp.status_code in (403, 404):
+            return None
+        resp.raise_for_status()
+        return resp.json()
+
+    def extend_ttl(self, cache_id: str) -> float:
+        resp = self.session.patch(self._url(cache_id), params=self._params(updateMask="ttl"),
+                                  json={"ttl": f"{self.ttl_seconds}s"}, timeout=self.timeout)
+        resp.raise_for_status()
+        return _parse_expire_time(resp.json()["expireTime"])
+
+    def create(self, corpus_text: str) -> dict:
+        body = {
+            "model": self.model,
+            "contents": [
+                {
+                    "parts": [
+                        {
+                            "inline_data": {
+                                "mime_type": "text/plain",
+                                "data": base64.b64encode(corpus_text.encode("utf-8")).decode("utf-8")
+                            }
                         }
-                    }
-                ],
-                "role": "user"
-            }
-        ],
-        "systemInstruction": {
-            "parts": [{"text": "You are an expert analyzing transcripts."}]
-        },
-        "ttl": "3600s"
-    }
-    cache_resp = requests.post(cache_url, json=cache_body)
-    print("Respuesta completa:", cache_resp.text)
-    cache_resp.raise_for_status()
-    cache_id = cache_resp.json()["name"]
-    print("Cache creado:", cache_id)
-    os.makedirs(os.path.dirname(CACHE_ID_FILE), exist_ok=True)
-    with open(CACHE_ID_FILE, "w") as f:
-        f.write(cache_id)
-
-# 3. Hacer consultas interactivas usando el cache
-while True:
-    pregunta = input("Pregunta (o 'salir'): ")
-    if pregunta.strip().lower() in ["salir", "exit", "quit"]:
-        break
-    query_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-001:generateContent?key={API_KEY}"
-    query_body = {
-        "contents": [
-            {
-                "role": "user",
-                "parts": [{"text": pregunta}]
-            }
-        ],
-        "cachedContent": cache_id
-    }
-    query_resp = requests.post(query_url, json=query_body)
-    try:
-        query_resp.raise_for_status()
-        respuesta = query_resp.json()["candidates"][0]["content"]["parts"][0]["text"]
-        print("Respuesta:", respuesta)
-    except Exception as e:
-        print("Error en la consulta:", query_resp.text)
\ No newline at end of file
+                    ],
+                    "role": "user"
+                }
+            ],
+            "systemInstruction": {"parts": [{"text": self.system_instruction}]},
+            "ttl": f"{self.ttl_seconds}s"
+        }
+        resp = self.session.post(self._url("cachedContents"), params=self._params(), json=body, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def delete(self, cache_id: str):
+        try:
+            self.session.delete(self._url(cache_id), params=self._params(), timeout=self.timeout)
+        except requests.RequestException as e:
+            log.warning(f"No se pudo eliminar el cache {cache_id}: {e}")
+
+    # --- ciclo de vida ---
+
+    def ensure(self, corpus_text: str) -> str:
+        """Devuelve un cache_id vigente para el corpus, reutilizando, extendiendo o creando según haga falta."""
+        # Las preguntas sucesivas sobre el mismo texto no vuelven a hashear todo el corpus
+        if self._digest_memo is not None and self._digest_memo[0] is corpus_text:
+            digest = self._digest_memo[1]
+        else:
+            digest = self.corpus_hash(corpus_text)
+            self._digest_memo = (corpus_text, digest)
+        cache_id = self.state.get("cache_id")
+        now = time.time()
+        if cache_id and self.state.get("corpus_hash") == digest:
+            expire = self.state.get("expire_time", 0)
+            if expire - now > self.refresh_margin:
+                return cache_id
+            meta = self.get_metadata(cache_id)
+            if meta is not None:
+                expire = _parse_expire_time(meta["expireTime"])
+                if expire - now <= self.refresh_margin:
+                    expire = self.extend_ttl(cache_id)
+                    log.info(f"TTL del cache extendido: {cache_id}")
+                self.state["expire_time"] = expire
+                self._save_state()
+                return cache_id
+            log.info("Cache expirado o inválido, creando uno nuevo...")
+        elif cache_id:
+            log.info("El corpus cambió, se reemplaza el cache...")
+            self.delete(cache_id)
+        created = self.create(corpus_text)
+        self.state = {
+            "cache_id": created["name"],
+            "corpus_hash": digest,
+            "expire_time": _parse_expire_time(created["expireTime"]) if "expireTime" in created else now + self.ttl_seconds,
+        }
+        self._save_state()
+        log.info(f"Cache creado: {created['name']}")
+        return created["name"]
+
+    def generate(self, cache_id: str, question: str) -> str:
+        model_name = self.model.split("/", 1)[-1]
+        body = {
+            "contents": [{"role": "user", "parts": [{"text": question}]}],
+            "cachedContent": cache_id
+        }
+        resp = self.session.post(self._url(f"models/{model_name}:generateContent"), params=self._params(),
+                                 json=body, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()["candidates"][0]["content"]["parts"][0]["text"]
+
+    def ask(self, corpus_text: str, question: str) -> str:
+        return self.generate(self.ensure(corpus_text), question)
+
+
+def main():
+    load_dotenv()
+    cache = GeminiContextCache(os.getenv("GEMINI_API_KEY"))
+    all_text = load_all_texts_from_data()
+    cache_id = cache.ensure(all_text)
+    print(f"Usando cache: {cache_id}")
+    # Consultas interactivas usando el cache
+    while True:
+        pregunta = input("Pregunta (o 'salir'): ")
+        if pregunta.strip().lower() in ["salir", "exit", "quit"]:
+            break
+        try:
+            respuesta = cache.ask(all_text, pregunta)
+            print("Respuesta:", respuesta)
+        except Exception as e:
+            print("Error en la consulta:", e)
+
+
+if __name__ == "__main__":
+    main()
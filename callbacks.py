@@ -0,0 +1,122 @@
+# Callbacks de LangChain, aparte de tracing.py y streaming.py para que importar main no cargue
+# LangChain: este módulo se importa recién al construir un LLM o al ejecutar el agente
+import time
+import queue
+from langchain_core.callbacks import BaseCallbackHandler
+from tracing import span
+from streaming import FINAL_ANSWER_MARKER
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Registra cada llamada al LLM de LangChain como etapa "llm" con caracteres y tokens."""
+
+    # Inline: los callbacks corren en el hilo de la llamada y la etapa queda bajo la consulta correcta
+    run_inline = True
+
+    def __init__(self):
+        self._open = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        ctx = span("llm", modelo=(serialized or {}).get("kwargs", {}).get("model_name"))
+        s = ctx.__enter__()
+        s.add(prompt_chars=sum(len(p) for p in prompts))
+        self._open[run_id] = ctx
+
+    def _close(self, run_id, exc=None):
+        ctx = self._open.pop(run_id, None)
+        if ctx is None:
+            return None
+        if exc is not None:
+            ctx.__exit__(type(exc), exc, None)
+        else:
+            ctx.__exit__(None, None, None)
+        return ctx.span
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        ctx = self._open.get(run_id)
+        if ctx is not None:
+            s = ctx.span
+            s.add(completion_chars=sum(len(g.text) for gens in response.generations for g in gens))
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            s.add(**{k: v for k, v in usage.items() if k in ("prompt_tokens", "completion_tokens") and v})
+        self._close(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, error)
+
+
+tracing_callback = TracingCallbackHandler()
+
+
+class AgentStreamHandler(BaseCallbackHandler):
+    """
+    Convierte los callbacks del agente en eventos para mostrar progreso incremental:
+      ("thought", token)      tokens del razonamiento del agente
+      ("step", texto)         herramienta elegida y su entrada
+      ("tool_token", token)   tokens generados por el LLM dentro de una herramienta
+      ("observation", texto)  resultado de la herramienta
+      ("answer", token)       tokens de la respuesta final
+    """
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.first_answer_at = None
+        self.answer_emitted = False
+        self._buffer = ""
+        self._answer_pos = None
+        self._in_tool = 0
+
+    def _emit(self, kind: str, data):
+        self.events.put((kind, data))
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        if not self._in_tool:
+            self._buffer = ""
+            self._answer_pos = None
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        if self._in_tool:
+            self._emit("tool_token", token)
+            return
+        self._buffer += token
+        if self._answer_pos is None:
+            idx = self._buffer.find(FINAL_ANSWER_MARKER)
+            if idx == -1:
+                self._emit("thought", token)
+                return
+            self._answer_pos = idx + len(FINAL_ANSWER_MARKER)
+        # Todo lo que llegue después del marcador es respuesta final
+        chunk = self._buffer[self._answer_pos:]
+        self._answer_pos = len(self._buffer)
+        if chunk:
+            if self.first_answer_at is None:
+                self.first_answer_at = time.perf_counter()
+                chunk = chunk.lstrip()
+            self.answer_emitted = True
+            self._emit("answer", chunk)
+
+    def on_agent_action(self, action, **kwargs):
+        self._emit("step", f"{action.tool}: {action.tool_input}")
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self._in_tool += 1
+
+    def on_tool_end(self, output, **kwargs):
+        self._in_tool = max(self._in_tool - 1, 0)
+        self._emit("observation", str(output))
+
+    def on_tool_error(self, error, **kwargs):
+        self._in_tool = max(self._in_tool - 1, 0)
+
+    def metrics(self, finished_at: float) -> dict:
+        def since_start(t):
+            return round(t - self.started, 3) if t is not None else None
+        return {
+            "time_to_first_token": since_start(self.first_token_at),
+            "time_to_first_answer_token": since_start(self.first_answer_at),
+            "total": since_start(finished_at),
+        }
@@ -0,0 +1,335 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from helpers import get_env_var, get_env_float
+from legal_index import normalizar
+from manifest import sha256_file
+from utils import datos_desde_lineas
+from tracing import get_logger, span
+
+CLIENT_EXTENSIONS = (".docx", ".txt")
+# Archivo usado cuando la consulta no identifica a ningún cliente (el único que se leía antes)
+CLIENTE_POR_DEFECTO = "Datos del Cliente.docx"
+CLIENTES_DIR = os.path.join("docs", "clientes")
+
+# Campos del formulario (normalizados, sin acentos) que identifican al cliente, por tipo de clave
+CAMPOS_CLAVE = {
+    "nombre": ("nombre", "cliente", "nombre_del_cliente", "apellido_y_nombre", "nombre_y_apellido", "razon_social"),
+    "dni": ("dni", "documento", "nro_de_documento", "numero_de_documento"),
+    "cuit": ("cuit", "cuil"),
+    "expediente": ("expediente", "expte", "numero_de_expediente", "nro_de_expediente"),
+}
+# Orden de búsqueda en una consulta: de la clave más específica a la más ambigua. El nombre de
+# archivo ("datos del cliente") solo cuenta cuando el cliente se indica explícitamente
+ORDEN_CLAVES = ("cuit", "dni", "expediente", "expediente_numero", "nombre", "apellido")
+
+CUIT_PATTERN = re.compile(r"\b(\d{2})-?(\d{8})-?(\d)\b")
+DNI_PATTERN = re.compile(r"\b\d{1,2}\.?\d{3}\.?\d{3}\b")
+EXPEDIENTE_PATTERN = re.compile(r"\b(\d{1,7})\s*/\s*(\d{2,4})\b")
+# "expediente 3", "expte. nº 1234/2024": el número sin año también identifica si es único
+CITA_EXPEDIENTE = re.compile(r"\bexp(?:ediente|te)?\.?\s*(?:n[º°o]\.?\s*)?(\d{1,7})(?:\s*/\s*(\d{2,4}))?", re.IGNORECASE)
+# Palabras que piden la ficha completa del cliente
+PALABRAS_FICHA = {"datos", "ficha", "informacion", "info"}
+MAX_PALABRAS_NOMBRE = 5
+
+log = get_logger("client_registry")
+
+
+def _palabras(texto: str) -> list:
+    return re.findall(r"\w+", normalizar(texto))
+
+
+def claves_cliente(datos: dict, texto: str, path: str) -> list:
+    """
+    Claves (tipo, valor) por las que se encuentra al cliente: nombre (y apellido), DNI, CUIT,
+    número de expediente (de un campo o de un encabezado "EXPEDIENTE 12/2024") y nombre de archivo.
+    """
+    campos = {normalizar(k): v for k, v in datos.items()}
+    claves = set()
+    for tipo, nombres in CAMPOS_CLAVE.items():
+        for campo in nombres:
+            valor = campos.get(campo)
+            if not valor:
+                continue
+            if tipo == "nombre":
+                palabras = _palabras(valor)
+                if palabras:
+                    claves.add(("nombre", " ".join(palabras)))
+                    if len(palabras) > 1 and not palabras[-1].isdigit() and len(palabras[-1]) > 2:
+                        claves.add(("apellido", palabras[-1]))
+            elif tipo == "cuit":
+                claves.update(("cuit", "".join(m.groups())) for m in CUIT_PATTERN.finditer(valor))
+            elif tipo == "dni":
+                claves.update(("dni", m.group(0).replace(".", "")) for m in DNI_PATTERN.finditer(valor))
+            else:
+                claves.update(("expediente", f"{m.group(1)}/{m.group(2)}") for m in EXPEDIENTE_PATTERN.finditer(valor))
+    for m in CITA_EXPEDIENTE.finditer(texto):
+        if m.group(2):
+            claves.add(("expediente", f"{m.group(1)}/{m.group(2)}"))
+    claves.update(("expediente_numero", valor.split("/")[0]) for tipo, valor in list(claves) if tipo == "expediente")
+    if claves:
+        claves.add(("archivo", " ".join(_palabras(os.path.splitext(os.path.basename(path))[0]))))
+    return sorted(claves)
+
+
+def claves_consulta(texto: str) -> dict:
+    """Valores candidatos de cada tipo de clave mencionados en una consulta (o en un parámetro explícito)."""
+    candidatos = {
+        "cuit": ["".join(m.groups()) for m in CUIT_PATTERN.finditer(texto)],
+        "dni": [m.group(0).replace(".", "") for m in DNI_PATTERN.finditer(texto)],
+        "expediente": [f"{m.group(1)}/{m.group(2)}" for m in EXPEDIENTE_PATTERN.finditer(texto)],
+        "expediente_numero": [m.group(1) for m in CITA_EXPEDIENTE.finditer(texto) if not m.group(2)],
+    }
+    palabras = _palabras(texto)
+    # Secuencias de palabras de la consulta, de la más larga a la más corta
+    ngramas = [" ".join(palabras[i:i + n]) for n in range(min(MAX_PALABRAS_NOMBRE, len(palabras)), 0, -1)
+               for i in range(len(palabras) - n + 1)]
+    candidatos["nombre"] = candidatos["archivo"] = ngramas
+    candidatos["apellido"] = [p for p in palabras if len(p) > 2 and not p.isdigit()]
+    return candidatos
+
+
+class ClienteRegistrado:
+    """Datos de un cliente del registro: id, nombre, archivo de origen y campos del formulario."""
+
+    def __init__(self, cliente_id: int, nombre: str, path: str, datos: dict):
+        self.id = cliente_id
+        self.nombre = nombre
+        self.path = path
+        self.datos = datos
+
+    def datos_plantilla(self) -> dict:
+        """Campos para completar plantillas: {nombre} aunque la ficha lo traiga como "Cliente:" o "Razón social:"."""
+        return {"nombre": self.nombre, **self.datos} if self.nombre else dict(self.datos)
+
+
+class ClientRegistry:
+    """
+    Registro de clientes en SQLite: los archivos de datos de clientes se parsean una vez (y de
+    nuevo solo si cambian) y quedan indexados por nombre, apellido, DNI, CUIT, número de
+    expediente y nombre de archivo, de modo que identificar al cliente de una consulta son unas
+    pocas búsquedas por clave sin leer ningún DOCX. Con clientes_dir=None (bundle de índices)
+    la base se abre en modo de solo lectura y no se escanea nada.
+    """
+
+    def __init__(self, clientes_dir: str, db_path: str, refresh_interval: float = None):
+        self.clientes_dir = clientes_dir
+        self.db_path = db_path
+        self.read_only = clientes_dir is None
+        self.refresh_interval = refresh_interval if refresh_interval is not None else get_env_float("CLIENT_REFRESH_SECONDS", 2.0)
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        if self.read_only:
+            self._conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            if os.path.dirname(db_path):
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS clientes ("
+                " id INTEGER PRIMARY KEY,"
+                " path TEXT NOT NULL UNIQUE,"
+                " size INTEGER NOT NULL,"
+                " mtime REAL NOT NULL,"
+                " sha256 TEXT NOT NULL,"
+                " nombre TEXT,"
+                " datos TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS claves ("
+                " tipo TEXT NOT NULL,"
+                " valor TEXT NOT NULL,"
+                " cliente_id INTEGER NOT NULL REFERENCES clientes(id) ON DELETE CASCADE,"
+                " PRIMARY KEY (tipo, valor, cliente_id))"
+            )
+            self._conn.commit()
+            self.refresh(force=True)
+
+    # --- Ingesta ---
+
+    def _scan(self) -> dict:
+        if not os.path.isdir(self.clientes_dir):
+            return {}
+        found = {}
+        for entry in os.scandir(self.clientes_dir):
+            if entry.is_file() and entry.name.lower().endswith(CLIENT_EXTENSIONS) and not entry.name.startswith("~$"):
+                st = entry.stat()
+                found[os.path.normpath(entry.path)] = (st.st_size, st.st_mtime)
+        return found
+
+    def refresh(self, force: bool = False):
+        """Ingiere los archivos nuevos o modificados y quita los eliminados (a lo sumo cada refresh_interval)."""
+        if self.read_only:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_check < self.refresh_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            found = self._scan()
+            stored = {path: (cid, size, mtime, digest) for cid, path, size, mtime, digest in
+                      self._conn.execute("SELECT id, path, size, mtime, sha256 FROM clientes")}
+            eliminados = [stored[path][0] for path in stored if path not in found]
+            cambiados = []
+            for path, (size, mtime) in found.items():
+                previo = stored.get(path)
+                if previo is not None and previo[1:3] == (size, mtime):
+                    continue
+                digest = sha256_file(path)
+                if previo is not None and previo[3] == digest:
+                    self._conn.execute("UPDATE clientes SET size = ?, mtime = ? WHERE id = ?", (size, mtime, previo[0]))
+                    continue
+                cambiados.append((path, size, mtime, digest))
+            if not (eliminados or cambiados):
+                self._conn.commit()
+                return
+            with span("client_registry_sync") as s:
+                for cid in eliminados:
+                    self._delete(cid)
+                for path, size, mtime, digest in cambiados:
+                    self._ingest(path, size, mtime, digest)
+                self._conn.commit()
+                s.add(files=len(cambiados), deleted=len(eliminados))
+            log.info(f"Registro de clientes: {len(cambiados)} archivos ingeridos, {len(eliminados)} eliminados")
+
+    def _delete(self, cid: int):
+        self._conn.execute("DELETE FROM claves WHERE cliente_id = ?", (cid,))
+        self._conn.execute("DELETE FROM clientes WHERE id = ?", (cid,))
+
+    def _ingest(self, path: str, size: int, mtime: float, digest: str):
+        from parsing import parse_document
+        texto = "\n".join(parse_document(path))
+        datos = datos_desde_lineas(texto.splitlines())
+        claves = claves_cliente(datos, texto, path)
+        nombre = next((datos[k] for campo in CAMPOS_CLAVE["nombre"] for k in datos if normalizar(k) == campo), None)
+        row = self._conn.execute("SELECT id FROM clientes WHERE path = ?", (path,)).fetchone()
+        if row:
+            self._delete(row[0])
+        # Los archivos sin datos identificatorios (escritos, contratos) se registran sin claves:
+        # no se vuelven a parsear mientras no cambien, pero nunca se eligen como cliente
+        cur = self._conn.execute(
+            "INSERT INTO clientes (path, size, mtime, sha256, nombre, datos) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, size, mtime, digest, nombre, json.dumps(datos, ensure_ascii=False)))
+        self._conn.executemany("INSERT OR IGNORE INTO claves (tipo, valor, cliente_id) VALUES (?, ?, ?)",
+                               [(tipo, valor, cur.lastrowid) for tipo, valor in claves])
+
+    def export(self, path: str):
+        """Copia la base a path (sin WAL) para abrirla en otra máquina en modo de solo lectura."""
+        self.refresh(force=True)
+        if os.path.exists(path):
+            os.remove(path)
+        destino = sqlite3.connect(path)
+        try:
+            with self._lock:
+                self._conn.backup(destino)
+            destino.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            destino.close()
+
+    # --- Consultas ---
+
+    def __len__(self):
+        self.refresh()
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT cliente_id) FROM claves").fetchone()[0]
+
+    def get(self, cliente_id: int):
+        with self._lock:
+            row = self._conn.execute("SELECT id, nombre, path, datos FROM clientes WHERE id = ?", (cliente_id,)).fetchone()
+        return ClienteRegistrado(row[0], row[1], row[2], json.loads(row[3])) if row else None
+
+    def por_path(self, path: str):
+        """Cliente registrado a partir de su archivo, o None si no está en el directorio del registro."""
+        self.refresh()
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM clientes WHERE path = ?", (os.path.normpath(path),)).fetchone()
+        return self.get(row[0]) if row else None
+
+    def _lookup(self, tipo: str, valores: list) -> set:
+        if not valores:
+            return set()
+        marcas = ",".join("?" * len(valores))
+        with self._lock:
+            rows = self._conn.execute(f"SELECT DISTINCT cliente_id FROM claves WHERE tipo = ? AND valor IN ({marcas})",
+                                      (tipo, *valores)).fetchall()
+        return {row[0] for row in rows}
+
+    def identificar(self, texto: str, explicito: bool = False):
+        """
+        (cliente | None, tipo de clave) mencionado en el texto. Se prueban las claves de la más
+        específica (CUIT, DNI, expediente) a la más ambigua (nombre, apellido); una clave que
+        coincide con varios clientes no decide y se sigue con la siguiente.
+        """
+        self.refresh()
+        candidatos = claves_consulta(texto)
+        for tipo in ORDEN_CLAVES + (("archivo",) if explicito else ()):
+            if tipo in ("nombre", "archivo"):
+                # El nombre más largo que coincida gana ("juan perez" antes que "perez")
+                for valor in candidatos[tipo]:
+                    ids = self._lookup(tipo, [valor])
+                    if len(ids) == 1:
+                        return self.get(ids.pop()), tipo
+                continue
+            ids = self._lookup(tipo, candidatos[tipo])
+            if len(ids) == 1:
+                return self.get(ids.pop()), tipo
+        return None, None
+
+    def resolver(self, query: str, cliente: str = None):
+        """
+        Cliente para una generación: el indicado explícitamente (nombre, DNI, CUIT, expediente o
+        archivo), si no el que menciona la consulta y, si tampoco, el de Datos del Cliente.docx.
+        """
+        if cliente:
+            return self.identificar(cliente, explicito=True)[0]
+        encontrado, _ = self.identificar(query)
+        if encontrado is not None:
+            return encontrado
+        ids = self._lookup("archivo", [" ".join(_palabras(os.path.splitext(CLIENTE_POR_DEFECTO)[0]))])
+        return self.get(ids.pop()) if len(ids) == 1 else None
+
+    def responder(self, query: str):
+        """
+        Respuesta directa a "datos/DNI/domicilio del cliente X" desde el registro (sin RAG), o None
+        si la consulta no identifica a un cliente o no pide campos de su ficha.
+        """
+        encontrado, tipo = self.identificar(query)
+        if encontrado is None:
+            return None
+        palabras = _palabras(query)
+        texto = f" {' '.join(palabras)} "
+        # El nombre ya va en el encabezado y el campo por el que se identificó no es lo que se pide
+        usados = set(CAMPOS_CLAVE["nombre"]) | set(CAMPOS_CLAVE.get(tipo, ()))
+        pedidos = [campo for campo in encontrado.datos
+                   if normalizar(campo) not in usados and f" {normalizar(campo).replace('_', ' ')} " in texto]
+        if not pedidos and PALABRAS_FICHA & set(palabras):
+            pedidos = list(encontrado.datos)
+        if not pedidos:
+            return None
+        lineas = [f"- {campo.replace('_', ' ')}: {encontrado.datos[campo]}" for campo in pedidos]
+        nombre = encontrado.nombre or os.path.basename(encontrado.path)
+        return f"Datos del cliente {nombre} ({os.path.basename(encontrado.path)}):\n" + "\n".join(lineas)
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_client_registry(clientes_dir: str = CLIENTES_DIR) -> ClientRegistry:
+    """
+    Registro de clientes compartido por proceso (base en CLIENT_REGISTRY_PATH). Otros directorios
+    (los de batch.py) usan una base propia al lado: refrescar uno no borra los clientes de otro.
+    """
+    db_path = get_env_var("CLIENT_REGISTRY_PATH") or os.path.join("cache", "clientes.sqlite")
+    if os.path.normpath(clientes_dir) != CLIENTES_DIR:
+        raiz, ext = os.path.splitext(db_path)
+        db_path = f"{raiz}-{hashlib.sha256(os.path.abspath(clientes_dir).encode('utf-8')).hexdigest()[:12]}{ext}"
+    with _registries_lock:
+        if (clientes_dir, db_path) not in _registries:
+            _registries[(clientes_dir, db_path)] = ClientRegistry(clientes_dir, db_path)
+        return _registries[(clientes_dir, db_path)]
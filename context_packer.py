@@ -0,0 +1,146 @@
+import re
+import math
+import threading
+from helpers import get_env_var
+from legal_index import BM25Index, reciprocal_rank_fusion
+from tracing import get_logger
+
+log = get_logger("context_packer")
+
+# Marca entre secciones no contiguas del contexto empaquetado
+GAP_MARKER = "[...]"
+# Solapamiento mínimo (en caracteres) para considerar que dos chunks comparten borde
+MIN_OVERLAP = 40
+# Los splitters usan 200 caracteres de solapamiento; se busca en una ventana algo mayor
+OVERLAP_WINDOW = 400
+
+
+class TokenCounter:
+    """
+    Cuenta tokens con el tokenizador del modelo configurado (tiktoken). Si tiktoken no está
+    instalado o no puede cargar la codificación, estima a partir de la cantidad de caracteres.
+    """
+
+    def __init__(self, model_name: str = None, chars_per_token: float = 3.0):
+        self.model_name = model_name
+        self.chars_per_token = chars_per_token
+        self.encoding = None
+        try:
+            import tiktoken
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name or "")
+            except KeyError:
+                # Modelos locales (LM Studio, llama.cpp) no están en el registro de tiktoken
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            log.warning(f"Conteo de tokens estimado por caracteres: {e}")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """Contador de tokens compartido para MODEL_NAME."""
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            _counter = TokenCounter(get_env_var("MODEL_NAME"))
+        return _counter
+
+
+def dividir_secciones(texto: str) -> list:
+    """Divide un texto en secciones por párrafos (líneas en blanco)."""
+    return [s.strip() for s in re.split(r"\n\s*\n", texto) if s.strip()]
+
+
+def _solapamiento(previo: str, texto: str) -> int:
+    # Longitud del final de previo que se repite al comienzo de texto (0 si no hay)
+    cola = previo[-OVERLAP_WINDOW:]
+    cabeza = texto[:MIN_OVERLAP]
+    if len(cabeza) < MIN_OVERLAP:
+        return 0
+    pos = cola.find(cabeza)
+    while pos != -1:
+        if texto.startswith(cola[pos:]):
+            return len(cola) - pos
+        pos = cola.find(cabeza, pos + 1)
+    return 0
+
+
+def recortar_solapamiento(previo: str, texto: str) -> str:
+    """
+    Quita de texto lo que ya está en previo: el solapamiento que dejan los splitters entre
+    chunks consecutivos, en cualquiera de los dos órdenes. Devuelve "" si texto está contenido en previo.
+    """
+    if texto in previo:
+        return ""
+    n = _solapamiento(previo, texto)
+    if n:
+        return texto[n:].lstrip()
+    n = _solapamiento(texto, previo)
+    if n:
+        return texto[:-n].rstrip()
+    return texto
+
+
+def unir_chunks(chunks: list) -> str:
+    """Reconstruye el texto continuo de chunks consecutivos quitando el solapamiento del splitter."""
+    texto = ""
+    for chunk in chunks:
+        texto = texto + "\n" + recortar_solapamiento(texto, chunk) if texto else chunk
+    return texto
+
+
+def pack(query: str, textos: list, budget: int, counter: TokenCounter = None, grupos: list = None) -> list:
+    """
+    Elige qué textos entran en un presupuesto de tokens. Se rankean por BM25 contra la consulta
+    (el orden original desempata y suma relevancia), se descartan los contenidos en otro ya
+    elegido y se recorta el solapamiento con los elegidos del mismo grupo antes de contar tokens.
+    Devuelve [(índice, texto)] en el orden original.
+    grupos: clave por texto (p. ej. la fuente) para comparar solo chunks del mismo documento.
+    """
+    counter = counter or get_token_counter()
+    grupos = grupos or [None] * len(textos)
+    bm25 = BM25Index()
+    for i, texto in enumerate(textos):
+        bm25.add(texto, i)
+    por_relevancia = [i for i, score in bm25.search(query, len(textos)) if score > 0]
+    orden = reciprocal_rank_fusion([por_relevancia, list(range(len(textos)))])
+    elegidos = {}
+    usado = 0
+    for i in orden:
+        texto = textos[i]
+        for j in elegidos:
+            if grupos[j] == grupos[i] and texto:
+                texto = recortar_solapamiento(textos[j], texto)
+        if not texto:
+            continue
+        costo = counter.count(texto) + 1
+        if usado + costo <= budget:
+            elegidos[i] = texto
+            usado += costo
+    return sorted(elegidos.items())
+
+
+def pack_text(query: str, secciones: list, budget: int, counter: TokenCounter = None) -> str:
+    """Une las secciones elegidas marcando con GAP_MARKER los huecos de lo que quedó afuera."""
+    partes = []
+    ultimo = -1
+    # Las secciones de un mismo texto no se solapan: cada una es su propio grupo
+    for i, texto in pack(query, secciones, budget, counter, grupos=list(range(len(secciones)))):
+        if i != ultimo + 1:
+            partes.append(GAP_MARKER)
+        partes.append(texto)
+        ultimo = i
+    if secciones and ultimo != len(secciones) - 1:
+        partes.append(GAP_MARKER)
+    return "\n\n".join(partes)
+
@@ -0,0 +1,227 @@
+import os
+import re
+import json
+import hashlib
+import numpy as np
+from legal_index import ley_from_source, normalizar
+from tracing import get_logger
+
+DEDUP_DIRNAME = "dedup"
+# Primo apenas mayor que 2**32 para el hashing universal de MinHash (a*x + b no desborda uint64)
+_PRIME = 4294967311
+# Palabras por shingle
+SHINGLE_SIZE = 5
+# Separador de listas en metadata (Chroma solo admite valores escalares)
+SEP = "|"
+
+log = get_logger("dedup")
+
+
+def texto_normalizado(texto: str) -> list:
+    return re.findall(r"\w+", normalizar(texto))
+
+
+def content_hash(texto: str, palabras: list = None) -> str:
+    """Hash del texto sin diferencias de mayúsculas, acentos, puntuación ni espacios."""
+    palabras = texto_normalizado(texto) if palabras is None else palabras
+    return hashlib.sha1(" ".join(palabras).encode("utf-8")).hexdigest()
+
+
+def _bandas(num_perm: int, threshold: float) -> tuple:
+    """
+    (bandas, filas) de LSH con el umbral aproximado (1/b)^(1/r) más alto que no supera al pedido:
+    se prefiere traer candidatos de más (se verifican con la firma completa) a perder duplicados.
+    """
+    opciones = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    umbral = lambda br: (1 / br[0]) ** (1 / br[1])
+    debajo = [br for br in opciones if umbral(br) <= threshold]
+    return max(debajo, key=umbral) if debajo else min(opciones, key=umbral)
+
+
+def agregar_fuente(meta: dict, duplicado: dict) -> dict:
+    """
+    Metadata del chunk conservado con el puntero al duplicado descartado: fuentes (todas las
+    rutas que contienen el texto) y duplicados ("ley:artículo" de las otras ediciones, para que
+    las citas exactas las sigan resolviendo).
+    """
+    meta = dict(meta)
+    fuentes = [f for f in (meta.get("fuentes") or meta.get("source", "")).split(SEP) if f]
+    if duplicado.get("source") and duplicado["source"] not in fuentes:
+        fuentes.append(duplicado["source"])
+    meta["fuentes"] = SEP.join(fuentes)
+    if duplicado.get("ley") and duplicado.get("articulo"):
+        alias = f"{duplicado['ley']}:{duplicado['articulo']}"
+        propios = f"{meta.get('ley')}:{meta.get('articulo')}"
+        duplicados = [d for d in (meta.get("duplicados") or "").split(SEP) if d]
+        if alias != propios and alias not in duplicados:
+            duplicados.append(alias)
+            meta["duplicados"] = SEP.join(duplicados)
+    return meta
+
+
+def quitar_fuente(meta: dict, source: str) -> dict:
+    """
+    Metadata del chunk conservado cuando se elimina uno de los archivos que lo contenían:
+    si era el original, una de las otras fuentes (y su ley y artículo) pasa a ocupar su lugar.
+    """
+    meta = dict(meta)
+    fuentes = [f for f in (meta.get("fuentes") or meta.get("source", "")).split(SEP) if f and f != source]
+    meta["fuentes"] = SEP.join(fuentes)
+    if meta.get("source") == source and fuentes:
+        meta["source"] = fuentes[0]
+    ley = ley_from_source(source)
+    duplicados = [d for d in (meta.get("duplicados") or "").split(SEP) if d and not d.startswith(f"{ley}:")]
+    if meta.get("ley") == ley and duplicados:
+        meta["ley"], _, meta["articulo"] = duplicados.pop(0).rpartition(":")
+    if "duplicados" in meta:
+        meta["duplicados"] = SEP.join(duplicados)
+    return meta
+
+
+class ChunkDeduplicator:
+    """
+    Índice de los chunks ya almacenados en una colección para descartar, antes de embeber,
+    los duplicados exactos (hash del texto normalizado) y los casi duplicados (similitud de
+    Jaccard estimada con MinHash, candidatos por LSH) a partir de threshold.
+    Se guarda en <colección>/dedup/ junto al manifiesto.
+    """
+
+    def __init__(self, persist_dir: str, threshold: float = 0.9, num_perm: int = 64):
+        self.dir = os.path.join(persist_dir, DEDUP_DIRNAME)
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = _bandas(num_perm, threshold)
+        rng = np.random.default_rng(1)
+        self._a = rng.integers(1, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+        self.stats = {"exactos": 0, "similares": 0, "embeddings_ahorrados": 0, "bytes_ahorrados": 0}
+        self.reset()
+        self.loaded = self.load()
+
+    def reset(self):
+        self.ids = []
+        self.hashes = []
+        self.claves = []  # número de artículo de cada chunk ("" si no es un artículo)
+        self.signatures = []
+        self._by_hash = {}  # hash -> índices de los chunks con ese texto (uno por número de artículo)
+        self._buckets = {}
+        self._removed = set()
+        self.dirty = True
+
+    def stored_ids(self) -> set:
+        return set(self.ids) - self._removed
+
+    # --- Persistencia ---
+
+    def load(self) -> bool:
+        try:
+            with open(os.path.join(self.dir, "index.json"), "r", encoding="utf-8") as f:
+                info = json.load(f)
+            signatures = np.load(os.path.join(self.dir, "signatures.npy"))
+        except (OSError, ValueError):
+            return False
+        if info.get("num_perm") != self.num_perm or "claves" not in info or len(signatures) != len(info["ids"]):
+            log.info(f"{self.dir}: índice de duplicados con otra configuración, se reconstruye")
+            return False
+        self.stats.update(info.get("stats", {}))
+        for cid, digest, clave, signature in zip(info["ids"], info["hashes"], info["claves"], signatures):
+            self._index(cid, digest, signature, clave)
+        self.dirty = False
+        return True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        # Un id borrado y vuelto a agregar aparece dos veces: vale la última entrada
+        ultimo = {cid: i for i, cid in enumerate(self.ids) if cid not in self._removed}
+        vivos = sorted(ultimo.values())
+        signatures = (np.stack([self.signatures[i] for i in vivos]) if vivos
+                      else np.zeros((0, self.num_perm), dtype=np.uint64))
+        with open(os.path.join(self.dir, "signatures.npy.tmp"), "wb") as f:
+            np.save(f, signatures)
+        with open(os.path.join(self.dir, "index.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump({"num_perm": self.num_perm, "ids": [self.ids[i] for i in vivos],
+                       "hashes": [self.hashes[i] for i in vivos], "claves": [self.claves[i] for i in vivos],
+                       "stats": self.stats}, f)
+        os.replace(os.path.join(self.dir, "signatures.npy.tmp"), os.path.join(self.dir, "signatures.npy"))
+        os.replace(os.path.join(self.dir, "index.json.tmp"), os.path.join(self.dir, "index.json"))
+        self.dirty = False
+
+    def rebuild(self, ids: list, texts: list, metadatas: list):
+        """Índice a partir de lo que ya tiene la colección (primera vez o cambio de configuración)."""
+        for cid, text, meta in zip(ids, texts, metadatas):
+            self._index(cid, content_hash(text), self.signature(text), str((meta or {}).get("articulo", "")))
+
+    # --- MinHash / LSH ---
+
+    def signature(self, texto: str, palabras: list = None) -> np.ndarray:
+        palabras = texto_normalizado(texto) if palabras is None else palabras
+        n = max(len(palabras) - SHINGLE_SIZE + 1, 1)
+        shingles = {" ".join(palabras[i:i + SHINGLE_SIZE]) for i in range(n)}
+        x = np.fromiter((int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                         for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((self._a * x + self._b) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> list:
+        return [(b, signature[b * self.rows:(b + 1) * self.rows].tobytes()) for b in range(self.bands)]
+
+    def _index(self, cid: str, digest: str, signature: np.ndarray, clave: str = ""):
+        i = len(self.ids)
+        self.ids.append(cid)
+        self.hashes.append(digest)
+        self.claves.append(clave)
+        self.signatures.append(signature)
+        self._by_hash.setdefault(digest, []).append(i)
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(i)
+
+    def find(self, texto: str, clave: str = ""):
+        """
+        Id del chunk almacenado del que texto es duplicado (o None) y los datos para
+        registrarlo con add() si no lo es: (id | None, tipo, hash, firma).
+        Un duplicado (exacto o casi) con otro número de artículo (clave) no cuenta: artículos
+        distintos con el mismo texto ("Derogado.") o uno parecido se conservan.
+        """
+        palabras = texto_normalizado(texto)
+        digest = content_hash(texto, palabras)
+        for i in self._by_hash.get(digest, ()):
+            if self._compatible(i, clave):
+                return self.ids[i], "exacto", digest, None
+        signature = self.signature(texto, palabras)
+        candidatos = {j for key in self._band_keys(signature) for j in self._buckets.get(key, ())}
+        mejor, mejor_sim = None, self.threshold
+        for j in candidatos:
+            if not self._compatible(j, clave):
+                continue
+            sim = float(np.mean(self.signatures[j] == signature))
+            if sim >= mejor_sim:
+                mejor, mejor_sim = j, sim
+        if mejor is not None:
+            return self.ids[mejor], "similar", digest, signature
+        return None, None, digest, signature
+
+    def _compatible(self, i: int, clave: str) -> bool:
+        return self.ids[i] not in self._removed and not (clave and self.claves[i] and clave != self.claves[i])
+
+    def add(self, cid: str, digest: str, signature: np.ndarray, clave: str = ""):
+        self._removed.discard(cid)
+        self._index(cid, digest, signature, clave)
+        self.dirty = True
+
+    def count_saved(self, tipo: str, texto: str):
+        self.stats["exactos" if tipo == "exacto" else "similares"] += 1
+        self.stats["embeddings_ahorrados"] += 1
+        self.stats["bytes_ahorrados"] += len(texto.encode("utf-8"))
+        self.dirty = True
+
+    def remove(self, ids):
+        self._removed.update(ids)
+        self.dirty = True
+        # Los hashes exactos que apuntaban a chunks borrados quedan libres para el próximo
+        for digest in list(self._by_hash):
+            vivos = [i for i in self._by_hash[digest] if self.ids[i] not in self._removed]
+            if vivos:
+                self._by_hash[digest] = vivos
+            else:
+                del self._by_hash[digest]
@@ -0,0 +1,108 @@
+import os
+import re
+import hashlib
+from datetime import datetime
+from docx import Document
+from legal_index import tokenize
+from utils import PLACEHOLDER_PATTERN, normalizar_campo
+
+OUTPUT_DIR = "docs_outputs"
+
+# Verbos que indican que se pide el documento completo y no una consulta sobre la plantilla
+VERBOS_GENERACION = {
+    "genera", "generar", "generame", "completa", "completar", "completame", "rellena", "rellenar",
+    "redacta", "redactar", "redactame", "prepara", "preparar", "confecciona", "confeccionar", "arma", "armar",
+}
+
+
+def es_pedido_de_generacion(query: str) -> bool:
+    return any(token in VERBOS_GENERACION for token in tokenize(query))
+
+
+def _nombre_seguro(texto: str) -> str:
+    return re.sub(r"[^\w\-]+", "_", texto).strip("_")
+
+
+def ruta_salida(plantilla_name: str, ext: str, output_dir: str = OUTPUT_DIR, sufijo: str = None) -> str:
+    """Ruta única en output_dir para un documento generado a partir de la plantilla."""
+    os.makedirs(output_dir, exist_ok=True)
+    safe_name = _nombre_seguro(os.path.splitext(plantilla_name)[0]) or "plantilla"
+    if sufijo:
+        safe_name = f"{safe_name}_{_nombre_seguro(sufijo)}"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    n = 0
+    while True:
+        path = os.path.join(output_dir, f"{safe_name}_{timestamp}{f'_{n}' if n else ''}{ext}")
+        try:
+            # Reservar el nombre de forma atómica: dos generaciones simultáneas no colisionan
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            n += 1
+
+
+def ruta_lote(plantilla_name: str, cliente_path: str, ext: str, output_dir: str) -> str:
+    """
+    Ruta determinista de un documento generado en lote: la misma plantilla y el mismo archivo
+    de cliente dan siempre el mismo nombre (para reanudar) y el hash de la ruta del cliente
+    evita que dos clientes con nombres parecidos se pisen.
+    """
+    plantilla = _nombre_seguro(os.path.splitext(plantilla_name)[0]) or "plantilla"
+    cliente = _nombre_seguro(os.path.splitext(os.path.basename(cliente_path))[0]) or "cliente"
+    digest = hashlib.sha256(os.path.abspath(cliente_path).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(output_dir, f"{plantilla}__{cliente}_{digest}{ext}")
+
+
+def _iter_paragraphs(container):
+    """Párrafos de un documento/celda/encabezado, incluyendo tablas anidadas."""
+    for paragraph in container.paragraphs:
+        yield paragraph
+    for table in getattr(container, "tables", []):
+        for row in table.rows:
+            for cell in row.cells:
+                yield from _iter_paragraphs(cell)
+
+
+def _iter_all_paragraphs(document):
+    yield from _iter_paragraphs(document)
+    for section in document.sections:
+        for part in (section.header, section.footer, section.first_page_header,
+                     section.first_page_footer, section.even_page_header, section.even_page_footer):
+            if not part.is_linked_to_previous:
+                yield from _iter_paragraphs(part)
+
+
+def rellenar_parrafo(paragraph, datos: dict) -> int:
+    """
+    Reemplaza los placeholders del párrafo preservando los runs: el valor toma el formato
+    del run donde empieza el placeholder, aunque Word lo haya partido en varios runs.
+    Devuelve la cantidad de reemplazos.
+    """
+    runs = paragraph.runs
+    full = "".join(run.text for run in runs)
+    if "{" not in full:
+        return 0
+    matches = [m for m in PLACEHOLDER_PATTERN.finditer(full) if normalizar_campo(m.group(1)) in datos]
+    # De atrás hacia adelante para que los offsets de los placeholders previos sigan siendo válidos
+    for match in reversed(matches):
+        valor = str(datos[normalizar_campo(match.group(1))])
+        start, end = match.start(), match.end()
+        pos = 0
+        for run in runs:
+            run_start, run_end = pos, pos + len(run.text)
+            pos = run_end
+            if run_end <= start or run_start >= end:
+                continue
+            text = run.text
+            before = text[:max(start - run_start, 0)] if run_start <= start else ""
+            after = text[end - run_start:] if run_end >= end else ""
+            run.text = before + (valor if run_start <= start < run_end else "") + after
+    return len(matches)
+
+
+def rellenar_docx(plantilla_path: str, datos: dict, output_path: str) -> int:
+    """Completa la plantilla DOCX con los datos (cuerpo, tablas, encabezados y pies) y la guarda."""
+    document = Document(plantilla_path)
+    reemplazos = sum(rellenar_parrafo(p, datos) for p in _iter_all_paragraphs(document))
+    document.save(output_path)
+    return reemplazos
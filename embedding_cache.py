@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+from array import array
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache persistente de embeddings en SQLite, con clave (modelo, sha256(texto)).
+    Los vectores se guardan como blobs float32 compactos. Al superar max_entries se
+    desalojan las entradas usadas hace más tiempo (LRU).
+    """
+
+    def __init__(self, path: str, max_entries: int = 500_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: list) -> dict:
+        """Devuelve {hash: vector} para los hashes presentes y actualiza su uso."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        now = time.time()
+        with self._lock:
+            # SQLite limita la cantidad de parámetros por consulta: consultar por tramos
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({marks})",
+                    [model, *chunk]
+                ).fetchall()
+                for h, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[h] = vec.tolist()
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found]
+                )
+                self._conn.commit()
+            self.hits += sum(1 for h in hashes if h in found)
+            self.misses += sum(1 for h in hashes if h not in found)
+        return found
+
+    def put_many(self, model: str, items: dict):
+        """Guarda {hash: vector} y aplica el límite de tamaño."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(model, h, len(vec), array("f", vec).tobytes(), now) for h, vec in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Desalojar hasta el 90% del límite para no pagar la eviction en cada inserción
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        self.evictions += excess
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hit_rate, 3),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,189 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from helpers import get_env_var, get_env_int, get_env_float
+from embedding_cache import EmbeddingCache, text_hash
+from tracing import get_logger, span
+
+log = get_logger("embeddings")
+
+# Códigos HTTP que justifican reintentar el lote (servidor saturado o error transitorio)
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class EmbeddingStats:
+    """Contadores de throughput del cliente de embeddings (seguros entre hilos)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.texts = 0
+        self.batches = 0
+        self.retries = 0
+        self.seconds = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def batch_started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def batch_finished(self, n_texts: int):
+        with self._lock:
+            self.in_flight -= 1
+            self.batches += 1
+            self.texts += n_texts
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def add_time(self, seconds: float):
+        with self._lock:
+            self.seconds += seconds
+
+    @property
+    def texts_per_second(self) -> float:
+        return self.texts / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "texts": self.texts,
+                "batches": self.batches,
+                "retries": self.retries,
+                "seconds": round(self.seconds, 3),
+                "texts_per_second": round(self.texts_per_second, 2),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Cache de embeddings compartido por proceso (None si EMBEDDING_CACHE=0)."""
+    if (get_env_var("EMBEDDING_CACHE") or "1").lower() in ("0", "false", "no"):
+        return None
+    path = get_env_var("EMBEDDING_CACHE_PATH") or os.path.join("cache", "embeddings.sqlite")
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = EmbeddingCache(path, max_entries=get_env_int("EMBEDDING_CACHE_MAX_ENTRIES", 500_000))
+        return _caches[path]
+
+
+# Wrapper manual para embeddings LM Studio
+class LMStudioEmbeddings:
+    """
+    Cliente de embeddings para servidores compatibles con OpenAI (/embeddings).
+    Divide la entrada en lotes por cantidad y por caracteres, los envía en paralelo
+    sobre una sesión HTTP compartida, reintenta cada lote con backoff y devuelve los
+    vectores en el mismo orden que los textos. Antes de llamar al servidor consulta el
+    cache persistente de embeddings (use_cache=False lo desactiva).
+    """
+
+    def __init__(self, api_base, model_name, batch_size: int = None, max_batch_chars: int = None,
+                 max_workers: int = None, max_retries: int = None, timeout: float = None,
+                 use_cache: bool = True, cache: EmbeddingCache = None):
+        self.url = f"{api_base}/embeddings"
+        self.model = model_name
+        self.batch_size = batch_size or get_env_int("EMBEDDING_BATCH_SIZE", 64)
+        self.max_batch_chars = max_batch_chars or get_env_int("EMBEDDING_BATCH_CHARS", 32000)
+        self.max_workers = max_workers or get_env_int("EMBEDDING_WORKERS", 4)
+        self.max_retries = max_retries if max_retries is not None else get_env_int("EMBEDDING_MAX_RETRIES", 3)
+        self.timeout = timeout or get_env_float("EMBEDDING_TIMEOUT", 60.0)
+        self.stats = EmbeddingStats()
+        self.cache = cache if cache is not None else (get_embedding_cache() if use_cache else None)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def _make_batches(self, texts: list) -> list:
+        """Agrupa textos consecutivos respetando batch_size y max_batch_chars. Devuelve (inicio, lote)."""
+        batches = []
+        start, current, chars = 0, [], 0
+        for i, text in enumerate(texts):
+            if current and (len(current) >= self.batch_size or chars + len(text) > self.max_batch_chars):
+                batches.append((start, current))
+                start, current, chars = i, [], 0
+            current.append(text)
+            chars += len(text)
+        if current:
+            batches.append((start, current))
+        return batches
+
+    def _post_batch(self, texts: list) -> list:
+        payload = {"model": self.model, "input": texts}
+        self.stats.batch_started()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == self.max_retries:
+                        raise Exception(f"Embeddings error: {e}") from e
+                else:
+                    if response.status_code == 200:
+                        data = response.json()["data"]
+                        # El servidor puede devolver los items desordenados: ordenar por índice
+                        data = sorted(data, key=lambda item: item.get("index", 0))
+                        return [item["embedding"] for item in data]
+                    if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                        raise Exception(f"Embeddings error: {response.status_code} - {response.text}")
+                self.stats.add_retry()
+                time.sleep(min(0.5 * 2 ** attempt, 8.0) + random.uniform(0, 0.25))
+        finally:
+            self.stats.batch_finished(len(texts))
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        texts = list(texts)
+        with span("embed") as s:
+            s.add(texts=len(texts), chars=sum(len(t) for t in texts))
+            if self.cache is None:
+                return self._embed_uncached(texts)
+            hashes = [text_hash(t) for t in texts]
+            cached = self.cache.get_many(self.model, hashes)
+            # Textos repetidos dentro de la misma llamada se embeben una sola vez
+            pending = {}
+            for h, t in zip(hashes, texts):
+                if h not in cached and h not in pending:
+                    pending[h] = t
+            s.add(cache_hits=len(texts) - len(pending))
+            if pending:
+                fresh = dict(zip(pending, self._embed_uncached(list(pending.values()))))
+                self.cache.put_many(self.model, fresh)
+                cached.update(fresh)
+            return [cached[h] for h in hashes]
+
+    def _embed_uncached(self, texts: list) -> list:
+        t0 = time.perf_counter()
+        batches = self._make_batches(texts)
+        if len(batches) == 1:
+            results = [self._post_batch(batches[0][1])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+                # map preserva el orden de los lotes: el ensamblado final respeta el orden de entrada
+                results = list(pool.map(lambda b: self._post_batch(b[1]), batches))
+        elapsed = time.perf_counter() - t0
+        self.stats.add_time(elapsed)
+        vectors = [vec for batch in results for vec in batch]
+        if len(vectors) != len(texts):
+            raise Exception(f"Embeddings error: se esperaban {len(texts)} vectores y se recibieron {len(vectors)}")
+        if len(batches) > 1:
+            log.info(f"Embeddings: {len(texts)} textos en {len(batches)} lotes, "
+                     f"{len(texts) / elapsed if elapsed else 0:.1f} textos/s, "
+                     f"máx. {self.stats.max_in_flight} lotes en vuelo")
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
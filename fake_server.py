@@ -0,0 +1,264 @@
+import re
+import json
+import time
+import math
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from legal_index import tokenize
+
+
+def fake_embedding(text: str, dim: int = 64) -> list:
+    """
+    Embedding determinista por hashing de tokens: textos con palabras en común quedan cerca,
+    así la búsqueda vectorial se comporta de forma razonable sin un modelo real.
+    """
+    vec = [0.0] * dim
+    for token in tokenize(text):
+        h = int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[:4], "little")
+        vec[h % dim] += 1.0 if h & (1 << 31) else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def fake_answer(prompt: str) -> str:
+    """Respuesta según el tipo de prompt: pasos ReAct para el agente, texto breve para el resto."""
+    if "Action Input" in prompt and "Question:" in prompt:
+        # Las instrucciones de formato ya mencionan "Observation:"; solo cuenta la que sigue a la pregunta
+        scratchpad = prompt.rsplit("Question:", 1)[1]
+        if "Observation:" in scratchpad:
+            return " Ya tengo la información necesaria.\nFinal Answer: Según la documentación consultada, la respuesta es la indicada."
+        question = scratchpad.split("\n", 1)[0]
+        tool = "Buscar en legislación y códigos"
+        if re.search(r"plantilla|contrato|escrito|gener", question, re.IGNORECASE):
+            tool = "Consultar/generar plantilla"
+        elif re.search(r"cliente|expediente", question, re.IGNORECASE):
+            tool = "Buscar en clientes"
+        return f" Debo consultar la herramienta adecuada.\nAction: {tool}\nAction Input: {question.strip()}"
+    return "Según el contexto, el artículo citado establece el plazo y los requisitos aplicables al caso."
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """
+    Servidor local compatible con OpenAI para pruebas y benchmarks sin LM Studio:
+    /v1/completions, /v1/chat/completions (con y sin streaming) y /v1/embeddings. También
+    simula el cache de contexto de Gemini (/v1beta/cachedContents y :generateContent):
+    cached_contents guarda nombre -> vencimiento (epoch) y un cache vencido deja de existir.
+    latency: segundos hasta el primer token; tokens_per_second: velocidad de generación
+    (se simula un token cada 4 caracteres); embedding_latency: segundos por solicitud más
+    embedding_latency_per_text por cada texto del lote.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.05, tokens_per_second: float = 200.0,
+                 embedding_latency: float = 0.01, embedding_latency_per_text: float = 0.0005, dim: int = 64):
+        super().__init__(address, FakeLLMHandler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.embedding_latency = embedding_latency
+        self.embedding_latency_per_text = embedding_latency_per_text
+        self.dim = dim
+        self._lock = threading.Lock()
+        self.counters = {"completions": 0, "embedding_requests": 0, "embedded_texts": 0, "prompt_chars": 0,
+                         "cache_creates": 0, "cache_gets": 0, "cache_ttl_updates": 0, "cache_deletes": 0}
+        self.cached_contents = {}
+
+    def count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.counters[key] += value
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def gemini_url(self) -> str:
+        return self.base_url + "beta"
+
+
+def _rfc3339(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+# Rutas del cache de contexto de Gemini: "/v1beta/cachedContents" y "/v1beta/cachedContents/<id>"
+CACHED_CONTENT_PATH = re.compile(r"/cachedContents(?:/([\w-]+))?$")
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if CACHED_CONTENT_PATH.search(urlparse(self.path).path):
+            self._cached_content("GET")
+        elif self.path.rstrip("/").endswith("/models"):
+            self._send_json({"object": "list", "data": [{"id": "fake", "object": "model"}]})
+        else:
+            self._send_json(self.server.counters)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = urlparse(self.path).path
+        if CACHED_CONTENT_PATH.search(path):
+            self._cached_content("POST", body)
+        elif path.endswith(":generateContent"):
+            self._generate_content(body)
+        elif self.path.endswith("/embeddings"):
+            self._embeddings(body)
+        elif self.path.endswith("/chat/completions"):
+            self._completion(body, chat=True)
+        elif self.path.endswith("/completions"):
+            self._completion(body, chat=False)
+        else:
+            self._send_json({"error": "Ruta no encontrada"}, 404)
+
+    def do_PATCH(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self._cached_content("PATCH", body)
+
+    def do_DELETE(self):
+        self._cached_content("DELETE")
+
+    def _cached_content(self, method: str, body: dict = None):
+        match = CACHED_CONTENT_PATH.search(urlparse(self.path).path)
+        if not match:
+            self._send_json({"error": "Ruta no encontrada"}, 404)
+            return
+        server = self.server
+        now = time.time()
+        ttl = float(str((body or {}).get("ttl", "3600s")).rstrip("s"))
+        with server._lock:
+            for name in [n for n, expire in server.cached_contents.items() if expire <= now]:
+                del server.cached_contents[name]
+            if method == "POST":
+                server.counters["cache_creates"] += 1
+                name = f"cachedContents/fake-{server.counters['cache_creates']}"
+                server.cached_contents[name] = now + ttl
+            else:
+                name = f"cachedContents/{match.group(1)}"
+                if name not in server.cached_contents:
+                    self._send_json({"error": {"code": 404, "message": f"{name} no existe"}}, 404)
+                    return
+                if method == "GET":
+                    server.counters["cache_gets"] += 1
+                elif method == "PATCH":
+                    server.counters["cache_ttl_updates"] += 1
+                    server.cached_contents[name] = now + ttl
+                elif method == "DELETE":
+                    server.counters["cache_deletes"] += 1
+                    del server.cached_contents[name]
+                    self._send_json({})
+                    return
+            expire = server.cached_contents[name]
+        self._send_json({"name": name, "model": (body or {}).get("model", "models/fake"),
+                         "expireTime": _rfc3339(expire)})
+
+    def _generate_content(self, body: dict):
+        with self.server._lock:
+            vigente = self.server.cached_contents.get(body.get("cachedContent"), 0) > time.time()
+        if not vigente:
+            self._send_json({"error": {"code": 403, "message": "CachedContent no encontrado"}}, 403)
+            return
+        prompt = "\n".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+        self.server.count(completions=1, prompt_chars=len(prompt))
+        time.sleep(self.server.latency)
+        self._send_json({"candidates": [{"content": {"role": "model", "parts": [{"text": fake_answer(prompt)}]}}]})
+
+    def _embeddings(self, body: dict):
+        texts = body.get("input") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        self.server.count(embedding_requests=1, embedded_texts=len(texts))
+        time.sleep(self.server.embedding_latency + self.server.embedding_latency_per_text * len(texts))
+        self._send_json({
+            "object": "list",
+            "model": body.get("model", "fake"),
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(t, self.server.dim)}
+                     for i, t in enumerate(texts)],
+        })
+
+    def _completion(self, body: dict, chat: bool):
+        if chat:
+            prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        else:
+            prompt = body.get("prompt", "")
+            if isinstance(prompt, list):
+                prompt = prompt[0] if prompt else ""
+        self.server.count(completions=1, prompt_chars=len(prompt))
+        text = fake_answer(prompt)
+        pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+        delay = 1.0 / self.server.tokens_per_second if self.server.tokens_per_second > 0 else 0.0
+        time.sleep(self.server.latency)
+
+        def choice(piece, finish):
+            if chat:
+                key = "delta" if body.get("stream") else "message"
+                return {"index": 0, key: {"role": "assistant", "content": piece}, "finish_reason": finish}
+            return {"index": 0, "text": piece, "logprobs": None, "finish_reason": finish}
+
+        kind = "chat.completion" if chat else "text_completion"
+        if not body.get("stream"):
+            time.sleep(delay * len(pieces))
+            self._send_json({
+                "id": "fake", "object": kind, "model": body.get("model", "fake"),
+                "choices": [choice(text, "stop")],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(pieces),
+                          "total_tokens": len(prompt) // 4 + len(pieces)},
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, piece in enumerate(pieces):
+            time.sleep(delay)
+            event = {"id": "fake", "object": f"{kind}.chunk" if chat else kind, "model": body.get("model", "fake"),
+                     "choices": [choice(piece, "stop" if i == len(pieces) - 1 else None)]}
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start_fake_server(host: str = "127.0.0.1", port: int = 0, **config) -> FakeLLMServer:
+    """Arranca el servidor en un hilo de fondo (port=0 elige un puerto libre)."""
+    server = FakeLLMServer((host, port), **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local compatible con OpenAI para pruebas sin LM Studio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="segundos hasta el primer token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    args = parser.parse_args()
+    server = FakeLLMServer((args.host, args.port), latency=args.latency, tokens_per_second=args.tokens_per_second,
+                           embedding_latency=args.embedding_latency)
+    print(f"Servidor simulado en {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
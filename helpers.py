@@ -1,6 +1,31 @@
 import os
+import logging
 from dotenv import load_dotenv
 
+log = logging.getLogger("legisbot.helpers")
+
+_dotenv_loaded = False
+
 def get_env_var(key: str) -> str:
-    load_dotenv()
+    # .env se lee una sola vez por proceso (no en cada consulta de configuración)
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        load_dotenv()
+        _dotenv_loaded = True
     return os.getenv(key)
+
+def get_env_int(key: str, default: int) -> int:
+    value = get_env_var(key)
+    try:
+        return int(value) if value not in (None, "") else default
+    except ValueError:
+        log.warning(f"{key}={value!r} no es un entero, se usa {default}")
+        return default
+
+def get_env_float(key: str, default: float) -> float:
+    value = get_env_var(key)
+    try:
+        return float(value) if value not in (None, "") else default
+    except ValueError:
+        log.warning(f"{key}={value!r} no es un número, se usa {default}")
+        return default
@@ -0,0 +1,239 @@
+import os
+import re
+import math
+import unicodedata
+from collections import Counter, defaultdict
+
+# Número de artículo, con separador de miles opcional: "14", "1897", "1.897"
+NUMERO_ARTICULO = r"\d{1,3}(?:\.\d{3})+(?!\d)|\d+"
+# Sufijo de artículo intercalado: "22 bis", "14 ter"
+SUFIJO_ARTICULO = r"(?i:bis|ter|quater|quinquies|sexies)"
+_NUMERO_CITA = rf"(?:{NUMERO_ARTICULO})(?:\s*[º°]?\s*{SUFIJO_ARTICULO}\b)?"
+# Cita de artículo(s) dentro de una consulta: "art. 14", "artículo 1.897", "art. 22 bis", "arts. 14, 15 y 16"
+CITA_PATTERN = re.compile(
+    rf"\bart(?:[ií]culos?|s)?\.?\s*(?:n(?:ros?|[º°o]s?)\.?\s*)?"
+    rf"({_NUMERO_CITA}(?:\s*(?:,|\by\b|\be\b|\bo\b)\s*{_NUMERO_CITA})*)",
+    re.IGNORECASE,
+)
+_NUMERO_SUFIJO = re.compile(rf"({NUMERO_ARTICULO})(?:\s*[º°]?\s*({SUFIJO_ARTICULO})\b)?")
+
+STOPWORDS = {
+    "a", "al", "ante", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los", "o", "para",
+    "por", "que", "qué", "se", "segun", "según", "su", "sus", "un", "una", "y", "dice", "cual", "como",
+}
+
+# Palabras que no identifican a una ley concreta al comparar nombres de archivo con la consulta
+LEY_GENERIC_TOKENS = {"codigo", "ley", "texto", "ordenado", "nacion", "argentina", "republica", "de", "la", "y"}
+
+# Palabras de un nombre de archivo que distinguen ediciones o copias de una misma ley, no leyes distintas
+EDICION_TOKENS = {"edicion", "ed", "version", "v", "actualizado", "actualizada", "vigente", "copia", "copy",
+                  "nuevo", "nueva", "anotado", "anotada", "comentado", "comentada", "final", "ultima"}
+# Años y números cortos ("(1)", "v2") de un nombre de archivo; los números de ley (20744) se conservan
+EDICION_NUMERO = re.compile(r"(?:1[89]|20)\d{2}|v?\d{1,2}")
+
+# Siglas habituales en las consultas y las palabras del nombre de archivo a las que equivalen
+LEY_ALIASES = {
+    "cpc": "procesal civil",
+    "cpcc": "procesal civil comercial",
+    "cpp": "procesal penal",
+    "ccyc": "civil comercial",
+    "ccc": "civil comercial",
+    "cc": "civil",
+    "cp": "penal",
+    "cn": "constitucion nacional",
+    "lct": "contrato trabajo",
+}
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin acentos, para comparar nombres y consultas."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def tokenize(texto: str) -> list:
+    return [t for t in re.findall(r"\w+", normalizar(texto)) if t not in STOPWORDS and len(t) > 1]
+
+
+def numero_articulo(numero: str, sufijo: str = None) -> str:
+    """Número de artículo normalizado: sin separador de miles y con el sufijo en minúsculas ("22 bis")."""
+    numero = numero.replace(".", "")
+    return f"{numero} {sufijo.lower()}" if sufijo else numero
+
+
+def citas_articulos(query: str) -> list:
+    """Números de artículo citados en la consulta, normalizados y sin repetir: ["1897", "22 bis"]."""
+    numeros = []
+    for match in CITA_PATTERN.finditer(query):
+        for numero, sufijo in _NUMERO_SUFIJO.findall(match.group(1)):
+            numero = numero_articulo(numero, sufijo)
+            if numero not in numeros:
+                numeros.append(numero)
+    return numeros
+
+
+def ley_from_source(source: str) -> str:
+    """Identificador de la ley a partir del nombre del archivo: 'docs/x/Código Civil.pdf' -> 'codigo_civil'."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return "_".join(re.findall(r"[a-z0-9]+", normalizar(stem)))
+
+
+def ley_base(source: str) -> str:
+    """
+    Ley de un archivo sin año, edición ni marca de copia: 'Código Civil 2015.pdf' y
+    'Código Civil (ed. 2020).pdf' -> 'codigo_civil'. Si sin esas palabras no queda nada que
+    identifique a la ley ('Ley 1420.pdf'), se usa el identificador completo.
+    """
+    ley = ley_from_source(source)
+    tokens = [t for t in ley.split("_") if t not in EDICION_TOKENS and not EDICION_NUMERO.fullmatch(t)]
+    if any(t not in LEY_GENERIC_TOKENS for t in tokens):
+        return "_".join(tokens)
+    return ley
+
+
+def detectar_leyes(query: str, leyes) -> list:
+    """Leyes (identificadores de ley_from_source) mencionadas en la consulta, de mejor a peor coincidencia."""
+    tokens = set(tokenize(query))
+    # La primera palabra de cada sigla es la que distingue la ley ("cpc" es procesal, no civil)
+    requeridas = set()
+    for sigla, expansion in LEY_ALIASES.items():
+        if sigla in tokens:
+            tokens.update(expansion.split())
+            requeridas.add(expansion.split()[0])
+    scored = []
+    for ley in leyes:
+        ley_tokens = {t for t in ley.split("_") if t not in LEY_GENERIC_TOKENS and not t.isdigit()}
+        if not ley_tokens or not requeridas <= set(ley.split("_")):
+            continue
+        overlap = len(ley_tokens & tokens)
+        if overlap:
+            scored.append((overlap / len(ley_tokens), overlap, ley))
+    if not scored:
+        return []
+    best = max(s[0] for s in scored)
+    return [ley for score, _, ley in sorted(scored, reverse=True) if score == best]
+
+
+class ArticleIndex:
+    """Índice exacto (ley, número de artículo) -> chunks, para responder citas sin búsqueda vectorial."""
+
+    def __init__(self):
+        self._index = defaultdict(list)
+
+    def add(self, ley: str, numero: str, item):
+        self._index[(ley, str(numero))].append(item)
+
+    def update(self, other: "ArticleIndex"):
+        """Suma los artículos de otro índice (el de otro shard)."""
+        for key, items in other._index.items():
+            self._index[key].extend(items)
+
+    @property
+    def leyes(self) -> set:
+        return {ley for ley, _ in self._index}
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, ley: str, numero: str) -> list:
+        return self._index.get((ley, str(numero)), [])
+
+    def lookup(self, query: str) -> list:
+        """
+        Chunks de los artículos citados en la consulta; lista vacía si no hay cita reconocible o
+        si es ambigua: sin ley en la consulta, un artículo que existe en más de una ley no es una
+        cita exacta y se deja a la búsqueda híbrida.
+        """
+        numeros = citas_articulos(query)
+        if not numeros:
+            return []
+        todas = self.leyes
+        leyes = detectar_leyes(query, todas)
+        results = []
+        for numero in numeros:
+            if leyes:
+                for ley in leyes:
+                    results.extend(self.get(ley, numero))
+                continue
+            # Las ediciones deduplicadas de una misma ley comparten los chunks: no son ambiguas
+            encontrados = {tuple(id(item) for item in self.get(ley, numero)) for ley in todas} - {()}
+            if len(encontrados) > 1:
+                return []
+            for ley in sorted(todas):
+                if self.get(ley, numero):
+                    results.extend(self.get(ley, numero))
+                    break
+        return results
+
+
+class BM25Index:
+    """Índice invertido BM25 en memoria sobre los textos de una colección."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.items = []
+        self.doc_lengths = []
+        self.total_length = 0
+        self.postings = defaultdict(list)  # término -> [(doc_idx, tf)]
+
+    def add(self, text: str, item):
+        idx = len(self.items)
+        tokens = tokenize(text)
+        self.items.append(item)
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        for term, tf in Counter(tokens).items():
+            self.postings[term].append((idx, tf))
+
+    def __len__(self):
+        return len(self.items)
+
+    def search(self, query: str, k: int = 4) -> list:
+        """Devuelve [(item, score)] ordenado por score BM25 descendente."""
+        n = len(self.items)
+        if not n:
+            return []
+        avgdl = self.total_length / n or 1.0
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for idx, tf in postings:
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[idx] / avgdl)
+                scores[idx] += idf * tf * (self.k1 + 1) / norm
+        top = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [(self.items[idx], score) for idx, score in top]
+
+
+class ShardedBM25:
+    """
+    Un BM25Index por ley con la misma interfaz de búsqueda: si la consulta nombra leyes solo
+    se buscan sus shards; si no, todos, y los resultados se mezclan por score.
+    """
+
+    def __init__(self, shards: dict):
+        self.shards = shards
+
+    def __len__(self):
+        return sum(len(index) for index in self.shards.values())
+
+    def search(self, query: str, k: int = 4) -> list:
+        leyes = detectar_leyes(query, self.shards) or list(self.shards)
+        results = [hit for ley in leyes for hit in self.shards[ley].search(query, k)]
+        return sorted(results, key=lambda hit: hit[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings: list, key=lambda item: item, k: int = 60) -> list:
+    """Fusiona varias listas ordenadas con RRF: score = sum(1 / (k + rank)). Devuelve items sin duplicados."""
+    scores = defaultdict(float)
+    first_seen = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            item_key = key(item)
+            scores[item_key] += 1.0 / (k + rank + 1)
+            first_seen.setdefault(item_key, item)
+    ordered = sorted(scores, key=lambda item_key: scores[item_key], reverse=True)
+    return [first_seen[item_key] for item_key in ordered]
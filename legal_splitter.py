@@ -0,0 +1,195 @@
+import re
+from legal_index import NUMERO_ARTICULO, SUFIJO_ARTICULO, ley_from_source, numero_articulo
+
+# Encabezados de estructura: solo cuentan al comienzo de una línea corta
+_ORDINAL = (r"(?:preliminar|[uú]nic[oa]|primer[oa]?|segund[oa]|tercer[oa]?|cuart[oa]|quint[oa]|sext[oa]|"
+            r"s[eé]ptim[oa]|octav[oa]|noven[oa]|d[eé]cim[oa]|[ivxlc]+|\d+)[º°ª]?")
+NIVELES = ("libro", "titulo", "capitulo", "seccion")
+HEADER_PATTERNS = {
+    "libro": re.compile(rf"^\s*libro\s+{_ORDINAL}\b", re.IGNORECASE),
+    "titulo": re.compile(rf"^\s*t[ií]tulo\s+{_ORDINAL}\b", re.IGNORECASE),
+    "capitulo": re.compile(rf"^\s*cap[ií]tulo\s+{_ORDINAL}\b", re.IGNORECASE),
+    "seccion": re.compile(rf"^\s*secci[oó]n\s+{_ORDINAL}\b", re.IGNORECASE),
+}
+# Encabezado de artículo al comienzo de línea: "ARTÍCULO 14.- Epígrafe", "Art. 5º:", "Artículo 2560 bis.-"
+# Un "artículo 5 de la ley..." que empieza una línea por el corte del PDF no es encabezado: falta la puntuación
+# El sufijo (bis, ter...) es parte del número: "22 bis" es otro artículo que el 22
+ARTICULO_HEADER = re.compile(
+    rf"^\s*(?:(ART[ÍI]CULO|ART\.)|(?:Art[íi]culo|Art\.))\s*({NUMERO_ARTICULO})\s*[º°]?\s*(?:({SUFIJO_ARTICULO})\b)?"
+    r"\s*([.\-–—:]+|$)?(.*)$"
+)
+# Comienzo de inciso: "a)", "1)", "1.", "inc. 3", "iv)"
+INCISO_PATTERN = re.compile(r"^\s*(?:[a-zñ]\)|\d+[.)]\s|inc(?:iso)?\.?\s*\d+|[ivx]+\))", re.IGNORECASE)
+# Largo máximo de una línea de encabezado de estructura (las más largas son texto corrido)
+MAX_HEADER_LINE = 150
+
+
+def _es_encabezado_articulo(match) -> bool:
+    # En mayúsculas alcanza; en minúsculas se exige la puntuación del encabezado
+    return bool(match) and (match.group(1) is not None or match.group(4) is not None)
+
+
+def iter_lines(pages):
+    """Recorre páginas (página|None, texto) y genera (página, línea) sin unir todo el documento."""
+    for pagina, texto in pages:
+        for linea in texto.splitlines():
+            yield pagina, linea
+
+
+class _Fragmento:
+    """Texto acumulado de un artículo (o del texto fuera de artículos) con su metadata."""
+
+    def __init__(self, meta: dict, pagina):
+        self.meta = meta
+        self.pagina = pagina
+        self.pagina_fin = pagina
+        self.lineas = []  # (línea, empieza párrafo o inciso)
+        self.chars = 0
+        self.partes = 0
+        self.nuevo_parrafo = True
+
+    def agregar(self, linea: str, pagina):
+        if not linea.strip():
+            self.nuevo_parrafo = True
+            return
+        frontera = self.nuevo_parrafo or bool(INCISO_PATTERN.match(linea))
+        self.lineas.append((linea, frontera))
+        self.chars += len(linea) + 1
+        self.nuevo_parrafo = False
+        if pagina is not None:
+            self.pagina_fin = pagina
+
+    def vacio(self) -> bool:
+        return not any(linea.strip() for linea, _ in self.lineas)
+
+
+class HierarchicalSplitter:
+    """
+    Divide legislación en streaming: consume el texto página por página, mantiene la ruta
+    libro/título/capítulo/sección vigente y emite cada artículo como chunk apenas termina.
+    Los artículos más largos que max_chars se subdividen en límites de párrafo o inciso
+    (y solo si no hay ninguno, en límites de línea u oración). La memoria usada depende del
+    artículo más largo, no del tamaño del código.
+    """
+
+    def __init__(self, max_chars: int = 2000):
+        self.max_chars = max_chars
+
+    def split(self, pages, source: str = "") -> iter:
+        """Genera (texto, metadata) a partir de un iterable de (página|None, texto)."""
+        base = {"source": source}
+        if source:
+            base["ley"] = ley_from_source(source)
+        ruta = {}
+        pendiente = None  # nivel cuyo nombre puede venir en la línea siguiente ("TÍTULO I" / "De las personas")
+        actual = _Fragmento(dict(base), None)
+        for pagina, linea in iter_lines(pages):
+            if actual.pagina is None:
+                actual.pagina = actual.pagina_fin = pagina
+            limpia = linea.strip()
+            articulo = ARTICULO_HEADER.match(linea)
+            if _es_encabezado_articulo(articulo):
+                yield from self._cerrar(actual)
+                meta = {**base, **ruta, "articulo": numero_articulo(articulo.group(2), articulo.group(3))}
+                epigrafe = articulo.group(5).strip(" .-–—:º°").strip()[:120]
+                if epigrafe:
+                    meta["epigrafe"] = epigrafe
+                actual = _Fragmento(meta, pagina)
+                actual.agregar(linea, pagina)
+                pendiente = None
+                continue
+            nivel = None
+            if len(limpia) <= MAX_HEADER_LINE:
+                nivel = next((n for n, p in HEADER_PATTERNS.items() if p.match(limpia)), None)
+            if nivel:
+                yield from self._cerrar(actual)
+                # Un nivel nuevo reinicia los inferiores
+                for inferior in NIVELES[NIVELES.index(nivel):]:
+                    ruta.pop(inferior, None)
+                ruta[nivel] = limpia
+                pendiente = nivel
+                actual = _Fragmento({**base, **ruta}, pagina)
+                continue
+            if pendiente and limpia:
+                # Nombre del nivel en la línea siguiente al número
+                if len(limpia) <= MAX_HEADER_LINE and not limpia.endswith("."):
+                    ruta[pendiente] = f"{ruta[pendiente]} - {limpia}"
+                    actual.meta[pendiente] = ruta[pendiente]
+                    pendiente = None
+                    continue
+                pendiente = None
+            actual.agregar(linea, pagina)
+            if actual.chars > self.max_chars:
+                yield from self._emitir_parte(actual)
+        yield from self._cerrar(actual)
+
+    def _meta(self, frag: _Fragmento, pagina_fin, dividido: bool = False) -> dict:
+        meta = {k: v for k, v in frag.meta.items() if v not in (None, "")}
+        if frag.pagina is not None:
+            meta["pagina"] = frag.pagina
+            if pagina_fin is not None and pagina_fin != frag.pagina:
+                meta["pagina_fin"] = pagina_fin
+        if dividido or frag.partes:
+            meta["parte"] = frag.partes + 1
+        return meta
+
+    def _emitir_parte(self, frag: _Fragmento):
+        """Emite del comienzo del fragmento el mayor bloque que entra en max_chars cortando en una frontera."""
+        while frag.chars > self.max_chars:
+            acumulado = 0
+            corte = None
+            corte_linea = None
+            for i, (linea, frontera) in enumerate(frag.lineas):
+                if acumulado + len(linea) + 1 > self.max_chars:
+                    break
+                acumulado += len(linea) + 1
+                if i > 0 and i + 1 < len(frag.lineas) and frag.lineas[i + 1][1]:
+                    corte = i + 1
+                corte_linea = i + 1
+            if corte is None:
+                corte = corte_linea
+            if corte is None or corte >= len(frag.lineas):
+                # Una sola línea más larga que el máximo: se corta en la última oración o espacio
+                linea, frontera = frag.lineas[0]
+                pos = linea.rfind(". ", 0, self.max_chars)
+                # El fin de oración se prefiere mientras no deje una parte de menos de la mitad del máximo
+                if pos < self.max_chars // 2:
+                    pos = linea.rfind(" ", 0, self.max_chars)
+                pos = pos + 1 if pos > 0 else self.max_chars
+                cabeza, resto = linea[:pos], linea[pos:].lstrip()
+                if not cabeza:
+                    break
+                if resto:
+                    frag.lineas[0] = (resto, True)
+                else:
+                    frag.lineas.pop(0)
+                # Se recuenta: el lstrip también quita espacios que no son parte de la cabeza
+                frag.chars = sum(len(l) + 1 for l, _ in frag.lineas)
+                texto = cabeza.strip()
+            else:
+                partes = frag.lineas[:corte]
+                frag.lineas = frag.lineas[corte:]
+                frag.chars -= sum(len(linea) + 1 for linea, _ in partes)
+                texto = self._unir(partes)
+            if texto:
+                yield texto, self._meta(frag, frag.pagina_fin, dividido=True)
+                frag.partes += 1
+                frag.pagina = frag.pagina_fin
+
+    @staticmethod
+    def _unir(lineas: list) -> str:
+        partes = []
+        for linea, frontera in lineas:
+            if partes and frontera:
+                partes.append("\n")
+            partes.append(linea.strip())
+            partes.append("\n")
+        return "".join(partes).strip()
+
+    def _cerrar(self, frag: _Fragmento):
+        if frag.vacio():
+            return
+        yield from self._emitir_parte(frag)
+        texto = self._unir(frag.lineas)
+        if texto:
+            yield texto, self._meta(frag, frag.pagina_fin)
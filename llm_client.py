@@ -0,0 +1,232 @@
+import json
+import time
+import hashlib
+import threading
+from functools import partial
+from langchain_openai import OpenAI
+from helpers import get_env_var, get_env_int, get_env_float
+from tracing import get_logger, span
+from callbacks import tracing_callback
+
+log = get_logger("llm_client")
+
+
+class LLMStats:
+    """Contadores de las llamadas al servidor del modelo (seguros entre hilos): espera en cola vs. tiempo del modelo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.wait_seconds = 0.0
+        self.model_seconds = 0.0
+        self.waiting = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def queued(self, delta: int):
+        with self._lock:
+            self.waiting += delta
+
+    def started(self, wait: float):
+        with self._lock:
+            self.wait_seconds += wait
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def finished(self, seconds: float, error: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            self.errors += int(error)
+            self.model_seconds += seconds
+
+    def add_coalesced(self):
+        with self._lock:
+            self.coalesced += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "model_seconds": round(self.model_seconds, 3),
+                "avg_wait_ms": round(self.wait_seconds / self.calls * 1000, 1) if self.calls else 0.0,
+                "avg_model_ms": round(self.model_seconds / self.calls * 1000, 1) if self.calls else 0.0,
+                "waiting": self.waiting,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+            }
+
+
+class _Vuelo:
+    """Llamada en curso: quienes piden lo mismo esperan los chunks del que la lanzó."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.chunks = []
+        self.complete = False
+
+
+class LLMGate:
+    """
+    Punto único de paso hacia el servidor del modelo: limita las llamadas simultáneas
+    (el resto espera en cola) y, con single_flight, las llamadas idénticas que llegan mientras
+    otra está en curso esperan su resultado en lugar de repetir la petición.
+    Las etapas "llm_queue" y "llm_upstream" separan la espera del tiempo del modelo.
+    """
+
+    def __init__(self, max_concurrency: int = 4, single_flight: bool = True):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.single_flight = single_flight
+        self.stats = LLMStats()
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._vuelos = {}
+        self._lock = threading.Lock()
+
+    def stream(self, key: str, producer):
+        """
+        Genera (chunk, compartido) de producer() (llamada al servidor que devuelve un iterador).
+        compartido=True indica chunks de una llamada idéntica de otro hilo, ya terminada.
+        """
+        vuelo, lider = None, True
+        if key is not None and self.single_flight:
+            with self._lock:
+                vuelo = self._vuelos.get(key)
+                lider = vuelo is None
+                if lider:
+                    vuelo = self._vuelos[key] = _Vuelo()
+        if not lider:
+            with span("llm_coalesced"):
+                vuelo.done.wait()
+            # Si la original falló o se cortó a mitad, esta hace su propia llamada
+            if vuelo.complete:
+                self.stats.add_coalesced()
+                for chunk in vuelo.chunks:
+                    yield chunk, True
+                return
+            vuelo = None
+        try:
+            for chunk in self._upstream(producer):
+                if vuelo is not None:
+                    vuelo.chunks.append(chunk)
+                yield chunk, False
+            if vuelo is not None:
+                vuelo.complete = True
+        finally:
+            if lider and vuelo is not None:
+                with self._lock:
+                    self._vuelos.pop(key, None)
+                vuelo.done.set()
+
+    def call(self, key: str, func):
+        """Como stream() para una llamada sin streaming: func() devuelve el resultado completo."""
+        # El generador se consume entero: cortarlo en el primer resultado lo cerraría antes de
+        # marcar la llamada como completa (los que esperan la repetirían y se contaría como error)
+        chunks = list(self.stream(key, lambda: iter([func()])))
+        return chunks[0][0] if chunks else None
+
+    def _upstream(self, producer):
+        self.stats.queued(1)
+        with span("llm_queue"):
+            t0 = time.perf_counter()
+            self._semaphore.acquire()
+            wait = time.perf_counter() - t0
+        self.stats.queued(-1)
+        self.stats.started(wait)
+        t0, error = time.perf_counter(), True
+        try:
+            with span("llm_upstream"):
+                yield from producer()
+            error = False
+        finally:
+            self._semaphore.release()
+            self.stats.finished(time.perf_counter() - t0, error)
+
+
+def request_key(*parts) -> str:
+    """Clave de single-flight: misma petición (servidor, modelo, parámetros y prompt) = misma clave."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class PooledOpenAI(OpenAI):
+    """
+    OpenAI de LangChain que pasa cada llamada por el LLMGate compartido. Los clientes de
+    get_llm() siempre usan streaming, así que toda llamada (invoke o stream) entra por _stream.
+    """
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        key = request_key(self.openai_api_base, self._invocation_params, kwargs, prompt, stop)
+        for chunk, compartido in get_llm_gate().stream(key, partial(super()._stream, prompt, stop, run_manager, **kwargs)):
+            # Los tokens de una llamada ajena no pasaron por los callbacks de esta (streaming en la UI)
+            if compartido and run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def get_llm_gate() -> LLMGate:
+    """Límite de concurrencia y single-flight compartidos por proceso (LLM_MAX_CONCURRENCY, LLM_SINGLE_FLIGHT)."""
+    if not hasattr(get_llm_gate, "instance"):
+        with _lock:
+            if not hasattr(get_llm_gate, "instance"):
+                get_llm_gate.instance = LLMGate(
+                    max_concurrency=get_env_int("LLM_MAX_CONCURRENCY", 4),
+                    single_flight=(get_env_var("LLM_SINGLE_FLIGHT") or "1") != "0",
+                )
+    return get_llm_gate.instance
+
+
+def get_http_client():
+    """Cliente HTTP compartido por todos los LLM: un solo pool de conexiones keep-alive hacia el servidor."""
+    if not hasattr(get_http_client, "instance"):
+        with _lock:
+            if not hasattr(get_http_client, "instance"):
+                import httpx
+                # Margen sobre el límite de concurrencia para streams abandonados que aún no cerraron
+                conexiones = get_env_int("LLM_MAX_CONCURRENCY", 4) * 2
+                get_http_client.instance = httpx.Client(
+                    limits=httpx.Limits(max_connections=conexiones, max_keepalive_connections=conexiones),
+                    timeout=httpx.Timeout(get_env_float("LLM_TIMEOUT", 300.0), connect=10.0),
+                )
+    return get_http_client.instance
+
+
+def get_llm(temperature: float = None, max_tokens: int = None, extra_body: dict = None,
+            api_base: str = None, api_key: str = None, model_name: str = None) -> PooledOpenAI:
+    """
+    Cliente LLM compartido: una instancia por configuración (servidor, modelo, temperatura,
+    max_tokens, extra_body), todas sobre el mismo pool HTTP, con timeout (LLM_TIMEOUT) y
+    reintentos acotados (LLM_MAX_RETRIES) del SDK de OpenAI.
+    """
+    api_base = api_base or get_env_var("OPENAI_API_BASE")
+    model_name = model_name or get_env_var("MODEL_NAME")
+    key = request_key(api_base, model_name, temperature, max_tokens, extra_body)
+    with _lock:
+        if key in _clients:
+            return _clients[key]
+    opciones = {k: v for k, v in (("temperature", temperature), ("max_tokens", max_tokens),
+                                  ("extra_body", extra_body)) if v is not None}
+    llm = PooledOpenAI(
+        openai_api_base=api_base,
+        openai_api_key=api_key or get_env_var("OPENAI_API_KEY"),
+        model_name=model_name,
+        streaming=True,
+        timeout=get_env_float("LLM_TIMEOUT", 300.0),
+        max_retries=get_env_int("LLM_MAX_RETRIES", 2),
+        http_client=get_http_client(),
+        callbacks=[tracing_callback],
+        **opciones
+    )
+    with _lock:
+        return _clients.setdefault(key, llm)
+
+
+def llm_stats() -> dict:
+    return get_llm_gate().stats.as_dict()
@@ -1,187 +1,442 @@
-from langchain.agents import initialize_agent, Tool
-from langchain_openai import OpenAI
-from rag import build_rag_chain
-from cag import CAGModule, load_documents_with_langchain
-from helpers import get_env_var
-from utils import extraer_datos_cliente, reemplazar_placeholders
+import time
+
+# Tiempo de importación del módulo (sin LangChain ni clientes: se cargan en warm-up o en el primer uso)
+_import_started = time.perf_counter()
+
+from helpers import get_env_var, get_env_int
+from plantillas import get_template_registry
+from utils import normalizar_campo
+from docx_fill import es_pedido_de_generacion, rellenar_docx, ruta_salida
+from streaming import stream_agent
+from answer_cache import cached_answer, CachedAgent
+from router import IntentRouter, RoutedAgent
+from context_packer import dividir_secciones, pack, pack_text, unir_chunks, get_token_counter
+from tracing import get_logger, get_tracer, span
+from bundle import BundleError, get_index_bundle
 import os
-from docx import Document
 import re
+import threading
+from contextlib import nullcontext
 
-# Configuración LLM
-llm = OpenAI(
-    openai_api_base=get_env_var("OPENAI_API_BASE"),
-    openai_api_key=get_env_var("OPENAI_API_KEY"),
-    model_name=get_env_var("MODEL_NAME"),
-    temperature=0.0,
-    max_tokens=300
-)
+log = get_logger("main")
+
+# Un lock por herramienta: con varios hilos atendiendo consultas, cada cadena se construye una sola vez
+_chain_locks = {}
+
+def _get_chain(tool_func, coleccion, data_dir, persist_path, **kwargs):
+    if not hasattr(tool_func, "chain"):
+        lock = _chain_locks.setdefault(persist_path, threading.Lock())
+        with lock:
+            if not hasattr(tool_func, "chain"):
+                bundle = get_index_bundle()
+                if bundle is not None:
+                    # Modo de solo lectura: índices prearmados, sin ingesta de docs/
+                    from rag import bundle_rag_chain
+                    # (la partición por ley la decide cómo se armó el bundle)
+                    tool_func.chain = bundle_rag_chain(bundle, coleccion, hybrid=kwargs.get("hybrid", False))
+                else:
+                    from rag import build_rag_chain
+                    tool_func.chain = build_rag_chain(data_dir, persist_path=persist_path, **kwargs)
+    return tool_func.chain
+
+def get_rag_clientes_chain():
+    return _get_chain(rag_clientes_tool_func, "clientes", os.path.join("docs", "clientes"), "chroma_db_clientes")
+
+def get_rag_legislacion_chain():
+    return _get_chain(rag_legislacion_tool_func, "legislacion", os.path.join("docs", "legislacionLR"),
+                      "chroma_db_legislacion", hybrid=True, sharded=get_env_var("LEGISLACION_SHARDS") != "0")
+
+def get_plantillas():
+    """Registro de plantillas: el del bundle en modo de solo lectura, el de docs/plantillas si no."""
+    bundle = get_index_bundle()
+    if bundle is not None:
+        return bundle.template_registry()
+    return get_template_registry(os.path.join("docs", "plantillas"))
 
-# Herramienta RAG: búsqueda en clientes
+def get_clientes():
+    """Registro de clientes: el del bundle en modo de solo lectura, el de docs/clientes si no."""
+    bundle = get_index_bundle()
+    if bundle is not None:
+        return bundle.client_registry()
+    from client_registry import get_client_registry
+    return get_client_registry(os.path.join("docs", "clientes"))
+
+_cag_lock = threading.Lock()
+
+def get_cag_module():
+    """CAGModule compartido: un solo cliente LLM para todas las llamadas de la herramienta CAG."""
+    if not hasattr(get_cag_module, "instance"):
+        with _cag_lock:
+            if not hasattr(get_cag_module, "instance"):
+                from cag import CAGModule
+                get_cag_module.instance = CAGModule(
+                    get_env_var("OPENAI_API_BASE"),
+                    get_env_var("OPENAI_API_KEY"),
+                    get_env_var("MODEL_NAME")
+                )
+    return get_cag_module.instance
+
+# Fuentes de las que depende cada respuesta cacheada: si cambian, la entrada se invalida
+# (con INDEX_BUNDLE, el archivo del bundle reemplaza a las colecciones y a docs/plantillas)
+INDEX_BUNDLE = get_env_var("INDEX_BUNDLE")
+FUENTES_CLIENTES = [INDEX_BUNDLE or "chroma_db_clientes", INDEX_BUNDLE or os.path.join("docs", "clientes")]
+FUENTES_LEGISLACION = [INDEX_BUNDLE or "chroma_db_legislacion"]
+FUENTES_PLANTILLAS = [INDEX_BUNDLE or os.path.join("docs", "plantillas"), INDEX_BUNDLE or os.path.join("docs", "clientes")]
+
+# Herramienta RAG: búsqueda en clientes. Sin aciertos por similitud: "datos del cliente Pérez"
+# y "datos del cliente Gómez" son casi idénticas y la respuesta de una no sirve para la otra
+@cached_answer("clientes", FUENTES_CLIENTES, semantic=False)
 def rag_clientes_tool_func(query):
-    if not hasattr(rag_clientes_tool_func, "chain"):
-        rag_clientes_tool_func.chain = build_rag_chain(os.path.join("docs", "clientes"), persist_path="chroma_db_clientes")
-    return rag_clientes_tool_func.chain.invoke({"query": query})["result"]
+    # "datos/DNI/domicilio del cliente X": se responde desde el registro, sin búsqueda ni LLM
+    respuesta = get_clientes().responder(query)
+    if respuesta is not None:
+        return respuesta
+    return get_rag_clientes_chain().invoke({"query": query})["result"]
 
 # Herramienta RAG: búsqueda en legislación/plantillas
+@cached_answer("legislacion", FUENTES_LEGISLACION)
 def rag_legislacion_tool_func(query):
-    if not hasattr(rag_legislacion_tool_func, "chain"):
-        rag_legislacion_tool_func.chain = build_rag_chain(os.path.join("docs", "legislacionLR"), persist_path="chroma_db_legislacion")
-    return rag_legislacion_tool_func.chain.invoke({"query": query})["result"]
+    return get_rag_legislacion_chain().invoke({"query": query})["result"]
+
+def redactar_campos_faltantes(cag, query, faltantes, datos_cliente, texto_plantilla):
+    """Pide al LLM solo los campos que los datos del cliente no resuelven. Devuelve {campo: valor}."""
+    contexto = "\n".join([f"{k}: {v}" for k, v in datos_cliente.items()])
+    # Solo las secciones de la plantilla donde aparecen los campos a redactar
+    secciones = dividir_secciones(texto_plantilla)
+    knowledge = cag.prepare_kvcache(
+        [pack_text(" ".join(faltantes), secciones, get_env_int("CAG_CONTEXT_TOKENS", 1500))],
+        answer_instruction="Redactar un valor breve y formal para cada campo pedido. Responder una línea por campo con el formato campo: valor."
+    )
+    pregunta = f"{query}\n\nDatos del cliente:\n{contexto}\n\nCampos a redactar: {', '.join(sorted(faltantes))}"
+    respuesta = cag.run_qna(pregunta, knowledge)
+    redactados = {}
+    for linea in str(respuesta).splitlines():
+        if ":" in linea:
+            campo, valor = linea.split(":", 1)
+            campo = normalizar_campo(campo.strip(" -*{}"))
+            if campo in faltantes and valor.strip():
+                redactados[campo] = valor.strip()
+    return redactados
+
+def completar_datos(plantilla, datos_cliente, query, limite_llm=None):
+    """
+    Datos del cliente más los campos de la plantilla que no resuelven, redactados por el LLM
+    (una sola llamada, solo si falta alguno). limite_llm acota las llamadas concurrentes.
+    """
+    faltantes = plantilla.missing(datos_cliente)
+    if not faltantes:
+        return datos_cliente
+    with limite_llm or nullcontext():
+        redactados = redactar_campos_faltantes(get_cag_module(), query, faltantes, datos_cliente,
+                                               unir_chunks(plantilla.render_chunks(datos_cliente)))
+    return {**datos_cliente, **redactados}
+
+def generar_documento(plantilla, datos, output_path):
+    """Escribe la plantilla completada en output_path: DOCX preservando el formato, texto plano si no."""
+    with span("save") as s:
+        if plantilla.path.lower().endswith(".docx"):
+            rellenar_docx(plantilla.path, datos, output_path)
+        else:
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(plantilla.render(datos))
+        s.add(bytes=os.path.getsize(output_path))
+    return output_path
 
 # Herramienta CAG: consulta/generación sobre plantillas
-def cag_tool_func(query, plantilla_name=None):
+@cached_answer("plantillas", FUENTES_PLANTILLAS, semantic=False)
+def cag_tool_func(query, plantilla_name=None, cliente=None):
     try:
-        plantillas_dir = os.path.join("docs", "plantillas")
-        plantillas = [f for f in os.listdir(plantillas_dir) if f.lower().endswith((".txt", ".docx", ".pdf"))]
-        
-        # Selección de plantilla según la consulta
+        registry = get_plantillas()
+
+        # Selección de plantilla según la consulta (índice por nombre normalizado)
         if plantilla_name is None:
-            query_lower = query.lower()
-            # Selección directa si el prompt contiene "prescripción"
-            if "prescripción" in query_lower or "prescripcion" in query_lower:
-                plantilla_name = "PLANTILLA PROMUEVE DEMANDA DE PRESCRIPCIÓN.docx"
-            else:
-                import difflib
-                match = difflib.get_close_matches(query_lower, [p.lower() for p in plantillas], n=1, cutoff=0.3)
-                if match:
-                    plantilla_name = next((p for p in plantillas if p.lower() == match[0]), plantillas[0])
-                else:
-                    plantilla_name = plantillas[0]  # fallback: la primera
+            plantilla_name = registry.select(query)
 
         if not plantilla_name:
             return "No se encontró una plantilla adecuada para su consulta."
 
-        plantilla_path = os.path.join(plantillas_dir, plantilla_name)
-        if not os.path.exists(plantilla_path):
+        plantilla = registry.get(plantilla_name)
+        if plantilla is None:
             return f"Error: No se encontró la plantilla {plantilla_name}"
-
-        docs = load_documents_with_langchain(plantilla_path)
-        if not docs:
+        if not plantilla.chunks:
             return f"Error: No se pudo cargar el contenido de la plantilla {plantilla_name}"
 
-        docs_text = [d.page_content for d in docs]
-        
-        # Extraer datos del cliente y fusionar con plantilla
-        datos_cliente_path = os.path.join("docs", "clientes", "Datos del Cliente.docx")
-        if not os.path.exists(datos_cliente_path):
+        # Datos del cliente indicado (o mencionado en la consulta) desde el registro de clientes
+        registrado = get_clientes().resolver(query, cliente)
+        if registrado is None:
+            if cliente:
+                return f"Error: No se encontró el cliente {cliente}"
             return "Error: No se encontró el archivo de datos del cliente"
-            
-        datos_cliente = extraer_datos_cliente(datos_cliente_path)
-        docs_text = [reemplazar_placeholders(t, datos_cliente) for t in docs_text]
-        texto_fusionado = "\n\n".join(docs_text)
-
-        # Limitar a 3000 caracteres
-        MAX_CHARS = 3000
-        if len(texto_fusionado) > MAX_CHARS:
-            texto_fusionado = texto_fusionado[:MAX_CHARS] + "\n...[TEXTO RECORTADO]..."
-
-        cag = CAGModule(
-            get_env_var("OPENAI_API_BASE"),
-            get_env_var("OPENAI_API_KEY"),
-            get_env_var("MODEL_NAME")
-        )
-        
-        knowledge_cache = cag.prepare_kvcache(docs_text)
-        prompt_contexto = "\n".join([f"{k}: {v}" for k, v in datos_cliente.items()])
-        prompt_final = f"{query}\n\nDatos del cliente:\n{prompt_contexto}\n\n{texto_fusionado}"
-        
-        MAX_PROMPT = 3500
-        if len(prompt_final) > MAX_PROMPT:
-            prompt_final = prompt_final[:MAX_PROMPT] + "\n...[PROMPT RECORTADO]..."
+
+        # {nombre} de las plantillas aunque la ficha lo traiga como "Cliente:" o "Razón social:"
+        datos_cliente = registrado.datos_plantilla()
+
+        # Pedido de completar la plantilla: se rellena el DOCX directamente y el LLM
+        # solo interviene para los campos que los datos del cliente no resuelven
+        if plantilla.path.lower().endswith(".docx") and es_pedido_de_generacion(query):
+            datos_cliente = completar_datos(plantilla, datos_cliente, query)
+            output_path = generar_documento(plantilla, datos_cliente, ruta_salida(plantilla_name, ".docx", sufijo=registrado.nombre))
+            return f"[Plantilla seleccionada: {plantilla_name}]\n[Documento generado: {output_path}]\n{plantilla.render(datos_cliente)}"
+
+        # Contexto por presupuesto de tokens: secciones de la plantilla rankeadas por relevancia
+        # a la consulta; si la plantilla entra completa, el prefijo es siempre el mismo
+        with span("prompt_build") as s:
+            secciones = dividir_secciones(unir_chunks(plantilla.render_chunks(datos_cliente)))
+            texto_fusionado = pack_text(query, secciones, get_env_int("CAG_CONTEXT_TOKENS", 1500))
+
+            cag = get_cag_module()
+
+            knowledge_cache = cag.prepare_kvcache(texto_fusionado)
+            # Datos del cliente: primero los que usa la plantilla o menciona la consulta
+            lineas_datos = [f"{k}: {v}" for k, v in datos_cliente.items()]
+            prompt_contexto = "\n".join(texto for _, texto in pack(
+                f"{query} {' '.join(plantilla.placeholders)}", lineas_datos, get_env_int("CAG_PROMPT_TOKENS", 800),
+                grupos=list(range(len(lineas_datos)))))
+            # La plantilla ya está en el prefijo cacheado: la pregunta solo agrega la consulta y los datos
+            prompt_final = f"{query}\n\nDatos del cliente:\n{prompt_contexto}"
+            s.add(chars=len(knowledge_cache) + len(prompt_final),
+                  tokens=get_token_counter().count(knowledge_cache) + get_token_counter().count(prompt_final))
             
         respuesta_llm = cag.run_qna(prompt_final, knowledge_cache)
         return f"[Plantilla seleccionada: {plantilla_name}]\n{texto_fusionado}\n\n---\n{respuesta_llm}"
     except Exception as e:
         return f"Error al procesar la plantilla: {str(e)}"
 
-tools = [
-    Tool(
-        name="Buscar en clientes",
-        func=rag_clientes_tool_func,
-        description="Usa esto para responder preguntas sobre expedientes, datos o documentos de clientes."
-    ),
-    Tool(
-        name="Buscar en legislación y códigos",
-        func=rag_legislacion_tool_func,
-        description="Usa esto para responder preguntas sobre leyes, constituciones, códigos, normativas, o documentos legales."
-    ),
-    Tool(
-        name="Consultar/generar plantilla",
-        func=lambda q: cag_tool_func(q),
-        description="Usa esto para generar o consultar plantillas y contratos jurídicos."
-    )
-]
-
-agent = initialize_agent(
-    tools,
-    llm,
-    agent="zero-shot-react-description",
-    verbose=True,
-    handle_parsing_errors=True,
-    agent_kwargs={
-        "system_message": (
-            "Eres un agente jurídico experto. "
-            "Cuando uses una herramienta, nunca incluyas 'Final Answer' en la misma respuesta que una acción. "
-            "Solo responde con 'Final Answer' cuando realmente hayas terminado y tengas la respuesta final. "
-            "No repitas la pregunta del usuario. Sé claro, preciso y profesional. "
-            "Si usas una herramienta, espera el resultado antes de dar la respuesta final. "
-            "No inventes información si no está en los documentos o contexto proporcionado. "
-            "Si no encuentras la información, responde claramente que no está disponible en la base de datos."
-            "La respuesta final siempre en Español. "
-        )
-    }
+SYSTEM_MESSAGE = (
+    "Eres un agente jurídico experto. "
+    "Cuando uses una herramienta, nunca incluyas 'Final Answer' en la misma respuesta que una acción. "
+    "Solo responde con 'Final Answer' cuando realmente hayas terminado y tengas la respuesta final. "
+    "No repitas la pregunta del usuario. Sé claro, preciso y profesional. "
+    "Si usas una herramienta, espera el resultado antes de dar la respuesta final. "
+    "No inventes información si no está en los documentos o contexto proporcionado. "
+    "Si no encuentras la información, responde claramente que no está disponible en la base de datos."
+    "La respuesta final siempre en Español. "
 )
 
+_agent_lock = threading.Lock()
+_components = {}
+
+def _build_agent():
+    from langchain.agents import initialize_agent, Tool
+    from llm_client import get_llm
+
+    # Configuración LLM (cliente compartido de llm_client.py)
+    llm = get_llm(temperature=0.0, max_tokens=300)
+
+    tools = [
+        Tool(
+            name="Buscar en clientes",
+            func=rag_clientes_tool_func,
+            description="Usa esto para responder preguntas sobre expedientes, datos o documentos de clientes."
+        ),
+        Tool(
+            name="Buscar en legislación y códigos",
+            func=rag_legislacion_tool_func,
+            description="Usa esto para responder preguntas sobre leyes, constituciones, códigos, normativas, o documentos legales."
+        ),
+        Tool(
+            name="Consultar/generar plantilla",
+            func=lambda q: cag_tool_func(q),
+            description="Usa esto para generar o consultar plantillas y contratos jurídicos."
+        )
+    ]
+
+    agent_executor = initialize_agent(
+        tools,
+        llm,
+        agent="zero-shot-react-description",
+        # El progreso se muestra por streaming (ver streaming.py); AGENT_VERBOSE=1 reactiva el log de LangChain
+        verbose=get_env_var("AGENT_VERBOSE") == "1",
+        handle_parsing_errors=True,
+        agent_kwargs={"system_message": SYSTEM_MESSAGE}
+    )
+
+    # Router de intención: las consultas inequívocas van directo a la herramienta sin pasar por el ReAct
+    router = IntentRouter(tools)
+
+    # Cache de respuestas delante del agente (misma interfaz invoke que el AgentExecutor). Solo
+    # aciertos exactos: el agente también responde sobre clientes y no distingue uno de otro por similitud
+    agent = CachedAgent(RoutedAgent(agent_executor, router), FUENTES_CLIENTES + FUENTES_LEGISLACION + FUENTES_PLANTILLAS,
+                        semantic=False)
+    return {"llm": llm, "tools": tools, "agent_executor": agent_executor, "router": router, "agent": agent}
+
+def get_agent():
+    """Agente compartido (cliente LLM, herramientas, router y cache); se construye en el primer uso."""
+    if not _components:
+        with _agent_lock:
+            if not _components:
+                _components.update(_build_agent())
+    return _components["agent"]
+
+def __getattr__(name):
+    # main.agent, main.router, main.tools... siguen disponibles, pero se construyen recién al accederlos
+    if name in ("llm", "tools", "agent_executor", "router", "agent"):
+        get_agent()
+        return _components[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class Warmup:
+    """
+    Pre-calentamiento en segundo plano: cada componente (agente, cadenas RAG, plantillas,
+    módulo CAG) se construye en su propio hilo y en paralelo, registrando su estado y duración.
+    """
+
+    def __init__(self, components: dict):
+        self.components = components
+        self.status = {name: {"estado": "pendiente"} for name in components}
+        self.started_at = None
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        for name, build in self.components.items():
+            thread = threading.Thread(target=self._run, args=(name, build), name=f"warmup-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _run(self, name, build):
+        with self._lock:
+            self.status[name] = {"estado": "construyendo"}
+        t0 = time.perf_counter()
+        try:
+            with span(f"warmup_{name}"):
+                build()
+        except Exception as e:
+            log.error(f"No se pudo inicializar {name}: {e}")
+            estado = {"estado": "error", "error": str(e)}
+        else:
+            estado = {"estado": "listo"}
+        estado["segundos"] = round(time.perf_counter() - t0, 3)
+        with self._lock:
+            self.status[name] = estado
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(s["estado"] == "listo" for s in self.status.values())
+
+    @property
+    def finished(self) -> bool:
+        with self._lock:
+            return all(s["estado"] in ("listo", "error") for s in self.status.values())
+
+    def wait(self, timeout: float = None) -> bool:
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.perf_counter()))
+        return self.ready
+
+    def report(self) -> dict:
+        with self._lock:
+            componentes = {name: dict(s) for name, s in self.status.items()}
+        return {
+            "listo": all(s["estado"] == "listo" for s in componentes.values()),
+            "importacion_s": IMPORT_SECONDS,
+            "transcurrido_s": round(time.perf_counter() - self.started_at, 3) if self.started_at else None,
+            "componentes": componentes,
+        }
+
+_warmup = None
+_warmup_lock = threading.Lock()
+
+def start_warmup() -> Warmup:
+    """Lanza (una sola vez por proceso) la construcción en paralelo de clientes, cadenas RAG y plantillas."""
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = Warmup({
+                "agente": get_agent,
+                "rag_clientes": get_rag_clientes_chain,
+                "rag_legislacion": get_rag_legislacion_chain,
+                "plantillas": get_plantillas,
+                "registro_clientes": get_clientes,
+                "cag": get_cag_module,
+                "tokenizador": get_token_counter,
+            }).start()
+        return _warmup
+
+def warmup():
+    """Construye por adelantado las cadenas RAG, el registro de plantillas y los clientes (bloqueante)."""
+    estado = start_warmup()
+    estado.wait()
+    errores = {name: s["error"] for name, s in estado.report()["componentes"].items() if s["estado"] == "error"}
+    if errores:
+        raise RuntimeError("; ".join(f"{name}: {error}" for name, error in errores.items()))
+
 def guardar_documento_generado(respuesta_str):
     """Guarda el documento generado en docs_outputs con nombre único y limpio el encabezado."""
     try:
-        import re
-        import os
-        from datetime import datetime
-        
-        # Asegurar que el directorio existe
-        output_dir = "docs_outputs"
-        os.makedirs(output_dir, exist_ok=True)
-        
+        # Si la herramienta ya escribió el DOCX completo, no hay nada más que guardar
+        match = re.search(r"^\[Documento generado: (.+?)\]", respuesta_str, re.MULTILINE)
+        if match and os.path.exists(match.group(1)):
+            log.info(f"Documento guardado exitosamente en: {match.group(1)}")
+            return match.group(1)
+
         # Extraer nombre de la plantilla
         match = re.match(r"\[Plantilla seleccionada: (.+?)\]", respuesta_str)
-        if match:
-            plantilla_name = match.group(1)
-            safe_name = plantilla_name.replace(" ", "_").replace(".", "_")
-        else:
-            safe_name = "plantilla"
-            
-        # Generar nombre
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_path = os.path.join(output_dir, f"{safe_name}_{timestamp}.txt")
+        plantilla_name = match.group(1) if match else "plantilla"
+        output_path = ruta_salida(plantilla_name, ".txt")
         
         # Quitar el encabezado de plantilla seleccionada y limpiar el texto
         texto = re.sub(r"^\[Plantilla seleccionada: .+?\]\n?", "", respuesta_str)
         texto = texto.strip()
         
         # Guardar el archivo
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(texto)
+        with span("save") as s:
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(texto)
+            s.add(bytes=len(texto.encode("utf-8")))
             
-        print(f"Documento guardado exitosamente en: {output_path}")
+        log.info(f"Documento guardado exitosamente en: {output_path}")
         return output_path
     except Exception as e:
-        print(f"Error al guardar el documento: {str(e)}")
+        log.error(f"Error al guardar el documento: {str(e)}")
         raise
 
+def check_index_bundle():
+    """Abre el bundle de INDEX_BUNDLE (si hay) antes de arrancar: con otro modelo de embeddings no se inicia."""
+    try:
+        bundle = get_index_bundle()
+    except BundleError as e:
+        log.error(str(e))
+        raise SystemExit(1)
+    if bundle is not None:
+        log.info(f"Modo de solo lectura: bundle {bundle.info['id']} ({bundle.embedding_model}, creado {bundle.info['creado']})")
+    return bundle
+
+IMPORT_SECONDS = round(time.perf_counter() - _import_started, 3)
+
 if __name__ == "__main__":
+    check_index_bundle()
+    # Las cadenas se construyen mientras el usuario escribe la primera consulta
+    start_warmup()
+    log.info(f"main importado en {IMPORT_SECONDS}s; inicializando componentes en segundo plano")
     print("Agente jurídico inteligente listo. Escribe tu consulta:")
     while True:
         pregunta = input("Consulta: ")
         if pregunta.lower() in ["salir", "exit", "quit"]:
             break
         try:
-            respuesta = agent.invoke(pregunta)
-            respuesta_str = respuesta["output"] if isinstance(respuesta, dict) and "output" in respuesta else str(respuesta)
-            print("Respuesta:", respuesta_str)
+            respuesta_str = ""
+            en_respuesta = False
+            for evento, dato in stream_agent(get_agent(), pregunta):
+                if evento == "step":
+                    print(f"\n[Herramienta] {dato}", flush=True)
+                elif evento == "answer":
+                    if not en_respuesta:
+                        print("Respuesta: ", end="", flush=True)
+                        en_respuesta = True
+                    print(dato, end="", flush=True)
+                elif evento == "final":
+                    respuesta_str = dato
+                elif evento == "metrics":
+                    print(f"\n[Tiempos] primer token: {dato['time_to_first_token']}s, "
+                          f"primer token de respuesta: {dato['time_to_first_answer_token']}s, total: {dato['total']}s")
             if respuesta_str.startswith("[Plantilla seleccionada: "):
                 guardar_documento_generado(respuesta_str)
         except Exception as e:
-            print(f"[ERROR] Consulta fallida: {e}")
-
+            log.error(f"Consulta fallida: {e}")
+    get_tracer().flush()
@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+from tracing import get_logger
+
+MANIFEST_FILENAME = "manifest.json"
+# Subdirectorio de una colección partida por ley: <persist_dir>/shards/<ley>, cada uno con su manifiesto
+SHARDS_DIRNAME = "shards"
+
+log = get_logger("manifest")
+
+
+def sha256_file(path: str, block_size: int = 1 << 20) -> str:
+    """Calcula el hash SHA-256 del contenido de un archivo leyendo por bloques."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class CollectionManifest:
+    """
+    Manifiesto por colección: para cada archivo ingerido guarda tamaño, mtime,
+    hash de contenido e ids de los chunks almacenados en el vectorstore.
+    """
+
+    def __init__(self, persist_dir: str):
+        self.path = os.path.join(persist_dir, MANIFEST_FILENAME)
+        self.embedding_model = None
+        self.ingest_version = None
+        self.backend = None
+        self.files = {}
+        self.load()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self):
+        if not self.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"Manifiesto ilegible en {self.path}, se reconstruye: {e}")
+            return
+        self.embedding_model = data.get("embedding_model")
+        self.ingest_version = data.get("ingest_version")
+        # Manifiestos previos al backend configurable corresponden a Chroma
+        self.backend = data.get("backend", "chroma")
+        self.files = data.get("files", {})
+
+    def save(self):
+        # Escritura atómica: un corte a mitad de escritura no deja el manifiesto corrupto
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"embedding_model": self.embedding_model, "ingest_version": self.ingest_version,
+                       "backend": self.backend, "files": self.files}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def all_chunk_ids(self) -> list:
+        return [cid for entry in self.files.values() for cid in entry.get("chunk_ids", [])]
+
+    def corpus_hash(self) -> str:
+        """Hash estable del corpus ingerido (modelo de embeddings + hash de cada archivo)."""
+        h = hashlib.sha256((self.embedding_model or "").encode("utf-8"))
+        for path in sorted(self.files):
+            h.update(path.encode("utf-8"))
+            h.update(self.files[path].get("sha256", "").encode("utf-8"))
+        return h.hexdigest()
+
+    def diff(self, paths: list):
+        """
+        Compara los archivos actuales contra el manifiesto.
+        Devuelve (nuevos, modificados, eliminados, sin_cambios). Solo se calcula el hash
+        cuando tamaño o mtime difieren; si el hash coincide se actualiza el stat y se
+        considera sin cambios.
+        """
+        nuevos, modificados, sin_cambios = [], [], []
+        actuales = set()
+        for path in paths:
+            key = os.path.normpath(path)
+            actuales.add(key)
+            st = os.stat(path)
+            entry = self.files.get(key)
+            if entry is None:
+                nuevos.append(path)
+                continue
+            if entry.get("size") == st.st_size and entry.get("mtime") == st.st_mtime:
+                sin_cambios.append(path)
+                continue
+            if entry.get("sha256") == sha256_file(path):
+                entry["size"] = st.st_size
+                entry["mtime"] = st.st_mtime
+                sin_cambios.append(path)
+            else:
+                modificados.append(path)
+        eliminados = [p for p in self.files if p not in actuales]
+        return nuevos, modificados, eliminados, sin_cambios
+
+    def record(self, path: str, chunk_ids: list, sha256: str = None):
+        st = os.stat(path)
+        self.files[os.path.normpath(path)] = {
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "sha256": sha256 or sha256_file(path),
+            "chunk_ids": list(chunk_ids),
+        }
+
+    def forget(self, path: str) -> list:
+        entry = self.files.pop(os.path.normpath(path), None)
+        return entry.get("chunk_ids", []) if entry else []
@@ -0,0 +1,395 @@
+import os
+import json
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from helpers import get_env_var, get_env_int
+from manifest import sha256_file
+from tracing import get_logger, span
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx")
+
+log = get_logger("parsing")
+
+# Cache en memoria del proceso: ruta -> (size, mtime, sha256, páginas), LRU acotado por la
+# cantidad total de caracteres (PARSE_MEMORY_CACHE_CHARS); lo desalojado sigue en el cache en disco
+_memory_cache = OrderedDict()
+_memory_chars = {}
+_memory_lock = threading.Lock()
+
+
+def _memo_get(path: str):
+    with _memory_lock:
+        entry = _memory_cache.get(path)
+        if entry is not None:
+            _memory_cache.move_to_end(path)
+        return entry
+
+
+def _memo_put(path: str, entry: tuple):
+    limit = get_env_int("PARSE_MEMORY_CACHE_CHARS", 20_000_000)
+    chars = sum(len(page) for page in entry[3])
+    with _memory_lock:
+        _memory_cache.pop(path, None)
+        _memory_chars.pop(path, None)
+        if chars > limit:
+            return
+        _memory_cache[path] = entry
+        _memory_chars[path] = chars
+        total = sum(_memory_chars.values())
+        while total > limit:
+            old_path, _ = _memory_cache.popitem(last=False)
+            total -= _memory_chars.pop(old_path)
+
+
+def _cache_dir() -> str:
+    return get_env_var("PARSE_CACHE_DIR") or os.path.join("cache", "parsed")
+
+
+def _cache_file(path: str) -> str:
+    key = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(_cache_dir(), f"{key}.json")
+
+
+# --- Extracción (se ejecuta en los procesos del pool: solo funciones de módulo) ---
+
+def extract_pdf_pages(path: str, start: int = 0, end: int = None) -> list:
+    import PyPDF2
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        pages = reader.pages[start:end] if end is not None else reader.pages[start:]
+        return [page.extract_text() or "" for page in pages]
+
+
+def extract_docx_text(path: str) -> str:
+    # Párrafos y tablas en el orden en que aparecen en el cuerpo del documento
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    document = docx.Document(path)
+    parts = []
+    for child in document.element.body.iterchildren():
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            parts.append(Paragraph(child, document).text)
+        elif tag == "tbl":
+            for row in Table(child, document).rows:
+                parts.append("\t".join(cell.text for cell in row.cells))
+    return "\n".join(parts)
+
+
+def extract_txt_text(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except UnicodeDecodeError:
+        with open(path, "r", encoding="latin-1") as f:
+            return f.read()
+
+
+def _extract_task(path: str, start: int = 0, end: int = None) -> list:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        return extract_pdf_pages(path, start, end)
+    if ext == ".docx":
+        return [extract_docx_text(path)]
+    if ext == ".txt":
+        return [extract_txt_text(path)]
+    raise ValueError(f"Extensión de archivo no soportada: {ext}")
+
+
+def _pdf_page_count(path: str) -> int:
+    import PyPDF2
+    with open(path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+# --- Cache de texto extraído (clave: ruta + tamaño + mtime + hash) ---
+
+def _lookup_cache(path: str, memo: bool = True):
+    """
+    Devuelve las páginas cacheadas si el archivo no cambió; None si hay que parsearlo.
+    Con memo=False lo leído del disco no queda en el cache en memoria del proceso.
+    """
+    st = os.stat(path)
+    entry = _memo_get(path)
+    if entry is None:
+        try:
+            with open(_cache_file(path), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entry = (data["size"], data["mtime"], data["sha256"], data["pages"])
+        except (OSError, ValueError, KeyError):
+            return None
+    size, mtime, digest, pages = entry
+    if (size, mtime) != (st.st_size, st.st_mtime):
+        # Cambió el stat: solo se reutiliza si el contenido es idéntico
+        if sha256_file(path) != digest:
+            return None
+        _store_cache(path, digest, pages)
+    elif memo:
+        _memo_put(path, entry)
+    return pages
+
+
+def _store_cache(path: str, digest: str, pages: list):
+    st = os.stat(path)
+    entry = (st.st_size, st.st_mtime, digest, pages)
+    _memo_put(path, entry)
+    try:
+        os.makedirs(_cache_dir(), exist_ok=True)
+        tmp_path = _cache_file(path) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"path": path, "size": entry[0], "mtime": entry[1], "sha256": digest, "pages": pages},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, _cache_file(path))
+    except OSError as e:
+        log.warning(f"No se pudo guardar el texto extraído de {path}: {e}")
+
+
+class _StreamingCacheWriter:
+    """
+    Guarda en el cache de texto extraído las páginas de iter_pages a medida que se leen, con el
+    mismo formato que _store_cache y sin acumularlas en memoria. Los TXT y DOCX quedan como una
+    sola página (sus bloques unidos por saltos de línea), igual que en parse_documents.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.single_page = not path.lower().endswith(".pdf")
+        self.tmp_path = _cache_file(path) + ".tmp"
+        self._first = True
+        st = os.stat(path)
+        header = {"path": path, "size": st.st_size, "mtime": st.st_mtime, "sha256": sha256_file(path)}
+        os.makedirs(_cache_dir(), exist_ok=True)
+        self._f = open(self.tmp_path, "w", encoding="utf-8")
+        self._f.write(json.dumps(header, ensure_ascii=False)[:-1] + ', "pages": [' + ('"' if self.single_page else ""))
+
+    def write(self, text: str):
+        piece = json.dumps(text, ensure_ascii=False)
+        if self.single_page:
+            piece = ("" if self._first else "\\n") + piece[1:-1]
+        elif not self._first:
+            piece = ", " + piece
+        self._f.write(piece)
+        self._first = False
+
+    def close(self, complete: bool):
+        """Publica el archivo si se leyeron todas las páginas; si no, lo descarta."""
+        try:
+            if complete:
+                self._f.write(('"' if self.single_page else "") + "]}")
+            self._f.close()
+            if complete:
+                os.replace(self.tmp_path, _cache_file(self.path))
+                return
+        except OSError as e:
+            log.warning(f"No se pudo guardar el texto extraído de {self.path}: {e}")
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+def _mp_context():
+    # Sin fork: el proceso que parsea tiene hilos (servidor, pools, SQLite) y un fork los copiaría a medio usar
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+# --- API pública ---
+
+def parse_documents(paths: list, max_workers: int = None) -> dict:
+    """
+    Extrae el texto de varios archivos y devuelve {ruta: [texto por página]}.
+    Los archivos sin cambios salen del cache; el resto se parsea en un pool de procesos,
+    dividiendo los PDF grandes en rangos de páginas. Los archivos que fallan se omiten.
+    """
+    with span("load") as s:
+        results = _parse_documents(paths, max_workers, s)
+        s.add(files=len(results), chars=sum(len(p) for pages in results.values() for p in pages))
+        return results
+
+
+def _parse_documents(paths: list, max_workers: int, s) -> dict:
+    results = {}
+    pending = []
+    for path in paths:
+        try:
+            pages = _lookup_cache(path)
+        except OSError as e:
+            log.error(f"No se pudo leer el archivo {path}: {e}")
+            continue
+        if pages is not None:
+            results[path] = pages
+        else:
+            pending.append(path)
+    s.add(cached_files=len(results))
+    if not pending:
+        return results
+
+    pages_per_task = get_env_int("PARSE_PDF_PAGES_PER_TASK", 50)
+    tasks = []
+    for path in pending:
+        if path.lower().endswith(".pdf"):
+            try:
+                n_pages = _pdf_page_count(path)
+            except Exception as e:
+                log.error(f"No se pudo cargar el archivo {path}: {e}")
+                continue
+            tasks.extend((path, start, min(start + pages_per_task, n_pages))
+                         for start in range(0, max(n_pages, 1), pages_per_task))
+        else:
+            tasks.append((path, 0, None))
+
+    max_workers = max_workers or get_env_int("PARSE_WORKERS", os.cpu_count() or 1)
+    outputs = {}
+    if max_workers > 1 and len(tasks) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks)), mp_context=_mp_context()) as pool:
+                futures = {task: pool.submit(_extract_task, *task) for task in tasks}
+                for task, future in futures.items():
+                    try:
+                        outputs[task] = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        log.error(f"No se pudo cargar el archivo {task[0]}: {e}")
+                        outputs[task] = None
+        except (BrokenProcessPool, OSError) as e:
+            log.warning(f"Pool de procesos no disponible, se parsea en serie: {e}")
+            outputs = {}
+    for task in tasks:
+        if task not in outputs:
+            try:
+                outputs[task] = _extract_task(*task)
+            except Exception as e:
+                log.error(f"No se pudo cargar el archivo {task[0]}: {e}")
+                outputs[task] = None
+
+    # Reensamblar por archivo respetando el orden de los rangos de páginas
+    for path in pending:
+        parts = [outputs.get(task) for task in tasks if task[0] == path]
+        if not parts or any(p is None for p in parts):
+            continue
+        pages = [page for part in parts for page in part]
+        _store_cache(path, sha256_file(path), pages)
+        results[path] = pages
+    return results
+
+
+def parse_document(path: str) -> list:
+    """Texto por página de un archivo (una sola página para TXT/DOCX); lista vacía si falla."""
+    return parse_documents([path]).get(path, [])
+
+
+def iter_pages(path: str, block_chars: int = 65536):
+    """
+    Genera (número de página | None, texto) sin cargar el archivo completo: los PDF de a una
+    página, los TXT y DOCX en bloques de líneas enteras de hasta block_chars caracteres.
+    Comparte el cache de parse_documents: si el archivo no cambió, el texto sale de ahí; si
+    no, se guarda en el cache a medida que se extrae.
+    """
+    try:
+        pages = _lookup_cache(path, memo=False)
+    except OSError:
+        pages = None
+    if pages is not None:
+        numbered = path.lower().endswith(".pdf")
+        for i, text in enumerate(pages):
+            yield (i + 1 if numbered else None), text
+        return
+    try:
+        writer = _StreamingCacheWriter(path)
+    except OSError as e:
+        log.warning(f"No se pudo guardar el texto extraído de {path}: {e}")
+        writer = None
+    complete = False
+    try:
+        for pagina, text in _extract_pages(path, block_chars):
+            if writer is not None:
+                try:
+                    writer.write(text)
+                except OSError as e:
+                    log.warning(f"No se pudo guardar el texto extraído de {path}: {e}")
+                    writer.close(False)
+                    writer = None
+            yield pagina, text
+        complete = True
+    finally:
+        if writer is not None:
+            writer.close(complete)
+
+
+def _extract_pages(path: str, block_chars: int):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        import PyPDF2
+        with open(path, "rb") as f:
+            reader = PyPDF2.PdfReader(f)
+            for i, page in enumerate(reader.pages):
+                yield i + 1, page.extract_text() or ""
+        return
+    if ext == ".txt":
+        lines = _iter_txt_lines(path)
+    elif ext == ".docx":
+        lines = _iter_docx_lines(path)
+    else:
+        raise ValueError(f"Extensión de archivo no soportada: {ext}")
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line) + 1
+        if size >= block_chars:
+            yield None, "\n".join(block)
+            block, size = [], 0
+    if block:
+        yield None, "\n".join(block)
+
+
+def _iter_txt_lines(path: str):
+    # Decodificación por línea: un byte latin-1 suelto no obliga a releer el archivo
+    with open(path, "rb") as f:
+        for raw in f:
+            try:
+                line = raw.decode("utf-8")
+            except UnicodeDecodeError:
+                line = raw.decode("latin-1")
+            yield line.rstrip("\r\n")
+
+
+def _iter_docx_lines(path: str):
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    document = docx.Document(path)
+    for child in document.element.body.iterchildren():
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            yield Paragraph(child, document).text
+        elif tag == "tbl":
+            for row in Table(child, document).rows:
+                yield "\t".join(cell.text for cell in row.cells)
+
+
+def list_supported_files(data_dir: str) -> list:
+    # Solo el nivel superior del directorio, como DirectoryLoader(glob="*.ext")
+    if not os.path.isdir(data_dir):
+        return []
+    files = []
+    for fname in sorted(os.listdir(data_dir)):
+        fpath = os.path.join(data_dir, fname)
+        if os.path.isfile(fpath) and fname.lower().endswith(SUPPORTED_EXTENSIONS):
+            files.append(fpath)
+    return files
+
+
+def as_documents(path: str, pages: list) -> list:
+    """Convierte páginas extraídas a Documents de LangChain con la metadata de los loaders originales."""
+    from langchain.schema import Document
+    if path.lower().endswith(".pdf"):
+        return [Document(page_content=text, metadata={"source": path, "page": i})
+                for i, text in enumerate(pages)]
+    return [Document(page_content=text, metadata={"source": path}) for text in pages]
@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+from cag import load_documents_with_langchain
+from helpers import get_env_float
+from legal_index import normalizar, tokenize
+from utils import PLACEHOLDER_PATTERN, normalizar_campo
+
+TEMPLATE_EXTENSIONS = (".txt", ".docx", ".pdf")
+
+# Palabras clave que eligen directamente una plantilla (la primera cuyo nombre las contenga)
+KEYWORD_RULES = {
+    "prescripcion": "prescripcion",
+}
+
+# Palabras comunes a muchos nombres de archivo que no ayudan a distinguir plantillas
+TEMPLATE_GENERIC_TOKENS = {"plantilla", "plantillas", "modelo", "formulario"}
+
+
+def compilar_segmentos(texto: str) -> list:
+    """
+    Tokeniza el texto en segmentos literales y huecos de placeholder.
+    Devuelve [(literal, campo|None, original|None)]: al renderizar se concatena el literal
+    y luego el valor del campo (o el placeholder original si el dato no existe).
+    """
+    segmentos = []
+    pos = 0
+    for match in PLACEHOLDER_PATTERN.finditer(texto):
+        segmentos.append((texto[pos:match.start()], normalizar_campo(match.group(1)), match.group(0)))
+        pos = match.end()
+    segmentos.append((texto[pos:], None, None))
+    return segmentos
+
+
+class CompiledTemplate:
+    """Plantilla con su texto ya extraído y pre-tokenizado en literales y placeholders."""
+
+    def __init__(self, name: str, path: str, mtime: float, chunks: list):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.chunks = chunks
+        self.compiled = [compilar_segmentos(chunk) for chunk in chunks]
+        self.placeholders = {campo for segs in self.compiled for _, campo, _ in segs if campo}
+
+    def render_chunks(self, datos: dict) -> list:
+        return ["".join(lit + (datos.get(campo, original) if campo else "") for lit, campo, original in segs)
+                for segs in self.compiled]
+
+    def render(self, datos: dict) -> str:
+        return "\n\n".join(self.render_chunks(datos))
+
+    def missing(self, datos: dict) -> set:
+        """Placeholders de la plantilla que los datos no resuelven."""
+        return {campo for campo in self.placeholders if campo not in datos}
+
+
+class TemplateRegistry:
+    """
+    Registro de plantillas de un directorio: se compila una vez y se refresca solo cuando
+    cambia el mtime de algún archivo. La selección por consulta usa un índice invertido de
+    palabras normalizadas del nombre en lugar de difflib.
+    """
+
+    def __init__(self, plantillas_dir: str, refresh_interval: float = None, snapshot: list = None):
+        self.plantillas_dir = plantillas_dir
+        self.refresh_interval = refresh_interval if refresh_interval is not None else get_env_float("TEMPLATE_REFRESH_SECONDS", 2.0)
+        self.templates = {}
+        self._by_normalized_name = {}
+        self._token_index = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        # Con un snapshot (bundle de índices) el registro queda fijo: no se escanea ni se parsea nada
+        self.frozen = snapshot is not None
+        if self.frozen:
+            for entry in snapshot:
+                self.templates[entry["name"]] = CompiledTemplate(
+                    entry["name"], os.path.join(plantillas_dir, entry["name"]), entry["mtime"], entry["chunks"])
+            self._rebuild_index()
+        else:
+            self.refresh(force=True)
+
+    def _scan(self) -> dict:
+        if not os.path.isdir(self.plantillas_dir):
+            return {}
+        found = {}
+        for entry in os.scandir(self.plantillas_dir):
+            if entry.is_file() and entry.name.lower().endswith(TEMPLATE_EXTENSIONS):
+                found[entry.name] = entry.stat().st_mtime
+        return found
+
+    def refresh(self, force: bool = False):
+        if self.frozen:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_check < self.refresh_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            found = self._scan()
+            changed = False
+            for name in list(self.templates):
+                if name not in found:
+                    del self.templates[name]
+                    changed = True
+            for name, mtime in found.items():
+                current = self.templates.get(name)
+                if current is not None and current.mtime == mtime:
+                    continue
+                path = os.path.join(self.plantillas_dir, name)
+                chunks = [d.page_content for d in load_documents_with_langchain(path)]
+                self.templates[name] = CompiledTemplate(name, path, mtime, chunks)
+                changed = True
+            if changed:
+                self._rebuild_index()
+
+    def _rebuild_index(self):
+        self._by_normalized_name = {}
+        self._token_index = {}
+        for name in sorted(self.templates):
+            stem = os.path.splitext(name)[0]
+            self._by_normalized_name.setdefault(normalizar(name), name)
+            self._by_normalized_name.setdefault(normalizar(stem), name)
+            for token in set(tokenize(stem)) - TEMPLATE_GENERIC_TOKENS:
+                self._token_index.setdefault(token, []).append(name)
+
+    def snapshot(self) -> list:
+        """Texto ya extraído de cada plantilla, para reconstruir el registro sin parsear los archivos."""
+        self.refresh()
+        return [{"name": t.name, "mtime": t.mtime, "chunks": t.chunks} for _, t in sorted(self.templates.items())]
+
+    def names(self) -> list:
+        self.refresh()
+        return sorted(self.templates)
+
+    def get(self, name: str):
+        self.refresh()
+        return self.templates.get(name)
+
+    def select(self, query: str):
+        """Nombre de la plantilla más adecuada para la consulta (la primera si nada coincide)."""
+        self.refresh()
+        if not self.templates:
+            return None
+        query_norm = normalizar(query).strip()
+        if query_norm in self._by_normalized_name:
+            return self._by_normalized_name[query_norm]
+        tokens = tokenize(query)
+        # Reglas directas por palabra clave
+        for keyword, name_token in KEYWORD_RULES.items():
+            if keyword in tokens and name_token in self._token_index:
+                return self._token_index[name_token][0]
+        # Puntaje por cantidad de palabras de la consulta presentes en el nombre
+        scores = {}
+        for token in tokens:
+            for name in self._token_index.get(token, ()):
+                scores[name] = scores.get(name, 0) + 1
+        if scores:
+            return min(scores, key=lambda name: (-scores[name], name))
+        return sorted(self.templates)[0]  # fallback: la primera
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_template_registry(plantillas_dir: str = os.path.join("docs", "plantillas")) -> TemplateRegistry:
+    """Registro de plantillas compartido por proceso para cada directorio."""
+    with _registries_lock:
+        if plantillas_dir not in _registries:
+            _registries[plantillas_dir] = TemplateRegistry(plantillas_dir)
+        return _registries[plantillas_dir]
@@ -0,0 +1,254 @@
+import json
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from functools import partial
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from helpers import get_env_var, get_env_int, get_env_float
+from tracing import get_logger, span
+
+log = get_logger("prefix_cache")
+
+
+def prefix_key(prefix: str) -> str:
+    return hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+
+class PrefixCacheBackend(ABC):
+    """Backend de completado que puede reutilizar el prefill de un prefijo ya procesado."""
+
+    name = "base"
+
+    @abstractmethod
+    def complete(self, key: str, prefix: str, suffix: str) -> str:
+        """Completa prefix + suffix; key identifica al prefijo."""
+
+    def stream(self, key: str, prefix: str, suffix: str):
+        yield self.complete(key, prefix, suffix)
+
+
+class OpenAICompatBackend(PrefixCacheBackend):
+    """
+    Servidores compatibles con OpenAI (LM Studio, llama.cpp en /v1, vLLM): el prefijo se envía
+    byte a byte idéntico y con cache_prompt=True para que el servidor reutilice su cache de prompt.
+    """
+
+    name = "openai"
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def complete(self, key, prefix, suffix):
+        return self.llm.invoke(prefix + suffix)
+
+    def stream(self, key, prefix, suffix):
+        for token in self.llm.stream(prefix + suffix):
+            yield token
+
+
+class LlamaCppSlotBackend(PrefixCacheBackend):
+    """
+    Servidor llama.cpp nativo (/completion): cada prefijo se fija a un slot con id_slot y
+    cache_prompt, de modo que las preguntas sucesivas solo procesan el sufijo. Con
+    save_slots=True el estado del slot se guarda en disco al desalojarlo y se restaura al volver.
+    """
+
+    name = "llamacpp"
+
+    def __init__(self, base_url: str, n_slots: int = 4, max_tokens: int = 300, temperature: float = 0.0,
+                 timeout: float = 300.0, save_slots: bool = False, max_retries: int = 2):
+        # Los endpoints nativos cuelgan de la raíz, no de /v1
+        self.base_url = base_url.rstrip("/")
+        if self.base_url.endswith("/v1"):
+            self.base_url = self.base_url[:-3]
+        self.n_slots = n_slots
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.timeout = timeout
+        self.save_slots = save_slots
+        self.session = requests.Session()
+        # Reintentos acotados ante errores de conexión o servidor saturado (LLM_MAX_RETRIES)
+        retry = Retry(total=max_retries, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504),
+                      allowed_methods=None, raise_on_status=False)
+        self.session.mount("http://", HTTPAdapter(max_retries=retry))
+        self.session.mount("https://", HTTPAdapter(max_retries=retry))
+        self._slots = OrderedDict()  # clave de prefijo -> slot (orden LRU)
+        self._saved = set()
+        self._lock = threading.Lock()
+
+    def _slot_for(self, key: str) -> int:
+        # El slot se elige con el lock tomado; guardar y restaurar son llamadas al servidor y se
+        # hacen después de soltarlo para que un slot lento no frene a las demás consultas
+        acciones = []
+        with self._lock:
+            if key in self._slots:
+                self._slots.move_to_end(key)
+                return self._slots[key]
+            if len(self._slots) < self.n_slots:
+                slot = len(self._slots)
+            else:
+                old_key, slot = self._slots.popitem(last=False)
+                if self.save_slots:
+                    acciones.append(("save", old_key))
+                    self._saved.add(old_key)
+            self._slots[key] = slot
+            if key in self._saved:
+                acciones.append(("restore", key))
+        for action, action_key in acciones:
+            self._slot_action(slot, action, action_key)
+        return slot
+
+    def _slot_action(self, slot: int, action: str, key: str):
+        try:
+            self.session.post(f"{self.base_url}/slots/{slot}?action={action}",
+                              json={"filename": f"{key[:32]}.bin"}, timeout=self.timeout)
+        except requests.RequestException as e:
+            log.warning(f"No se pudo {action} el slot {slot}: {e}")
+
+    def _payload(self, key, prefix, suffix, stream=False):
+        return {
+            "prompt": prefix + suffix,
+            "cache_prompt": True,
+            "id_slot": self._slot_for(key),
+            "n_predict": self.max_tokens,
+            "temperature": self.temperature,
+            "stream": stream,
+        }
+
+    def _post_complete(self, key, prefix, suffix) -> str:
+        response = self.session.post(f"{self.base_url}/completion", json=self._payload(key, prefix, suffix),
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        return response.json().get("content", "")
+
+    def _post_stream(self, key, prefix, suffix):
+        with self.session.post(f"{self.base_url}/completion", json=self._payload(key, prefix, suffix, stream=True),
+                               timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if data.get("content"):
+                        yield data["content"]
+                    if data.get("stop"):
+                        break
+
+    def _request_key(self, key, suffix) -> str:
+        from llm_client import request_key
+        return request_key(self.base_url, key, suffix, self.max_tokens, self.temperature)
+
+    # El endpoint nativo no pasa por LangChain: las etapas "llm" se registran acá y las llamadas
+    # comparten con los clientes de llm_client.py el límite de concurrencia y el single-flight
+    def complete(self, key, prefix, suffix):
+        from llm_client import get_llm_gate
+        with span("llm", backend=self.name) as s:
+            s.add(prompt_chars=len(prefix) + len(suffix))
+            content = get_llm_gate().call(self._request_key(key, suffix),
+                                          partial(self._post_complete, key, prefix, suffix))
+            s.add(completion_chars=len(content))
+            return content
+
+    def stream(self, key, prefix, suffix):
+        from llm_client import get_llm_gate
+        with span("llm", backend=self.name) as s:
+            s.add(prompt_chars=len(prefix) + len(suffix))
+            for content, _ in get_llm_gate().stream(self._request_key(key, suffix),
+                                                    partial(self._post_stream, key, prefix, suffix)):
+                s.add(completion_chars=len(content))
+                yield content
+
+
+class LocalStubBackend(PrefixCacheBackend):
+    """
+    Backend local para pruebas: simula un cache de prefill y cuenta cuántos caracteres
+    habría procesado el servidor. No hace llamadas de red.
+    """
+
+    name = "stub"
+
+    def __init__(self, answer: str = "Respuesta simulada."):
+        self.answer = answer
+        self.cached_prefixes = set()
+        self.prefill_chars = 0
+        self.calls = 0
+
+    def complete(self, key, prefix, suffix):
+        self.calls += 1
+        if key not in self.cached_prefixes:
+            self.prefill_chars += len(prefix)
+            self.cached_prefixes.add(key)
+        self.prefill_chars += len(suffix)
+        return self.answer
+
+
+class PrefixCacheManager:
+    """
+    Registra prefijos de conocimiento por hash de contenido y ejecuta las preguntas sobre
+    ellos a través del backend. El prefijo se envía siempre idéntico para que el servidor
+    pague el prefill una sola vez.
+    """
+
+    def __init__(self, backend: PrefixCacheBackend, max_prefixes: int = 64):
+        self.backend = backend
+        self.max_prefixes = max_prefixes
+        self._prefixes = OrderedDict()  # clave -> ya procesado por el servidor (orden LRU)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prefill_chars_reused = 0
+
+    def register(self, prefix: str) -> str:
+        """Registra el prefijo (sin enviarlo) y devuelve su clave."""
+        key = prefix_key(prefix)
+        with self._lock:
+            self._touch(key)
+        return key
+
+    def _touch(self, key: str, prefilled: bool = False) -> bool:
+        # Devuelve si el prefijo ya había sido procesado por el servidor
+        was_prefilled = self._prefixes.get(key, False)
+        self._prefixes[key] = was_prefilled or prefilled
+        self._prefixes.move_to_end(key)
+        while len(self._prefixes) > self.max_prefixes:
+            self._prefixes.popitem(last=False)
+        return was_prefilled
+
+    def _resolve(self, prefix: str) -> str:
+        key = prefix_key(prefix)
+        with self._lock:
+            if self._touch(key, prefilled=True):
+                self.hits += 1
+                self.prefill_chars_reused += len(prefix)
+            else:
+                self.misses += 1
+        return key
+
+    def complete(self, prefix: str, suffix: str) -> str:
+        return self.backend.complete(self._resolve(prefix), prefix, suffix)
+
+    def stream(self, prefix: str, suffix: str):
+        key = self._resolve(prefix)
+        yield from self.backend.stream(key, prefix, suffix)
+
+    def stats(self) -> dict:
+        return {"backend": self.backend.name, "hits": self.hits, "misses": self.misses,
+                "prefill_chars_reused": self.prefill_chars_reused}
+
+
+def build_backend(llm, openai_api_base: str) -> PrefixCacheBackend:
+    """Backend según PREFIX_CACHE_BACKEND: openai (por defecto), llamacpp o stub."""
+    backend = (get_env_var("PREFIX_CACHE_BACKEND") or "openai").lower()
+    if backend == "llamacpp":
+        return LlamaCppSlotBackend(
+            get_env_var("LLAMACPP_BASE_URL") or openai_api_base,
+            n_slots=get_env_int("PREFIX_CACHE_SLOTS", 4),
+            timeout=get_env_float("LLM_TIMEOUT", 300.0),
+            max_retries=get_env_int("LLM_MAX_RETRIES", 2),
+            save_slots=(get_env_var("PREFIX_CACHE_SAVE_SLOTS") or "0") == "1",
+        )
+    if backend == "stub":
+        return LocalStubBackend()
+    return OpenAICompatBackend(llm)
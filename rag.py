@@ -1,154 +1,601 @@
 import os
-import requests
-import json
 import re
-from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader, Docx2txtLoader
+import time
+import shutil
+import threading
+import contextvars
+from typing import Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, OpenAI
 from langchain_community.vectorstores import Chroma
 from langchain.chains import RetrievalQA
-from helpers import get_env_var
+from helpers import get_env_var, get_env_int, get_env_float
 from langchain.schema import Document
+from manifest import SHARDS_DIRNAME, CollectionManifest, sha256_file
+from embeddings import LMStudioEmbeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from legal_index import (ArticleIndex, BM25Index, ShardedBM25, detectar_leyes, ley_base,
+                         reciprocal_rank_fusion)
+from context_packer import get_token_counter, pack
+from tracing import get_logger, span
+from llm_client import get_llm
+from legal_splitter import HierarchicalSplitter
+from dedup import SEP, ChunkDeduplicator, agregar_fuente, quitar_fuente
+from parsing import parse_document, parse_documents, list_supported_files, as_documents, iter_pages
 
-# Wrapper manual para embeddings LM Studio
-class LMStudioEmbeddings:
-    def __init__(self, api_base, model_name):
-        self.url = f"{api_base}/embeddings"
-        self.model = model_name
-
-    def embed_documents(self, texts):
-        payload = {
-            "model": self.model,
-            "input": texts
-        }
-        headers = {"Content-Type": "application/json"}
-        response = requests.post(self.url, data=json.dumps(payload), headers=headers)
-        if response.status_code != 200:
-            raise Exception(f"Embeddings error: {response.status_code} - {response.text}")
-        data = response.json()
-        return [item["embedding"] for item in data["data"]]
-
-    def embed_query(self, text):
-        return self.embed_documents([text])[0]
-
-
-def split_by_articulos(text):
-    # Divide el texto por artículos (Art. 1, ARTÍCULO 1, etc. variantes)
-    pattern = r"(?im)(art[íi]culo\s*\d+[\wº°]*|art\.\s*\d+[\wº°]*)"
-    matches = list(re.finditer(pattern, text))
-    articulos = []
-    for i, match in enumerate(matches):
-        start = match.start()
-        end = matches[i+1].start() if i+1 < len(matches) else len(text)
-        articulo_text = text[start:end].strip()
-        if articulo_text:
-            articulos.append(articulo_text)
-    # DEBUG: Mostrar los primeros artículos extraídos
-    print("[DEBUG] Primeros artículos extraídos:")
-    for idx, art in enumerate(articulos[:10]):
-        print(f"[ART {idx+1}] {art[:120].replace('\n',' ')} ...")
-    print(f"[DEBUG] Total artículos extraídos: {len(articulos)}")
-    return articulos if articulos else [text]
-
-
-def load_all_documents(data_dir: str):
-    loaders = [
-        (".txt", TextLoader),
-        (".pdf", PyPDFLoader),
-        (".docx", Docx2txtLoader)
-    ]
-    docs = []
-    for ext, Loader in loaders:
-        loader = DirectoryLoader(data_dir, glob=f"*{ext}", loader_cls=Loader)
-        loaded = loader.load()
-        # Si es legislación, dividir por artículos
-        for d in loaded:
+# Versión del formato de chunks/metadata: si cambia, las colecciones existentes se reconstruyen
+INGEST_VERSION = 4
+
+log = get_logger("rag")
+
+
+def is_legislation_source(source: str) -> bool:
+    # Si el nombre del archivo sugiere código/ley, se divide por artículos
+    filename = source.lower()
+    return any(x in filename for x in ["codigo", "código", "ley", "constitucion", "cpc"])
+
+
+def list_corpus_files(data_dir: str) -> list:
+    return list_supported_files(data_dir)
+
+
+def shard_files(data_dir: str) -> dict:
+    """
+    Archivos del corpus agrupados por ley (ley_base): un shard por ley, con todas sus ediciones
+    o copias juntas para que la deduplicación las siga encontrando.
+    """
+    grupos = {}
+    for path in list_corpus_files(data_dir):
+        grupos.setdefault(ley_base(path) or "otros", []).append(path)
+    return grupos
+
+
+def prune_shards(persist_dir: str, leyes) -> None:
+    """Elimina los shards de leyes que ya no tienen archivos en el corpus."""
+    shards_dir = os.path.join(persist_dir, SHARDS_DIRNAME)
+    if not os.path.isdir(shards_dir):
+        return
+    for ley in os.listdir(shards_dir):
+        if ley not in leyes:
+            log.info(f"{persist_dir}: se elimina el shard {ley} (sin archivos)")
+            shutil.rmtree(os.path.join(shards_dir, ley), ignore_errors=True)
+
+
+def iter_legislation_chunks(path: str, pages: list = None):
+    """
+    Chunks (texto, metadata) de un archivo de legislación, uno por artículo (o por parte de
+    un artículo largo) con ley, libro, título, capítulo, sección, artículo y página.
+    Sin páginas ya extraídas, lee el archivo página por página (del cache de texto extraído si
+    no cambió): la memoria no crece con su tamaño.
+    """
+    if pages is None:
+        pages = iter_pages(path)
+    elif path.lower().endswith(".pdf"):
+        pages = ((i + 1, text) for i, text in enumerate(pages))
+    else:
+        pages = ((None, text) for text in pages)
+    splitter = HierarchicalSplitter(max_chars=get_env_int("LEGAL_CHUNK_CHARS", 2000))
+    for text, meta in splitter.split(pages, source=path):
+        # Recortar textos a 8191 caracteres (límite de modelos de embeddings)
+        yield text[:8191], meta
+
+
+def load_file_documents(path: str, pages: list = None) -> list:
+    # Si es legislación, dividir por artículos conservando ley, jerarquía, número y epígrafe
+    if is_legislation_source(path):
+        return [Document(page_content=text, metadata=meta) for text, meta in iter_legislation_chunks(path, pages)]
+    if pages is None:
+        pages = parse_document(path)
+    return [d for d in as_documents(path, pages) if isinstance(d.page_content, str) and d.page_content]
+
+
+def split_documents(docs: list) -> list:
+    """Divide los documentos en chunks y devuelve pares (texto, metadata) válidos para embeddings."""
+    with span("split") as s:
+        # La legislación ya viene dividida por artículos: solo se subdivide el resto
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        articulos = [d for d in docs if is_legislation_source(d.metadata.get("source", ""))]
+        otros = [d for d in docs if not is_legislation_source(d.metadata.get("source", ""))]
+        splits = articulos + splitter.split_documents(otros)
+        chunks = []
+        for d in splits:
             content = getattr(d, 'page_content', None)
             meta = getattr(d, 'metadata', {})
-            if content and isinstance(content, str):
-                # Si el nombre del archivo sugiere código/ley, dividir por artículos
-                filename = meta.get('source', '').lower()
-                if any(x in filename for x in ["codigo", "código", "ley", "constitucion", "cpc"]):
-                    articulos = split_by_articulos(content)
-                    for art in articulos:
-                        docs.append(Document(page_content=art, metadata=meta))
-                else:
-                    docs.append(d)
-    return docs
-
-
-def build_rag_chain(data_dir: str, persist_path: str = None):
-    # Cargar documentos
-    docs = load_all_documents(data_dir)
-    # Split
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    splits = splitter.split_documents(docs)
-    # Filtrado de splits para asegurar que el contenido es string y no None
-    valid_texts = []
-    valid_metadatas = []
-    for d in splits:
-        content = getattr(d, 'page_content', None)
-        meta = getattr(d, 'metadata', {})
-        if isinstance(content, str):
-            content = content.strip()
-            if content:
-                valid_texts.append(content)
-                valid_metadatas.append(meta if isinstance(meta, dict) else {})
-    # DEBUG: Mostrar tipos y longitud
-    print(f"[DEBUG] valid_texts: {len(valid_texts)} elementos, tipos: {[type(t) for t in valid_texts][:5]}")
-    print(f"[DEBUG] valid_metadatas: {len(valid_metadatas)} elementos")
-    if len(valid_texts) != len(valid_metadatas):
-        min_len = min(len(valid_texts), len(valid_metadatas))
-        valid_texts = valid_texts[:min_len]
-        valid_metadatas = valid_metadatas[:min_len]
+            if isinstance(content, str):
+                content = content.strip()
+                if content:
+                    # Recortar textos a 8191 caracteres (límite de modelos de embeddings)
+                    chunks.append((content[:8191], meta if isinstance(meta, dict) else {}))
+        s.add(docs=len(docs), chunks=len(chunks), chars=sum(len(text) for text, _ in chunks))
+        return chunks
 
-    # Embeddings y vectorstore
-    embeddings = LMStudioEmbeddings(
-        api_base=get_env_var("OPENAI_API_BASE"),
-        model_name=get_env_var("EMBEDDING_MODEL_NAME")
-    )
-    persist_dir = persist_path or "chroma_db"
-    os.makedirs(persist_dir, exist_ok=True)
-    # Solo pasar strings planos
-    valid_texts = [t for t in valid_texts if isinstance(t, str)]
-    # Recortar textos a 8191 caracteres (límite de modelos de embeddings)
-    texts_for_embeddings = [t[:8191] for t in valid_texts if isinstance(t, str) and t.strip()]
-    print(f"DEBUG: tipos y longitud de textos para embeddings: {[type(t) for t in texts_for_embeddings]}, {len(texts_for_embeddings)}")
-    print("DEBUG: texts_for_embeddings =", texts_for_embeddings)
-    print("DEBUG: type(texts_for_embeddings) =", type(texts_for_embeddings))
-    if texts_for_embeddings:
-        print("DEBUG: type(texts_for_embeddings[0]) =", type(texts_for_embeddings[0]))
-    for idx, t in enumerate(texts_for_embeddings):
-        print(f"[DEBUG] Texto {idx}: longitud={len(t)}, inicio='{t[:60]}', fin='{t[-60:]}'")
-    texts_for_embeddings = [str(t) for t in texts_for_embeddings if t and isinstance(t, str)]
-    print("DEBUG: texts_for_embeddings (final) =", texts_for_embeddings)
-    # Obtener embeddings manualmente
-    all_embeddings = embeddings.embed_documents(texts_for_embeddings)
-    
-    # Crear Chroma usando la función de embeddings personalizada
-    docs_for_chroma = [
-        Document(page_content=text, metadata=meta)
-        for text, meta in zip(texts_for_embeddings, valid_metadatas)
-    ]
-    vectordb = Chroma.from_documents(
-        docs_for_chroma,
-        embeddings,
-        persist_directory=persist_dir
+
+def sync_collection(vectordb, data_dir: str, persist_dir: str, embedding_model: str,
+                    backend: str = "chroma", files: list = None) -> CollectionManifest:
+    """
+    Sincroniza la colección con los archivos de data_dir (o solo con files, los de un shard)
+    usando el manifiesto: archivos sin cambios se omiten, los modificados reemplazan sus chunks,
+    los eliminados se purgan y solo se embeben los chunks nuevos que no dupliquen
+    (exacta o casi exactamente) a uno ya almacenado.
+    """
+    manifest = CollectionManifest(persist_dir)
+    if (not manifest.exists() or manifest.embedding_model != embedding_model
+            or manifest.ingest_version != INGEST_VERSION or manifest.backend != backend):
+        # Colección previa sin manifiesto (o con otro modelo/formato/backend): sus ids no son rastreables, se reinicia
+        stale_ids = vectordb.get(include=[])["ids"]
+        if stale_ids:
+            log.info(f"Reiniciando colección {persist_dir}: {len(stale_ids)} vectores sin manifiesto válido")
+            vectordb.delete(ids=stale_ids)
+        manifest.files = {}
+        manifest.embedding_model = embedding_model
+        manifest.ingest_version = INGEST_VERSION
+        manifest.backend = backend
+    dedup = open_deduplicator(vectordb, persist_dir, manifest)
+
+    nuevos, modificados, eliminados, sin_cambios = manifest.diff(list_corpus_files(data_dir) if files is None else files)
+    log.info(f"{persist_dir}: {len(nuevos)} nuevos, {len(modificados)} modificados, "
+             f"{len(eliminados)} eliminados, {len(sin_cambios)} sin cambios")
+
+    for path in modificados + eliminados:
+        ids = manifest.forget(path)
+        # Un chunk que otro archivo también contiene (deduplicado) se conserva sin esta fuente
+        compartidos = set(ids) & set(manifest.all_chunk_ids())
+        obsoletos = [cid for cid in dict.fromkeys(ids) if cid not in compartidos]
+        if obsoletos:
+            vectordb.delete(ids=obsoletos)
+            if dedup:
+                dedup.remove(obsoletos)
+        if compartidos:
+            stored = vectordb.get(ids=list(compartidos), include=["metadatas"])
+            update_metadatas(vectordb, stored["ids"], [quitar_fuente(m, path) for m in stored["metadatas"]])
+
+    # La legislación se ingiere en streaming; el resto se parsea en paralelo
+    legislacion = [p for p in nuevos + modificados if is_legislation_source(p)]
+    parsed = parse_documents([p for p in nuevos + modificados if p not in legislacion])
+    for path in nuevos + modificados:
+        if path in legislacion:
+            chunks = iter_legislation_chunks(path)
+        elif path in parsed:
+            chunks = split_documents(load_file_documents(path, parsed[path]))
+        else:
+            continue
+        file_hash = sha256_file(path)
+        try:
+            ids = store_chunks(vectordb, path, file_hash, chunks, dedup)
+        except Exception as e:
+            log.error(f"No se pudo cargar el archivo {path}: {e}")
+            continue
+        manifest.record(path, ids, sha256=file_hash)
+
+    manifest.save()
+    if dedup:
+        dedup.save()
+        if dedup.stats["embeddings_ahorrados"]:
+            log.info(f"{persist_dir}: deduplicación acumulada: {dedup.stats['exactos']} exactos, "
+                     f"{dedup.stats['similares']} similares, {dedup.stats['embeddings_ahorrados']} embeddings "
+                     f"y {dedup.stats['bytes_ahorrados']} bytes ahorrados")
+    return manifest
+
+
+def sync_shards(data_dir: str, persist_dir: str, embeddings, embedding_model: str, backend: str = "chroma") -> dict:
+    """
+    Colección partida por ley: un índice por shard en persist_dir/shards/<ley>, cada uno con su
+    manifiesto (agregar un código solo ingiere su shard). La deduplicación es dentro de cada shard,
+    que reúne las ediciones de una misma ley.
+    Devuelve {ley: vectordb}.
+    """
+    grupos = shard_files(data_dir)
+    prune_shards(persist_dir, grupos)
+    shards = {}
+    for ley, files in sorted(grupos.items()):
+        shard_dir = os.path.join(persist_dir, SHARDS_DIRNAME, ley)
+        os.makedirs(shard_dir, exist_ok=True)
+        shards[ley] = open_vectorstore(shard_dir, embeddings, backend)
+        sync_collection(shards[ley], data_dir, shard_dir, embedding_model, backend=backend, files=files)
+    return shards
+
+
+def open_deduplicator(vectordb, persist_dir: str, manifest: CollectionManifest):
+    """
+    Índice de duplicados de la colección (None con DEDUP=0). Si falta o no coincide con los
+    chunks del manifiesto (p. ej. se ingirió con DEDUP=0), se reconstruye desde la colección.
+    """
+    if (get_env_var("DEDUP") or "1") == "0":
+        return None
+    dedup = ChunkDeduplicator(persist_dir, threshold=get_env_float("DEDUP_THRESHOLD", 0.9),
+                              num_perm=get_env_int("DEDUP_NUM_PERM", 64))
+    if not dedup.loaded or dedup.stored_ids() != set(manifest.all_chunk_ids()):
+        dedup.reset()
+        stored = vectordb.get(include=["documents", "metadatas"])
+        if stored["ids"]:
+            log.info(f"{persist_dir}: reconstruyendo índice de duplicados ({len(stored['ids'])} chunks)")
+            dedup.rebuild(stored["ids"], stored["documents"], stored["metadatas"])
+    return dedup
+
+
+def update_metadatas(vectordb, ids: list, metadatas: list):
+    """Actualiza solo la metadata de chunks existentes (sin volver a embeber)."""
+    if not ids:
+        return
+    if hasattr(vectordb, "update_metadatas"):
+        vectordb.update_metadatas(ids, metadatas)
+    else:
+        vectordb._collection.update(ids=ids, metadatas=metadatas)
+
+
+def store_chunks(vectordb, path: str, file_hash: str, chunks, dedup=None) -> list:
+    """
+    Embebe y guarda los chunks de un archivo a medida que llegan, en lotes de INGEST_BATCH:
+    con un iterador (legislación en streaming) en memoria solo está el lote actual.
+    Los duplicados de un chunk ya almacenado no se embeben: el conservado suma esta fuente
+    en su metadata y su id queda registrado también para este archivo.
+    Devuelve los ids de los chunks del archivo, propios y compartidos.
+    """
+    batch_size = get_env_int("INGEST_BATCH", 256)
+    # Ids deterministas por contenido: el mismo archivo genera siempre los mismos ids
+    prefix = file_hash[:16]
+    ids, propios, batch = [], [], []
+    punteros = {}  # id conservado ya almacenado -> metadatas de sus duplicados en este archivo
+
+    def flush():
+        vectordb.add_texts(texts=[t for _, t, _ in batch], metadatas=[m for _, _, m in batch],
+                           ids=[cid for cid, _, _ in batch])
+        propios.extend(cid for cid, _, _ in batch)
+        batch.clear()
+
+    with span("store", archivo=os.path.basename(path)) as s:
+        pendientes = {}  # id conservado del lote actual -> posición en batch
+        try:
+            for i, (text, meta) in enumerate(chunks):
+                cid = f"{prefix}-{i}"
+                s.add(chars=len(text))
+                if dedup:
+                    clave = str(meta.get("articulo", ""))
+                    original, tipo, digest, signature = dedup.find(text, clave)
+                    if original is not None:
+                        dedup.count_saved(tipo, text)
+                        s.add(dedup_exactos=int(tipo == "exacto"), dedup_similares=int(tipo == "similar"),
+                              bytes_ahorrados=len(text.encode("utf-8")))
+                        if original in pendientes:
+                            pos = pendientes[original]
+                            batch[pos] = (original, batch[pos][1], agregar_fuente(batch[pos][2], meta))
+                        else:
+                            punteros.setdefault(original, []).append(meta)
+                        ids.append(original)
+                        continue
+                    dedup.add(cid, digest, signature, clave)
+                    pendientes[cid] = len(batch)
+                batch.append((cid, text, meta))
+                ids.append(cid)
+                if len(batch) >= batch_size:
+                    flush()
+                    pendientes.clear()
+            if batch:
+                flush()
+            if punteros:
+                stored = vectordb.get(ids=list(punteros), include=["metadatas"])
+                metas = []
+                for cid, meta in zip(stored["ids"], stored["metadatas"]):
+                    for duplicado in punteros[cid]:
+                        meta = agregar_fuente(meta, duplicado)
+                    metas.append(meta)
+                update_metadatas(vectordb, stored["ids"], metas)
+        except Exception:
+            # Sin registro en el manifiesto los lotes ya agregados quedarían huérfanos
+            if propios:
+                vectordb.delete(ids=propios)
+            if dedup:
+                dedup.remove([cid for cid in ids if cid.startswith(prefix)])
+            raise
+        ids = list(dict.fromkeys(ids))
+        s.add(chunks=len(propios))
+    log.info(f"{path}: {len(propios)} chunks nuevos, {len(ids) - len(propios)} compartidos con otros archivos")
+    return ids
+
+
+def _doc_key(doc) -> tuple:
+    return (doc.metadata.get("source"), doc.page_content)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever para legislación: las citas exactas ("art. 14 de la Constitución") se
+    resuelven con el índice de artículos sin embeber la consulta; el resto combina la
+    búsqueda vectorial con BM25 mediante reciprocal rank fusion.
+    """
+    vector_retriever: BaseRetriever
+    article_index: ArticleIndex
+    bm25: Union[BM25Index, ShardedBM25]
+    k: int = 4
+    max_exact: int = 8
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list:
+        with span("article_lookup") as s:
+            exact = self.article_index.lookup(query)
+            s.add(docs=len(exact))
+        if exact:
+            return exact[:self.max_exact]
+        vector_docs = self.vector_retriever.invoke(query)
+        with span("bm25_search") as s:
+            lexical_docs = [doc for doc, _ in self.bm25.search(query, self.k * 2)]
+            s.add(docs=len(lexical_docs))
+        fused = reciprocal_rank_fusion([vector_docs, lexical_docs], key=_doc_key)
+        return fused[:self.k]
+
+
+class PackedRetriever(BaseRetriever):
+    """
+    Envuelve un retriever: pide más candidatos de los que entran, elimina los chunks
+    solapados y devuelve los más relevantes que caben en el presupuesto de tokens.
+    """
+    base_retriever: BaseRetriever
+    budget: int = 1500
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list:
+        # El orden del retriever base (vectorial/RRF) pesa igual que BM25 al elegir
+        with span("vector_search") as s:
+            docs = self.base_retriever.invoke(query)
+            s.add(docs=len(docs))
+        with span("prompt_build") as s:
+            textos = [d.page_content for d in docs]
+            grupos = [d.metadata.get("source") for d in docs]
+            elegidos = pack(query, textos, self.budget, grupos=grupos)
+            s.add(docs=len(elegidos), chars=sum(len(t) for _, t in elegidos),
+                  tokens=sum(get_token_counter().count(t) for _, t in elegidos))
+        return [Document(page_content=texto, metadata=docs[i].metadata) for i, texto in elegidos]
+
+
+def search_by_vector(vectordb, vector, k: int) -> list:
+    """[(Document, score)] para una consulta ya embebida; en ambos backends, mayor score = más similar."""
+    if isinstance(vectordb, Chroma):
+        # Chroma devuelve distancias: se invierten para poder mezclar shards por score
+        return [(doc, -distancia) for doc, distancia in
+                vectordb.similarity_search_by_vector_with_relevance_scores(vector, k=k)]
+    return vectordb.similarity_search_by_vector_with_score(vector, k=k)
+
+
+class ShardStats:
+    """Latencias recientes por shard (ventana deslizante) y consultas filtradas por ley vs. enviadas a todos."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self.window = window
+        self.filtradas = 0
+        self.todas = 0
+
+    def add(self, ley: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(ley, deque(maxlen=self.window)).append(seconds)
+
+    def routed(self, filtrada: bool):
+        with self._lock:
+            if filtrada:
+                self.filtradas += 1
+            else:
+                self.todas += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            samples = {ley: sorted(v) for ley, v in self._samples.items()}
+            out = {"consultas_filtradas": self.filtradas, "consultas_todos": self.todas, "shards": {}}
+        for ley, values in sorted(samples.items()):
+            def pct(p):
+                return round(values[min(int(p * len(values)), len(values) - 1)] * 1000, 1)
+            out["shards"][ley] = {"n": len(values), "p50_ms": pct(0.50), "p95_ms": pct(0.95), "max_ms": pct(1.0)}
+        return out
+
+
+_shard_lock = threading.Lock()
+
+
+def get_shard_stats() -> ShardStats:
+    if not hasattr(get_shard_stats, "instance"):
+        with _shard_lock:
+            if not hasattr(get_shard_stats, "instance"):
+                get_shard_stats.instance = ShardStats()
+    return get_shard_stats.instance
+
+
+def get_shard_pool() -> ThreadPoolExecutor:
+    """Hilos compartidos para consultar varios shards a la vez (RAG_SHARD_WORKERS)."""
+    if not hasattr(get_shard_pool, "instance"):
+        with _shard_lock:
+            if not hasattr(get_shard_pool, "instance"):
+                get_shard_pool.instance = ThreadPoolExecutor(max_workers=max(get_env_int("RAG_SHARD_WORKERS", 8), 1),
+                                                             thread_name_prefix="shard")
+    return get_shard_pool.instance
+
+
+def shard_stats() -> dict:
+    return get_shard_stats().as_dict()
+
+
+class ShardedRetriever(BaseRetriever):
+    """
+    Búsqueda vectorial sobre una colección partida por ley: la consulta se embebe una sola vez;
+    si nombra leyes ("según el CPC") solo se buscan sus shards y, si no, se consultan todos en
+    paralelo. Los top-k de cada shard se mezclan por score.
+    """
+    shards: dict
+    k: int = 4
+
+    def _search(self, ley: str, vector) -> list:
+        t0 = time.perf_counter()
+        with span("shard_search", ley=ley) as s:
+            hits = search_by_vector(self.shards[ley], vector, self.k)
+            s.add(docs=len(hits))
+        get_shard_stats().add(ley, time.perf_counter() - t0)
+        return hits
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list:
+        if not self.shards:
+            return []
+        leyes = detectar_leyes(query, self.shards)
+        destino = leyes or sorted(self.shards)
+        get_shard_stats().routed(bool(leyes))
+        with span("shard_fanout", shards=len(destino), filtrada=bool(leyes)) as s:
+            vector = next(iter(self.shards.values())).embeddings.embed_query(query)
+            if len(destino) == 1:
+                results = [self._search(destino[0], vector)]
+            else:
+                # Cada búsqueda corre con una copia del contexto: sus etapas quedan dentro de esta consulta
+                pool = get_shard_pool()
+                futures = [pool.submit(contextvars.copy_context().run, self._search, ley, vector) for ley in destino]
+                results = [future.result() for future in futures]
+            hits = sorted((hit for result in results for hit in result), key=lambda hit: hit[1], reverse=True)
+            s.add(docs=min(len(hits), self.k))
+        return [doc for doc, _ in hits[:self.k]]
+
+
+def article_keys(meta: dict) -> list:
+    """(ley, artículo) por los que el índice de artículos encuentra un chunk, incluidos los de ediciones deduplicadas."""
+    keys = []
+    if meta.get("articulo") and meta.get("ley"):
+        keys.append((meta["ley"], str(meta["articulo"])))
+    # Artículos de otras ediciones deduplicados contra este chunk
+    for alias in filter(None, (meta.get("duplicados") or "").split(SEP)):
+        ley, _, articulo = alias.rpartition(":")
+        keys.append((ley, articulo))
+    return keys
+
+
+def article_table(vectordb) -> dict:
+    """Tabla {"ley:artículo": [ids]} de la colección, para guardarla junto al índice (bundle.py)."""
+    table = {}
+    stored = vectordb.get(include=["metadatas"])
+    for cid, meta in zip(stored["ids"], stored["metadatas"]):
+        for ley, articulo in article_keys(meta or {}):
+            table.setdefault(f"{ley}:{articulo}", []).append(cid)
+    return table
+
+
+def build_legal_indexes(vectordb, articulos: dict = None):
+    """
+    Construye el índice de artículos y el índice BM25 a partir de lo almacenado en la colección (sin embeddings).
+    Con articulos (tabla de article_table ya calculada) no se recorre la metadata de cada chunk.
+    """
+    article_index = ArticleIndex()
+    bm25 = BM25Index()
+    stored = vectordb.get(include=["documents", "metadatas"])
+    docs_by_id = {}
+    for cid, text, meta in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+        doc = Document(page_content=text, metadata=meta or {})
+        bm25.add(text, doc)
+        if articulos is None:
+            for ley, articulo in article_keys(doc.metadata):
+                article_index.add(ley, articulo, doc)
+        else:
+            docs_by_id[cid] = doc
+    for clave, ids in (articulos or {}).items():
+        ley, _, articulo = clave.rpartition(":")
+        for cid in ids:
+            if cid in docs_by_id:
+                article_index.add(ley, articulo, docs_by_id[cid])
+    log.info(f"Índices legales: {len(article_index)} artículos, {len(bm25)} chunks en BM25")
+    return article_index, bm25
+
+
+def build_sharded_legal_indexes(shards: dict, articulos: dict = None):
+    """
+    Índices legales de una colección partida por ley: un solo índice de artículos (ya resuelve
+    la ley citada) y un BM25 por shard. articulos: {ley: tabla de article_table} del bundle.
+    """
+    article_index = ArticleIndex()
+    bm25 = {}
+    for ley, vectordb in shards.items():
+        shard_articles, bm25[ley] = build_legal_indexes(vectordb, (articulos or {}).get(ley))
+        article_index.update(shard_articles)
+    return article_index, ShardedBM25(bm25)
+
+
+def open_vectorstore(persist_dir: str, embeddings, backend: str = "chroma"):
+    """
+    Vectorstore de la colección: "chroma" (por defecto) o "mmap", el índice local en memory-map
+    de vector_store.py (VECTOR_DTYPE=float32|int8) para colecciones de solo lectura compartidas
+    entre procesos. Ambos exponen la misma interfaz de retriever.
+    """
+    if backend == "mmap":
+        from vector_store import MmapVectorStore
+        return MmapVectorStore(os.path.join(persist_dir, "mmap"), embeddings,
+                               dtype=(get_env_var("VECTOR_DTYPE") or "float32").lower())
+    if backend != "chroma":
+        raise ValueError(f"VECTOR_BACKEND no soportado: {backend} (chroma o mmap)")
+    return Chroma(
+        persist_directory=persist_dir,
+        embedding_function=embeddings
     )
-    # LLM
-    llm = OpenAI(
-        openai_api_key=get_env_var("OPENAI_API_KEY"),
-        openai_api_base=get_env_var("OPENAI_API_BASE"),
-        model_name=get_env_var("MODEL_NAME")
+
+
+def get_embeddings(embedding_model: str = None):
+    return LMStudioEmbeddings(
+        api_base=get_env_var("OPENAI_API_BASE"),
+        model_name=embedding_model or get_env_var("EMBEDDING_MODEL_NAME")
     )
+
+
+def make_rag_chain(vectordb, legal_indexes: tuple = None):
+    """
+    Cadena RetrievalQA sobre una colección ya abierta ({ley: vectordb} si está partida por ley);
+    con legal_indexes, recuperación híbrida.
+    """
+    # LLM compartido (pool HTTP, límite de concurrencia y single-flight de llm_client.py)
+    llm = get_llm()
+    # Se piden más candidatos de los que entran: el empaquetador elige por relevancia y presupuesto de tokens
+    candidates = get_env_int("RAG_CANDIDATES", 8)
+    if isinstance(vectordb, dict):
+        retriever = ShardedRetriever(shards=vectordb, k=candidates)
+    else:
+        retriever = vectordb.as_retriever(search_kwargs={"k": candidates})
+    if legal_indexes:
+        article_index, bm25 = legal_indexes
+        retriever = HybridRetriever(vector_retriever=retriever, article_index=article_index, bm25=bm25, k=candidates)
+    retriever = PackedRetriever(base_retriever=retriever, budget=get_env_int("RAG_CONTEXT_TOKENS", 1500))
     # RetrievalQA chain
     qa_chain = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
-        retriever=vectordb.as_retriever()
+        retriever=retriever
     )
     return qa_chain
 
+
+def build_rag_chain(data_dir: str, persist_path: str = None, hybrid: bool = False, sharded: bool = False):
+    # Embeddings y vectorstore
+    embedding_model = get_env_var("EMBEDDING_MODEL_NAME")
+    embeddings = get_embeddings(embedding_model)
+    persist_dir = persist_path or "chroma_db"
+    os.makedirs(persist_dir, exist_ok=True)
+    # Reabrir la colección persistente y embeber solo lo que cambió
+    backend = (get_env_var("VECTOR_BACKEND") or "chroma").lower()
+    if sharded:
+        with span("ingest", coleccion=persist_dir):
+            shards = sync_shards(data_dir, persist_dir, embeddings, embedding_model, backend=backend)
+        return make_rag_chain(shards, build_sharded_legal_indexes(shards) if hybrid else None)
+    vectordb = open_vectorstore(persist_dir, embeddings, backend)
+    with span("ingest", coleccion=persist_dir):
+        sync_collection(vectordb, data_dir, persist_dir, embedding_model, backend=backend)
+    return make_rag_chain(vectordb, build_legal_indexes(vectordb) if hybrid else None)
+
+
+def bundle_rag_chain(bundle, coleccion: str, hybrid: bool = False):
+    """
+    Cadena sobre una colección de un bundle de índices (bundle.py): no lee docs/ ni embebe
+    documentos. Si la colección se armó partida por ley, se sirve partida por ley.
+    """
+    with span("bundle_open", coleccion=coleccion):
+        leyes = bundle.shards(coleccion)
+        if leyes:
+            embeddings = get_embeddings(bundle.embedding_model)
+            shards = {ley: bundle.open_collection(coleccion, embeddings, ley) for ley in leyes}
+            articulos = {ley: bundle.article_table(coleccion, ley) for ley in leyes} if hybrid else None
+            return make_rag_chain(shards, build_sharded_legal_indexes(shards, articulos) if hybrid else None)
+        vectordb = bundle.open_collection(coleccion, get_embeddings(bundle.embedding_model))
+        legal_indexes = build_legal_indexes(vectordb, bundle.article_table(coleccion)) if hybrid else None
+    return make_rag_chain(vectordb, legal_indexes)
+
 if __name__ == "__main__":
     data_dir = os.path.join("docs", "clientes")
     print("Construyendo pipeline RAG sobre:", data_dir)
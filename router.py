@@ -0,0 +1,166 @@
+import math
+import threading
+from collections import Counter
+from helpers import get_env_var, get_env_float
+from legal_index import CITA_PATTERN, tokenize
+from docx_fill import es_pedido_de_generacion
+from tracing import get_logger, span
+
+log = get_logger("router")
+
+TOOL_CLIENTES = "Buscar en clientes"
+TOOL_LEGISLACION = "Buscar en legislación y códigos"
+TOOL_PLANTILLAS = "Consultar/generar plantilla"
+
+# Consultas de ejemplo por herramienta (se suman a la descripción de cada Tool para entrenar)
+ROUTER_EXAMPLES = {
+    TOOL_CLIENTES: [
+        "¿cuál es el domicilio del cliente?",
+        "datos del expediente del cliente",
+        "qué documentos presentó el cliente",
+        "DNI y CUIT del cliente",
+        "estado del expediente de Pérez",
+        "fecha de la audiencia del cliente",
+    ],
+    TOOL_LEGISLACION: [
+        "¿qué dice el artículo 14 de la Constitución?",
+        "plazo de prescripción según el código civil",
+        "requisitos de la demanda en el código procesal",
+        "qué establece la ley de contrato de trabajo sobre despidos",
+        "normativa aplicable a la locación",
+        "art. 2560 del Código Civil y Comercial",
+    ],
+    TOOL_PLANTILLAS: [
+        "genera la demanda de prescripción",
+        "completar la plantilla con los datos del cliente",
+        "redactá el contrato de locación",
+        "prepará el escrito de contestación",
+        "qué campos tiene la plantilla de poder",
+        "armar la carta documento",
+    ],
+}
+
+# Palabras que por sí solas identifican la herramienta
+KEYWORDS = {
+    TOOL_CLIENTES: {"cliente", "clientes", "expediente", "expedientes", "dni", "cuit"},
+    TOOL_LEGISLACION: {"ley", "leyes", "codigo", "codigos", "constitucion", "articulo", "articulos",
+                       "normativa", "decreto", "cpc", "ccyc", "jurisprudencia"},
+    TOOL_PLANTILLAS: {"plantilla", "plantillas", "contrato", "escrito", "modelo", "carta"},
+}
+
+
+class TfidfCentroidClassifier:
+    """Clasificador liviano: centroide TF-IDF por clase y similitud coseno con la consulta."""
+
+    def __init__(self, training: dict):
+        docs = [(label, Counter(tokenize(text))) for label, texts in training.items() for text in texts]
+        n_docs = len(docs)
+        df = Counter(term for _, counts in docs for term in counts)
+        self.idf = {term: math.log((1 + n_docs) / (1 + freq)) + 1 for term, freq in df.items()}
+        self.centroids = {}
+        for label in training:
+            centroid = Counter()
+            for doc_label, counts in docs:
+                if doc_label == label:
+                    for term, weight in self._normalized(counts).items():
+                        centroid[term] += weight
+            self.centroids[label] = self._normalized(centroid)
+
+    def _normalized(self, counts) -> dict:
+        vec = {term: tf * self.idf.get(term, 0.0) for term, tf in counts.items()}
+        norm = math.sqrt(sum(w * w for w in vec.values()))
+        return {term: w / norm for term, w in vec.items()} if norm else {}
+
+    def scores(self, query: str) -> dict:
+        vec = self._normalized(Counter(tokenize(query)))
+        return {label: sum(w * centroid.get(term, 0.0) for term, w in vec.items())
+                for label, centroid in self.centroids.items()}
+
+
+class IntentRouter:
+    """
+    Router de intención delante del agente ReAct: reglas por palabra clave y un clasificador
+    TF-IDF deciden la herramienta cuando la consulta es inequívoca; si no, devuelve None y la
+    consulta sigue por el agente.
+    """
+
+    def __init__(self, tools: list, min_score: float = None, margin: float = None):
+        training = {tool.name: [tool.description] + ROUTER_EXAMPLES.get(tool.name, []) for tool in tools}
+        self.tools = {tool.name: tool for tool in tools}
+        self.classifier = TfidfCentroidClassifier(training)
+        self.min_score = min_score if min_score is not None else get_env_float("ROUTER_MIN_SCORE", 0.25)
+        self.margin = margin if margin is not None else get_env_float("ROUTER_MARGIN", 0.10)
+        self._lock = threading.Lock()
+        self.routed = Counter()
+        self.fallbacks = 0
+        self.llm_calls_saved = 0
+
+    def _rule_matches(self, query: str) -> set:
+        tokens = set(tokenize(query))
+        matches = {name for name, words in KEYWORDS.items() if name in self.tools and tokens & words}
+        if CITA_PATTERN.search(query) and TOOL_LEGISLACION in self.tools:
+            matches.add(TOOL_LEGISLACION)
+        # Pedir que se genere/complete algo prevalece sobre las palabras de las otras herramientas
+        if es_pedido_de_generacion(query) and TOOL_PLANTILLAS in self.tools:
+            return {TOOL_PLANTILLAS}
+        return matches
+
+    def route(self, query: str):
+        """Devuelve (nombre de herramienta | None, motivo)."""
+        rules = self._rule_matches(query)
+        if len(rules) == 1:
+            return next(iter(rules)), "regla"
+        scores = self.classifier.scores(query)
+        candidates = {name: s for name, s in scores.items() if not rules or name in rules}
+        ranked = sorted(candidates.items(), key=lambda kv: kv[1], reverse=True)
+        if not ranked:
+            return None, "sin candidatos"
+        best_name, best = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        if best >= self.min_score and best - second >= self.margin:
+            return best_name, f"clasificador ({best:.2f} vs {second:.2f})"
+        return None, f"ambigua ({best:.2f} vs {second:.2f})"
+
+    def record(self, tool_name, llm_calls_saved: int = 0):
+        with self._lock:
+            if tool_name:
+                self.routed[tool_name] += 1
+                self.llm_calls_saved += llm_calls_saved
+            else:
+                self.fallbacks += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"routed": dict(self.routed), "fallbacks": self.fallbacks,
+                    "llm_calls_saved": self.llm_calls_saved}
+
+
+class RoutedAgent:
+    """
+    Despacha directo a la herramienta cuando el router está seguro y recurre al AgentExecutor
+    en caso contrario, manteniendo la interfaz invoke() del agente.
+    """
+
+    # Un ReAct mínimo hace al menos dos llamadas al LLM: elegir la acción y redactar la respuesta final
+    AGENT_LLM_CALLS = 2
+
+    def __init__(self, executor, router: IntentRouter):
+        self.executor = executor
+        self.router = router
+        self.enabled = (get_env_var("ROUTER") or "1").lower() not in ("0", "false", "no")
+
+    def invoke(self, input, config=None, **kwargs):
+        query = input["input"] if isinstance(input, dict) else input
+        with span("route") as s:
+            tool_name, motivo = self.router.route(query) if self.enabled else (None, "desactivado")
+            s.set(herramienta=tool_name, motivo=motivo)
+        if tool_name is None:
+            self.router.record(None)
+            return self.executor.invoke(input, config=config, **kwargs)
+        log.info(f"Router: '{tool_name}' por {motivo}")
+        output = self.router.tools[tool_name].invoke(query, config=config)
+        self.router.record(tool_name, self.AGENT_LLM_CALLS)
+        return {"input": query, "output": str(output)}
+
+    def __getattr__(self, name):
+        return getattr(self.executor, name)
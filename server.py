@@ -0,0 +1,258 @@
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from helpers import get_env_int, get_env_float
+from tracing import get_logger, get_tracer, span
+
+log = get_logger("server")
+
+
+class LatencyStats:
+    """Latencias recientes por endpoint (ventana deslizante) con percentiles."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self.window = window
+
+    def add(self, endpoint: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+
+    def summary(self) -> dict:
+        with self._lock:
+            samples = {k: sorted(v) for k, v in self._samples.items()}
+        out = {}
+        for endpoint, values in samples.items():
+            def pct(p):
+                return round(values[min(int(p * len(values)), len(values) - 1)] * 1000, 1)
+            out[endpoint] = {"n": len(values), "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99)}
+        return out
+
+
+class AdmissionPool:
+    """
+    Pool acotado de workers con cola de admisión: acepta hasta workers + queue_size
+    solicitudes simultáneas y rechaza el resto en lugar de acumularlas sin límite.
+    Una solicitud que vence mientras espera en la cola no se ejecuta y libera su lugar; una
+    que ya está corriendo no se puede interrumpir y conserva el suyo hasta terminar.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="legisbot")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.expired = 0
+
+    def try_submit(self, fn, *args, timeout: float = None):
+        """
+        Devuelve (future, encolado_en) o None si no hay lugar. Con timeout, si la tarea llega a
+        un worker después de vencido no llama a fn: el future termina con FutureTimeoutError.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return None
+        with self._lock:
+            self.admitted += 1
+        enqueued_at = time.perf_counter()
+        deadline = enqueued_at + timeout if timeout else None
+
+        def run():
+            if deadline is not None and time.perf_counter() >= deadline:
+                # Quien la envió ya respondió 504: ejecutarla solo ocuparía un worker
+                with self._lock:
+                    self.expired += 1
+                self._slots.release()
+                raise FutureTimeoutError("La solicitud venció en la cola")
+            with self._lock:
+                self.running += 1
+            started_at = time.perf_counter()
+            try:
+                return fn(*args), started_at - enqueued_at
+            finally:
+                with self._lock:
+                    self.running -= 1
+                self._slots.release()
+
+        return self.executor.submit(run), enqueued_at
+
+    def record_timeout(self):
+        with self._lock:
+            self.timed_out += 1
+
+    def status(self) -> dict:
+        """Contadores del pool: timed_out son las respuestas 504 y expired las que vencieron sin llegar a correr."""
+        with self._lock:
+            return {"workers": self.workers, "queue_size": self.queue_size, "running": self.running,
+                    "admitted": self.admitted, "rejected": self.rejected, "timed_out": self.timed_out,
+                    "expired": self.expired}
+
+
+def consultar(consulta: str) -> dict:
+    import main
+    with span("request", endpoint="/consulta") as s:
+        respuesta = main.get_agent().invoke(consulta)
+        respuesta_str = respuesta["output"] if isinstance(respuesta, dict) and "output" in respuesta else str(respuesta)
+        resultado = {"respuesta": respuesta_str}
+        if respuesta_str.startswith("[Plantilla seleccionada: "):
+            resultado["documento"] = main.guardar_documento_generado(respuesta_str)
+    # Desglose por etapa de esta consulta (load, embed, vector_search, llm, save, ...)
+    resultado["etapas_ms"] = s.breakdown()
+    return resultado
+
+
+def generar(consulta: str, plantilla: str = None, cliente: str = None) -> dict:
+    import main
+    with span("request", endpoint="/generar") as s:
+        respuesta_str = main.cag_tool_func(consulta, plantilla_name=plantilla, cliente=cliente)
+        resultado = {"respuesta": respuesta_str}
+        if respuesta_str.startswith("[Plantilla seleccionada: "):
+            resultado["documento"] = main.guardar_documento_generado(respuesta_str)
+    resultado["etapas_ms"] = s.breakdown()
+    return resultado
+
+
+class LegisBotServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pool: AdmissionPool, request_timeout: float):
+        super().__init__(address, LegisBotHandler)
+        self.pool = pool
+        self.request_timeout = request_timeout
+        self.latencies = LatencyStats()
+        self.ready = False
+        self.warmup = None
+
+
+class LegisBotHandler(BaseHTTPRequestHandler):
+    server_version = "LegisBot/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, status: int, text: str, content_type: str):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_text(200, get_tracer().prometheus_text(), "text/plain; version=0.0.4; charset=utf-8")
+        elif self.path == "/salud":
+            from llm_client import llm_stats
+            from rag import shard_stats
+            self._send_json(200 if self.server.ready else 503, {
+                "listo": self.server.ready,
+                "inicializacion": self.server.warmup.report() if self.server.warmup else None,
+                "pool": self.server.pool.status(),
+                "latencias": self.server.latencies.summary(),
+                "llm": llm_stats(),
+                "shards": shard_stats(),
+            })
+        else:
+            self._send_json(404, {"error": "Ruta no encontrada"})
+
+    def do_POST(self):
+        routes = {"/consulta": consultar, "/generar": generar}
+        if self.path not in routes:
+            self._send_json(404, {"error": "Ruta no encontrada"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "El cuerpo debe ser JSON válido"})
+            return
+        consulta = (body.get("consulta") or "").strip()
+        if not consulta:
+            self._send_json(400, {"error": "Falta el campo 'consulta'"})
+            return
+        if not self.server.ready:
+            self._send_json(503, {"error": "El servidor todavía se está inicializando"}, {"Retry-After": "5"})
+            return
+
+        args = (consulta, body.get("plantilla"), body.get("cliente")) if self.path == "/generar" else (consulta,)
+        t0 = time.perf_counter()
+        submitted = self.server.pool.try_submit(routes[self.path], *args, timeout=self.server.request_timeout)
+        if submitted is None:
+            self._send_json(503, {"error": "Servidor ocupado, reintente en unos segundos"}, {"Retry-After": "2"})
+            return
+        future, _ = submitted
+        try:
+            resultado, espera = future.result(timeout=self.server.request_timeout)
+        except FutureTimeoutError:
+            self.server.pool.record_timeout()
+            self._send_json(504, {"error": "La consulta excedió el tiempo máximo"})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"Consulta fallida: {e}"})
+            return
+        latencia = time.perf_counter() - t0
+        self.server.latencies.add(self.path, latencia)
+        resultado["latencia_ms"] = round(latencia * 1000, 1)
+        resultado["espera_cola_ms"] = round(espera * 1000, 1)
+        self._send_json(200, resultado, {"X-Latencia-ms": str(resultado["latencia_ms"])})
+
+
+def run_server(host: str, port: int, workers: int, queue_size: int, request_timeout: float):
+    import main
+    # Con INDEX_BUNDLE, un bundle de otro modelo de embeddings impide arrancar
+    main.check_index_bundle()
+    pool = AdmissionPool(workers, queue_size)
+    server = LegisBotServer((host, port), pool, request_timeout)
+    log.info(f"Servidor LegisBot escuchando en http://{host}:{port} ({workers} workers, cola {queue_size})")
+
+    # Cadenas RAG, plantillas y clientes LLM se construyen en paralelo antes de aceptar consultas
+    server.warmup = main.start_warmup()
+
+    def wait_ready():
+        if server.warmup.wait():
+            server.ready = True
+            log.info(f"Servidor listo en {server.warmup.report()['transcurrido_s']:.1f}s")
+        else:
+            log.error("No se pudo inicializar el servidor: ver /salud")
+
+    threading.Thread(target=wait_ready, daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        get_tracer().flush()
+        pool.executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API HTTP del agente jurídico")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=get_env_int("SERVER_PORT", 8000))
+    parser.add_argument("--workers", type=int, default=get_env_int("SERVER_WORKERS", 4))
+    parser.add_argument("--queue", type=int, default=get_env_int("SERVER_QUEUE", 16))
+    parser.add_argument("--timeout", type=float, default=get_env_float("SERVER_REQUEST_TIMEOUT", 300.0))
+    args = parser.parse_args()
+    run_server(args.host, args.port, args.workers, args.queue, args.timeout)
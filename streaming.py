@@ -0,0 +1,40 @@
+import time
+import threading
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+_FIN = object()
+
+
+def stream_agent(agent, query: str):
+    """
+    Ejecuta el agente en un hilo y produce eventos (tipo, dato) a medida que ocurren.
+    Termina con ("final", respuesta_str) y ("metrics", {...}). Si el servidor no emitió
+    tokens de la respuesta final, esta se entrega completa como un único ("answer", ...).
+    """
+    # Los callbacks dependen de LangChain: se importan al ejecutar, no al importar main
+    from callbacks import AgentStreamHandler
+    handler = AgentStreamHandler()
+    result = {}
+
+    def run():
+        try:
+            result["output"] = agent.invoke(query, config={"callbacks": [handler]})
+        except Exception as e:
+            result["error"] = e
+        finally:
+            handler.events.put(_FIN)
+
+    threading.Thread(target=run, daemon=True).start()
+    while True:
+        event = handler.events.get()
+        if event is _FIN:
+            break
+        yield event
+    if "error" in result:
+        raise result["error"]
+    respuesta = result.get("output")
+    respuesta_str = respuesta["output"] if isinstance(respuesta, dict) and "output" in respuesta else str(respuesta)
+    if not handler.answer_emitted:
+        yield ("answer", respuesta_str)
+    yield ("final", respuesta_str)
+    yield ("metrics", handler.metrics(time.perf_counter()))
@@ -0,0 +1,74 @@
+import pytest
+import answer_cache
+from answer_cache import AnswerCache, cached_answer
+
+
+class EmbeddingsIguales:
+    """Todas las consultas embeben igual: el peor caso para el acierto por similitud."""
+
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = AnswerCache(str(tmp_path / "cache" / "answers.sqlite"), embedder=EmbeddingsIguales())
+    monkeypatch.setattr(answer_cache, "get_answer_cache", lambda: cache)
+    return cache
+
+
+def test_clientes_distintos_no_comparten_respuesta(cache, tmp_path):
+    @cached_answer("clientes", [str(tmp_path / "docs")], semantic=False)
+    def datos_cliente(query):
+        return f"Ficha de {query.rsplit(' ', 1)[-1]}"
+
+    assert datos_cliente("datos del cliente Pérez") == "Ficha de Pérez"
+    assert datos_cliente("datos del cliente Gómez") == "Ficha de Gómez"
+    assert datos_cliente("Datos del cliente PÉREZ") == "Ficha de Pérez"
+    assert (cache.exact_hits, cache.semantic_hits, cache.misses) == (1, 0, 2)
+
+
+def test_legislacion_reutiliza_por_similitud(cache, tmp_path):
+    @cached_answer("legislacion", [str(tmp_path / "docs")])
+    def legislacion(query):
+        return f"Respuesta a {query}"
+
+    assert legislacion("plazo de prescripción") == "Respuesta a plazo de prescripción"
+    assert legislacion("cuál es el plazo de prescripción") == "Respuesta a plazo de prescripción"
+    assert cache.semantic_hits == 1
+
+
+def _coleccion(directorio, archivo, contenido):
+    from manifest import CollectionManifest
+    directorio.mkdir(parents=True, exist_ok=True)
+    fuente = directorio / archivo
+    fuente.write_text(contenido, encoding="utf-8")
+    manifest = CollectionManifest(str(directorio))
+    manifest.embedding_model = "fake"
+    manifest.record(str(fuente), ["c1"])
+    manifest.save()
+
+
+def test_cambio_del_corpus_invalida_la_respuesta(cache, tmp_path):
+    coleccion = tmp_path / "chroma_db_legislacion"
+    _coleccion(coleccion, "ley.txt", "ARTÍCULO 1.- Texto original.")
+    llamadas = []
+
+    @cached_answer("legislacion", [str(coleccion)])
+    def legislacion(query):
+        llamadas.append(query)
+        return f"Respuesta {len(llamadas)}"
+
+    assert legislacion("qué dice el artículo 1") == "Respuesta 1"
+    assert legislacion("qué dice el artículo 1") == "Respuesta 1"
+    # Reingestar con otro contenido cambia el hash de corpus del manifiesto
+    _coleccion(coleccion, "ley.txt", "ARTÍCULO 1.- Texto reformado.")
+    assert legislacion("qué dice el artículo 1") == "Respuesta 2"
+    assert cache.invalidations == 1
+
+
+def test_numeros_distintos_no_son_la_misma_consulta(cache):
+    fp = "huella"
+    cache.put("legislacion", "qué dice el artículo 14", "Art. 14", fp)
+    assert cache.get("legislacion", "que dice el articulo 14?", fp) == "Art. 14"
+    assert cache.get("legislacion", "qué dice el artículo 15", fp) is None
@@ -0,0 +1,82 @@
+import json
+import os
+from types import SimpleNamespace
+import pytest
+import batch
+from batch import LOTE_FILENAME, BatchGenerator
+
+
+class _Plantilla:
+    def __init__(self, path, campos):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.mtime = os.path.getmtime(path)
+        self.campos = campos
+
+    def missing(self, datos):
+        return {c for c in self.campos if c not in datos}
+
+
+@pytest.fixture
+def lote(tmp_path, monkeypatch):
+    llamadas = []
+
+    def completar_datos(plantilla, datos, consulta, limite_llm=None):
+        llamadas.append((plantilla.name, datos["nombre"]))
+        return {**datos, **{c: "redactado" for c in plantilla.missing(datos)}}
+
+    def generar_documento(plantilla, datos, salida):
+        with open(salida, "w", encoding="utf-8") as f:
+            f.write(f"{plantilla.name}: {datos}")
+
+    monkeypatch.setattr(batch.legisbot, "completar_datos", completar_datos)
+    monkeypatch.setattr(batch.legisbot, "generar_documento", generar_documento)
+    clientes = []
+    for nombre in ("Pérez", "Gómez"):
+        path = tmp_path / f"{nombre}.docx"
+        path.write_bytes(nombre.encode("utf-8"))
+        clientes.append(SimpleNamespace(path=str(path), datos_plantilla=lambda n=nombre: {"nombre": n}))
+    plantillas = []
+    for nombre, campos in (("poder.txt", ["nombre"]), ("demanda.txt", ["nombre", "hechos"])):
+        (tmp_path / nombre).write_text("{{nombre}}", encoding="utf-8")
+        plantillas.append(_Plantilla(str(tmp_path / nombre), campos))
+    return SimpleNamespace(dir=str(tmp_path / "salida"), clientes=clientes, plantillas=plantillas, llamadas=llamadas)
+
+
+def test_reanudar_omite_los_trabajos_terminados(lote):
+    resumen = BatchGenerator(lote.dir, workers=2).run(lote.clientes, lote.plantillas)
+    assert (resumen["generados"], resumen["omitidos"], resumen["llamadas_llm"]) == (4, 0, 2)
+    assert len(lote.llamadas) == 4
+    with open(os.path.join(lote.dir, LOTE_FILENAME), encoding="utf-8") as f:
+        registros = [json.loads(line) for line in f]
+    assert all(r["estado"] == "ok" and r["clave"] for r in registros)
+
+    # Se borra una salida y se cambia un cliente: solo esos trabajos se regeneran
+    os.remove(registros[0]["salida"])
+    with open(lote.clientes[1].path, "ab") as f:
+        f.write(b" modificado")
+    lote.llamadas.clear()
+    resumen = BatchGenerator(lote.dir, workers=2).run(lote.clientes, lote.plantillas)
+    regenerados = {(r["cliente"], r["plantilla"]) for r in registros if r["cliente"] == lote.clientes[1].path}
+    regenerados.add((registros[0]["cliente"], registros[0]["plantilla"]))
+    assert resumen["generados"] == len(regenerados) and resumen["omitidos"] == 4 - len(regenerados)
+    assert len(lote.llamadas) == len(regenerados)
+
+    # force regenera todo; una consulta distinta también cambia la clave
+    assert BatchGenerator(lote.dir, force=True).run(lote.clientes, lote.plantillas)["generados"] == 4
+    assert BatchGenerator(lote.dir).run(lote.clientes, lote.plantillas, consulta="otra")["omitidos"] == 0
+
+
+def test_un_error_no_cuenta_como_hecho(lote, monkeypatch):
+    generar = batch.legisbot.generar_documento
+
+    def falla(plantilla, datos, salida):
+        raise RuntimeError("plantilla rota")
+
+    monkeypatch.setattr(batch.legisbot, "generar_documento", falla)
+    resumen = BatchGenerator(lote.dir).run(lote.clientes, lote.plantillas[:1])
+    assert resumen["errores"] == 2 and resumen["generados"] == 0
+    assert not [f for f in os.listdir(lote.dir) if f.endswith(".txt")]
+    # Al reanudar sin el error, los trabajos fallidos se generan
+    monkeypatch.setattr(batch.legisbot, "generar_documento", generar)
+    assert BatchGenerator(lote.dir).run(lote.clientes, lote.plantillas[:1])["generados"] == 2
@@ -0,0 +1,67 @@
+import json
+import zipfile
+import pytest
+from fake_server import fake_embedding, start_fake_server
+
+pytest.importorskip("langchain_core")
+import bundle
+from bundle import BUNDLE_INFO, BundleError, IndexBundle, build_bundle
+
+
+@pytest.fixture
+def bundle_zip(tmp_path, monkeypatch):
+    server = start_fake_server(latency=0.0, embedding_latency=0.0, embedding_latency_per_text=0.0)
+    monkeypatch.setenv("OPENAI_API_BASE", server.base_url)
+    monkeypatch.setenv("EMBEDDING_CACHE", "0")
+    monkeypatch.setenv("PARSE_CACHE_DIR", str(tmp_path / "parsed"))
+    legislacion = tmp_path / "docs" / "legislacion"
+    legislacion.mkdir(parents=True)
+    (legislacion / "Ley 20744.txt").write_text(
+        "ARTÍCULO 245.- Indemnización por antigüedad o despido.\n"
+        "ARTÍCULO 150.- Vacaciones anuales del trabajador.\n", encoding="utf-8")
+    plantillas = tmp_path / "docs" / "plantillas"
+    plantillas.mkdir()
+    (plantillas / "poder general.txt").write_text("Otorgante: {nombre}", encoding="utf-8")
+    (tmp_path / "docs" / "clientes").mkdir()
+    path = str(tmp_path / "dist" / "bundle.zip")
+    try:
+        info = build_bundle(path, str(tmp_path / "build"), str(plantillas), "fake-embed", dtype="int8",
+                            colecciones={"legislacion": (str(legislacion), False)},
+                            clientes_dir=str(tmp_path / "docs" / "clientes"))
+    finally:
+        server.shutdown()
+        server.server_close()
+    return path, info
+
+
+def test_bundle_se_extrae_una_vez_y_sirve_sin_ingerir(bundle_zip, tmp_path, monkeypatch):
+    path, info = bundle_zip
+    assert info["colecciones"]["legislacion"]["chunks"] == 2
+    cache_dir = str(tmp_path / "bundles")
+    abierto = IndexBundle(path, cache_dir, embedding_model="fake-embed")
+    # Una segunda apertura del mismo bundle reutiliza lo extraído
+    monkeypatch.setattr(IndexBundle, "_extract", lambda self: pytest.fail("se volvió a extraer"))
+    reabierto = IndexBundle(path, cache_dir)
+    assert reabierto.root == abierto.root
+
+    store = reabierto.open_collection("legislacion", embeddings=None)
+    assert store.dtype == "int8"
+    hits = store.search_by_vectors([fake_embedding("vacaciones anuales del trabajador")], k=1)[0]
+    assert store.metadatas[hits[0][0]]["articulo"] == "150"
+    assert set(reabierto.article_table("legislacion")) and reabierto.manifest("legislacion").corpus_hash()
+    plantillas = reabierto.template_registry()
+    assert plantillas.frozen and plantillas.names() == ["poder general.txt"]
+    assert plantillas.get("poder general.txt").render({"nombre": "Juan"}) == "Otorgante: Juan"
+
+
+def test_bundle_de_otro_modelo_o_version_no_se_abre(bundle_zip, tmp_path):
+    path, _ = bundle_zip
+    with pytest.raises(BundleError):
+        IndexBundle(path, str(tmp_path / "bundles"), embedding_model="otro-modelo")
+    assert not (tmp_path / "bundles").exists()
+    viejo = str(tmp_path / "viejo.zip")
+    with zipfile.ZipFile(path) as origen, zipfile.ZipFile(viejo, "w") as destino:
+        info = json.loads(origen.read(BUNDLE_INFO))
+        destino.writestr(BUNDLE_INFO, json.dumps({**info, "version": bundle.BUNDLE_VERSION - 1}))
+    with pytest.raises(BundleError):
+        IndexBundle(viejo, str(tmp_path / "bundles"))
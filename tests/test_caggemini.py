@@ -0,0 +1,58 @@
+import time
+import pytest
+from caggemini import GeminiContextCache
+from fake_server import start_fake_server
+
+CORPUS = "ARTÍCULO 1.- Texto del primer artículo.\nARTÍCULO 2.- Texto del segundo."
+
+
+@pytest.fixture
+def server():
+    server = start_fake_server(latency=0.0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _cache(server, tmp_path, **kwargs):
+    return GeminiContextCache("clave", base_url=server.gemini_url, state_file=str(tmp_path / "gemini.json"),
+                              timeout=5.0, **kwargs)
+
+
+def test_crea_y_reutiliza_el_cache(server, tmp_path):
+    cache = _cache(server, tmp_path)
+    cache_id = cache.ensure(CORPUS)
+    assert cache_id in server.cached_contents
+    # Otra instancia lee el estado guardado y no vuelve a subir el corpus ni consulta la metadata
+    assert _cache(server, tmp_path).ensure(CORPUS) == cache_id
+    assert server.counters["cache_creates"] == 1
+    assert server.counters["cache_gets"] == 0
+    assert cache.ask(CORPUS, "¿Qué dice el artículo 1?")
+
+
+def test_extiende_el_ttl_antes_de_vencer(server, tmp_path):
+    cache = _cache(server, tmp_path, ttl_seconds=60, refresh_margin=120)
+    cache_id = cache.ensure(CORPUS)
+    assert cache.ensure(CORPUS) == cache_id
+    assert server.counters["cache_creates"] == 1
+    assert server.counters["cache_ttl_updates"] == 1
+
+
+def test_cache_vencido_se_vuelve_a_crear(server, tmp_path):
+    cache = _cache(server, tmp_path)
+    cache_id = cache.ensure(CORPUS)
+    # El servidor dio de baja el cache y el vencimiento local ya pasó
+    server.cached_contents[cache_id] = time.time() - 1
+    cache.state["expire_time"] = time.time()
+    nuevo = cache.ensure(CORPUS)
+    assert nuevo != cache_id
+    assert server.counters["cache_creates"] == 2
+
+
+def test_corpus_modificado_reemplaza_el_cache(server, tmp_path):
+    cache = _cache(server, tmp_path)
+    cache_id = cache.ensure(CORPUS)
+    nuevo = cache.ensure(CORPUS + "\nARTÍCULO 3.- Agregado.")
+    assert nuevo != cache_id
+    assert cache_id not in server.cached_contents
+    assert server.counters["cache_deletes"] == 1
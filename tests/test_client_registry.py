@@ -0,0 +1,31 @@
+from client_registry import get_client_registry
+
+
+def _ficha(directorio, nombre, campos):
+    directorio.mkdir(parents=True, exist_ok=True)
+    path = directorio / nombre
+    path.write_text("\n".join(f"{k}: {v}" for k, v in campos.items()), encoding="utf-8")
+    return str(path)
+
+
+def test_datos_plantilla_incluye_nombre(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = _ficha(tmp_path / "lote", "Pérez.txt", {"Razón social": "Pérez SA", "CUIT": "30-12345678-9"})
+    registrado = get_client_registry(str(tmp_path / "lote")).por_path(path)
+    assert registrado.datos_plantilla() == {"nombre": "Pérez SA", "razón_social": "Pérez SA",
+                                            "cuit": "30-12345678-9"}
+
+
+def test_cada_directorio_tiene_su_base(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CLIENT_REGISTRY_PATH", str(tmp_path / "cache" / "clientes.sqlite"))
+    a = _ficha(tmp_path / "a", "Gómez.txt", {"Nombre": "Ana Gómez", "DNI": "20.111.222"})
+    b = _ficha(tmp_path / "b", "López.txt", {"Nombre": "Luis López", "DNI": "20.333.444"})
+    registro_a = get_client_registry(str(tmp_path / "a"))
+    registro_b = get_client_registry(str(tmp_path / "b"))
+    assert registro_a.db_path != registro_b.db_path
+    # Refrescar un registro no borra los clientes del otro
+    registro_b.refresh(force=True)
+    assert registro_a.por_path(a).nombre == "Ana Gómez"
+    assert registro_b.por_path(b).nombre == "Luis López"
+    assert registro_a.por_path(b) is None
@@ -0,0 +1,39 @@
+from context_packer import GAP_MARKER, pack, pack_text, unir_chunks
+
+
+class ContadorPorPalabras:
+    def count(self, text):
+        return len(text.split())
+
+
+CONTADOR = ContadorPorPalabras()
+SECCIONES = [
+    "Cláusula primera: objeto del contrato de locación del inmueble.",
+    "Cláusula segunda: plazo de la locación de veinticuatro meses.",
+    "Cláusula tercera: precio y forma de pago del alquiler mensual.",
+    "Cláusula cuarta: depósito en garantía equivalente a un mes.",
+    "Cláusula quinta: jurisdicción de los tribunales ordinarios.",
+]
+
+
+def test_pack_text_respeta_el_presupuesto():
+    for budget in (5, 12, 25, 40):
+        texto = pack_text("plazo de la locación", SECCIONES, budget, CONTADOR)
+        elegidas = [s for s in SECCIONES if s in texto]
+        assert sum(CONTADOR.count(s) + 1 for s in elegidas) <= budget
+    # Con poco presupuesto entra la sección más relevante y se marcan los huecos
+    texto = pack_text("plazo de la locación", SECCIONES, 12, CONTADOR)
+    assert texto == f"{GAP_MARKER}\n\n{SECCIONES[1]}\n\n{GAP_MARKER}"
+
+
+def test_pack_text_completo_sin_marcas():
+    assert pack_text("precio", SECCIONES, 1000, CONTADOR) == "\n\n".join(SECCIONES)
+
+
+def test_pack_recorta_el_solapamiento_del_mismo_documento():
+    base = "ARTÍCULO 1.- El locador debe entregar la cosa en buen estado de conservación y uso. "
+    siguiente = "entregar la cosa en buen estado de conservación y uso. Debe además pagar las mejoras."
+    elegidos = pack("locador cosa", [base, siguiente], 1000, CONTADOR, grupos=["ley", "ley"])
+    assert elegidos[0][1] == base
+    assert elegidos[1][1] == "Debe además pagar las mejoras."
+    assert unir_chunks([base, siguiente]) == base + "\nDebe además pagar las mejoras."
@@ -0,0 +1,24 @@
+from dedup import ChunkDeduplicator
+
+
+def _agregar(dedup, cid, texto, clave):
+    original, tipo, digest, signature = dedup.find(texto, clave)
+    if original is None:
+        dedup.add(cid, digest, signature if signature is not None else dedup.signature(texto), clave)
+    return original, tipo
+
+
+def test_mismo_texto_con_otro_articulo_no_es_duplicado(tmp_path):
+    dedup = ChunkDeduplicator(str(tmp_path))
+    assert _agregar(dedup, "a", "Derogado.", "14") == (None, None)
+    assert _agregar(dedup, "b", "Derogado.", "15") == (None, None)
+    # La misma edición del artículo 14 en otro archivo sí es duplicado exacto
+    assert _agregar(dedup, "c", "Derogado.", "14") == ("a", "exacto")
+
+
+def test_duplicado_exacto_sin_articulo(tmp_path):
+    dedup = ChunkDeduplicator(str(tmp_path))
+    _agregar(dedup, "a", "Las partes acuerdan el plazo de diez días.", "")
+    assert _agregar(dedup, "b", "las partes acuerdan el plazo de diez dias", "") == ("a", "exacto")
+    dedup.remove(["a"])
+    assert _agregar(dedup, "c", "Las partes acuerdan el plazo de diez días.", "") == (None, None)
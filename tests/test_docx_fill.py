@@ -0,0 +1,31 @@
+import os
+from docx import Document
+from docx_fill import rellenar_docx, ruta_lote
+
+
+def test_placeholder_partido_en_runs_conserva_el_formato(tmp_path):
+    plantilla = tmp_path / "poder.docx"
+    document = Document()
+    parrafo = document.add_paragraph()
+    parrafo.add_run("Otorgante: ")
+    negrita = parrafo.add_run("{nom")
+    negrita.bold = True
+    parrafo.add_run("bre}, DNI {dni} {sin_dato}")
+    document.add_table(rows=1, cols=1).cell(0, 0).text = "Expediente {expediente}"
+    document.save(plantilla)
+
+    salida = tmp_path / "salida.docx"
+    datos = {"nombre": "Juan Pérez", "dni": "12.345.678", "expediente": "123/2024"}
+    assert rellenar_docx(str(plantilla), datos, str(salida)) == 3
+    resultado = Document(salida)
+    runs = resultado.paragraphs[0].runs
+    assert "".join(r.text for r in runs) == "Otorgante: Juan Pérez, DNI 12.345.678 {sin_dato}"
+    assert [r.text for r in runs if r.bold] == ["Juan Pérez"]
+    assert resultado.tables[0].cell(0, 0).text == "Expediente 123/2024"
+
+
+def test_ruta_lote_es_determinista_y_distingue_clientes(tmp_path):
+    a = ruta_lote("Poder general.docx", "clientes/Pérez.docx", ".docx", str(tmp_path))
+    assert a == ruta_lote("Poder general.docx", "clientes/Pérez.docx", ".docx", str(tmp_path))
+    assert os.path.basename(a).startswith("Poder_general__Pérez_")
+    assert a != ruta_lote("Poder general.docx", "otros/Pérez.docx", ".docx", str(tmp_path))
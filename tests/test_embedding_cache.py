@@ -0,0 +1,44 @@
+import time
+import pytest
+from embedding_cache import EmbeddingCache, text_hash
+from embeddings import LMStudioEmbeddings
+from fake_server import start_fake_server
+
+
+def test_el_cache_sobrevive_a_reabrirlo(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path)
+    cache.put_many("modelo", {text_hash("hola"): [0.5, -0.25, 1.0]})
+    cache.close()
+    reabierto = EmbeddingCache(path)
+    assert reabierto.get_many("modelo", [text_hash("hola"), text_hash("otro")]) == {text_hash("hola"): [0.5, -0.25, 1.0]}
+    # La clave incluye el modelo: otro modelo no reutiliza el vector
+    assert reabierto.get_many("otro-modelo", [text_hash("hola")]) == {}
+    assert (reabierto.hits, reabierto.misses) == (1, 2)
+
+
+def test_desaloja_lo_usado_hace_mas_tiempo(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_entries=10)
+    for i in range(10):
+        cache.put_many("m", {text_hash(str(i)): [float(i)]})
+        time.sleep(0.001)
+    cache.get_many("m", [text_hash("0")])
+    cache.put_many("m", {text_hash("10"): [10.0]})
+    assert len(cache) == 9
+    assert text_hash("0") in cache.get_many("m", [text_hash("0")])
+    assert cache.get_many("m", [text_hash("1")]) == {}
+
+
+def test_cliente_no_vuelve_a_embeber_textos_cacheados(tmp_path):
+    server = start_fake_server(latency=0.0, embedding_latency=0.0, embedding_latency_per_text=0.0)
+    try:
+        cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+        cliente = LMStudioEmbeddings(server.base_url, "fake", cache=cache)
+        primero = cliente.embed_documents(["uno", "dos", "uno"])
+        assert server.counters["embedded_texts"] == 2
+        segundo = cliente.embed_documents(["dos", "uno"])
+        assert segundo == [pytest.approx(primero[1]), pytest.approx(primero[0])]
+        assert server.counters["embedded_texts"] == 2
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,48 @@
+import pytest
+import embeddings
+from embeddings import LMStudioEmbeddings
+from fake_server import fake_embedding, start_fake_server
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = start_fake_server(latency=0.0, embedding_latency=0.0, embedding_latency_per_text=0.0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _cliente(server, **kwargs):
+    return LMStudioEmbeddings(server.base_url, "fake", use_cache=False, **kwargs)
+
+
+def test_lotes_en_paralelo_conservan_el_orden(server):
+    textos = [f"artículo {i} del código civil" for i in range(10)]
+    cliente = _cliente(server, batch_size=3, max_workers=4)
+    assert cliente.embed_documents(textos) == [fake_embedding(t) for t in textos]
+    assert cliente.stats.as_dict()["batches"] == 4
+
+
+def test_lotes_acotados_por_caracteres(server):
+    cliente = _cliente(server, batch_size=100, max_batch_chars=25)
+    lotes = cliente._make_batches(["a" * 10, "b" * 10, "c" * 10, "d" * 30])
+    assert [(inicio, len(lote)) for inicio, lote in lotes] == [(0, 2), (2, 1), (3, 1)]
+
+
+def test_reintenta_ante_servidor_saturado(server, monkeypatch):
+    cliente = _cliente(server, max_retries=2)
+    post = cliente.session.post
+    respuestas = []
+
+    class Saturado:
+        status_code = 503
+        text = "ocupado"
+
+    def post_con_falla(*args, **kwargs):
+        respuestas.append(1)
+        return Saturado() if len(respuestas) == 1 else post(*args, **kwargs)
+
+    monkeypatch.setattr(cliente.session, "post", post_con_falla)
+    monkeypatch.setattr(embeddings.time, "sleep", lambda s: None)
+    assert cliente.embed_query("plazo de prescripción") == fake_embedding("plazo de prescripción")
+    assert cliente.stats.retries == 1
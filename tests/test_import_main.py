@@ -0,0 +1,12 @@
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importar_main_no_carga_langchain_ni_numpy():
+    codigo = ("import sys, main; "
+              "print(sorted(m for m in ('langchain_core', 'langchain', 'numpy', 'chromadb') if m in sys.modules))")
+    salida = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, check=True)
+    assert salida.stdout.strip() == "[]"
@@ -0,0 +1,47 @@
+from legal_index import ArticleIndex, citas_articulos
+
+
+def test_citas_con_separador_de_miles():
+    assert citas_articulos("¿Qué dice el art. 1.897 CCyC?") == ["1897"]
+    assert citas_articulos("artículo 2560") == ["2560"]
+    assert citas_articulos("art 5 de la ley") == ["5"]
+
+
+def test_citas_en_lista():
+    assert citas_articulos("artículos 14 y 15 de la Constitución") == ["14", "15"]
+    assert citas_articulos("arts. 14, 15 y 16") == ["14", "15", "16"]
+    assert citas_articulos("plazo de prescripción") == []
+
+
+def _indice():
+    index = ArticleIndex()
+    index.add("codigo_civil_y_comercial", "14", "ccyc-14")
+    index.add("codigo_civil_y_comercial", "1897", "ccyc-1897")
+    index.add("ley_de_contrato_de_trabajo", "14", "lct-14")
+    return index
+
+
+def test_lookup_con_ley():
+    index = _indice()
+    assert index.lookup("art. 14 de la ley de contrato de trabajo") == ["lct-14"]
+    assert index.lookup("art. 1.897 del código civil y comercial") == ["ccyc-1897"]
+
+
+def test_lookup_sin_ley_ambiguo_vuelve_a_la_busqueda_hibrida():
+    index = _indice()
+    assert index.lookup("¿qué dice el art. 14?") == []
+    # Un artículo que solo existe en una ley sí es exacto
+    assert index.lookup("¿qué dice el art. 1897?") == ["ccyc-1897"]
+
+
+def test_lookup_ediciones_deduplicadas_no_son_ambiguas():
+    index = ArticleIndex()
+    chunk = object()
+    index.add("codigo_civil_2015", "14", chunk)
+    index.add("codigo_civil_2020", "14", chunk)
+    assert index.lookup("art. 14") == [chunk]
+
+
+def test_citas_con_sufijo():
+    assert citas_articulos("¿qué dice el art. 22 bis?") == ["22 bis"]
+    assert citas_articulos("arts. 14 ter y 15") == ["14 ter", "15"]
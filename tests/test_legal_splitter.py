@@ -0,0 +1,35 @@
+import threading
+from legal_splitter import HierarchicalSplitter
+
+
+def _chunks(texto, max_chars=2000):
+    return list(HierarchicalSplitter(max_chars).split([(1, texto)], source="docs/legislacion/Ley 1420.pdf"))
+
+
+def test_articulo_con_sufijo_se_guarda_normalizado():
+    texto = "ARTÍCULO 22.- Texto del veintidós.\nARTÍCULO 22 BIS.- Texto agregado.\nArtículo 1.897.- Otro.\n"
+    assert [meta["articulo"] for _, meta in _chunks(texto)] == ["22", "22 bis", "1897"]
+    assert _chunks(texto)[1][1]["epigrafe"] == "Texto agregado"
+
+
+def test_linea_larga_se_corta_en_fin_de_oracion():
+    oracion = "Primera oración bastante larga del artículo. "
+    texto = "ARTÍCULO 1.- " + oracion * 4 + "palabra " * 20
+    partes = [t for t, _ in _chunks(texto, max_chars=120)]
+    assert len(partes) > 1
+    assert partes[0].rstrip().endswith(".")
+
+
+def test_parrafo_de_una_linea_seguido_de_continuaciones_no_se_cuelga():
+    # Los espacios que quitaba cada corte de la línea larga no se descontaban y split() no terminaba
+    continuacion = "línea de continuación del artículo con más texto\n"
+    for oraciones in (78, 183, 246):
+        texto = "ARTÍCULO 1.- " + "Una oración. " * oraciones + "\n" + continuacion * 40
+        resultado = []
+        hilo = threading.Thread(target=lambda: resultado.extend(_chunks(texto, max_chars=200)), daemon=True)
+        hilo.start()
+        hilo.join(timeout=10)
+        assert not hilo.is_alive(), f"split() no terminó con {oraciones} oraciones"
+        partes = [t for t, _ in resultado]
+        assert all(len(t) <= 200 for t in partes)
+        assert sum(t.count("continuación") for t in partes) == 40
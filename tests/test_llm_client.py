@@ -0,0 +1,50 @@
+import time
+import threading
+from llm_client import LLMGate
+
+
+def test_call_single_flight_coalesce_llamadas_identicas():
+    gate = LLMGate(max_concurrency=4, single_flight=True)
+    llamadas = []
+    liberar = threading.Event()
+
+    def func():
+        llamadas.append(1)
+        liberar.wait(5)
+        return "respuesta"
+
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(gate.call("k", func))) for _ in range(5)]
+    for hilo in hilos:
+        hilo.start()
+    # Los seguidores tienen que llegar mientras la llamada original está en curso
+    deadline = time.time() + 5
+    while gate.stats.as_dict()["in_flight"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    liberar.set()
+    for hilo in hilos:
+        hilo.join(5)
+
+    stats = gate.stats.as_dict()
+    assert resultados == ["respuesta"] * 5
+    assert len(llamadas) == 1
+    assert stats["calls"] == 1
+    assert stats["coalesced"] == 4
+    assert stats["errors"] == 0
+
+
+def test_call_cuenta_errores_y_no_comparte_fallos():
+    gate = LLMGate(max_concurrency=2, single_flight=True)
+
+    def falla():
+        raise RuntimeError("servidor caído")
+
+    try:
+        gate.call("k", falla)
+    except RuntimeError:
+        pass
+    assert gate.call("k", lambda: "ok") == "ok"
+    stats = gate.stats.as_dict()
+    assert stats["calls"] == 2
+    assert stats["errors"] == 1
@@ -0,0 +1,34 @@
+import os
+from manifest import CollectionManifest
+
+
+def test_diff_distingue_cambios_de_contenido_y_de_fecha(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    paths = {nombre: str(docs / nombre) for nombre in ("a.txt", "b.txt", "c.txt")}
+    for nombre, path in paths.items():
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"contenido de {nombre}")
+    manifest = CollectionManifest(str(tmp_path))
+    for path in paths.values():
+        manifest.record(path, [f"{path}-0"])
+    manifest.save()
+    hash_previo = CollectionManifest(str(tmp_path)).corpus_hash()
+
+    # a: mismo contenido con otra fecha; b: contenido nuevo; c: eliminado; d: nuevo
+    st = os.stat(paths["a.txt"])
+    os.utime(paths["a.txt"], (st.st_atime, st.st_mtime + 10))
+    with open(paths["b.txt"], "w", encoding="utf-8") as f:
+        f.write("otro contenido")
+    os.remove(paths["c.txt"])
+    nuevo = str(docs / "d.txt")
+    with open(nuevo, "w", encoding="utf-8") as f:
+        f.write("nuevo")
+
+    manifest = CollectionManifest(str(tmp_path))
+    nuevos, modificados, eliminados, sin_cambios = manifest.diff([paths["a.txt"], paths["b.txt"], nuevo])
+    assert (nuevos, modificados, sin_cambios) == ([nuevo], [paths["b.txt"]], [paths["a.txt"]])
+    assert eliminados == [os.path.normpath(paths["c.txt"])]
+    assert manifest.forget(paths["c.txt"]) == [f"{paths['c.txt']}-0"]
+    manifest.record(paths["b.txt"], ["b-1"])
+    assert manifest.corpus_hash() != hash_previo
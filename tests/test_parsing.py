@@ -0,0 +1,65 @@
+import os
+from collections import OrderedDict
+import pytest
+import parsing
+from parsing import iter_pages, parse_documents
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("PARSE_CACHE_DIR", str(tmp_path / "parsed"))
+    monkeypatch.setattr(parsing, "_memory_cache", OrderedDict())
+    monkeypatch.setattr(parsing, "_memory_chars", {})
+    return tmp_path / "parsed"
+
+
+def _codigo(tmp_path, n=200):
+    path = tmp_path / "Código Civil.txt"
+    path.write_text("".join(f"ARTÍCULO {i}.- Texto \"citado\" del artículo {i}.\n" for i in range(1, n + 1)),
+                    encoding="utf-8")
+    return str(path)
+
+
+def test_streaming_guarda_en_el_cache(tmp_path, cache_dir, monkeypatch):
+    path = _codigo(tmp_path)
+    bloques = [texto for _, texto in iter_pages(path, block_chars=500)]
+    assert len(bloques) > 1
+    assert len(os.listdir(cache_dir)) == 1
+    # parse_documents y el siguiente streaming reutilizan el texto sin volver a extraerlo
+    monkeypatch.setattr(parsing, "_extract_task", lambda *a: pytest.fail("no debía extraer"))
+    monkeypatch.setattr(parsing, "_extract_pages", lambda *a: pytest.fail("no debía extraer"))
+    assert parse_documents([path], max_workers=1)[path] == ["\n".join(bloques)]
+    assert [texto for _, texto in iter_pages(path)] == ["\n".join(bloques)]
+
+
+def test_streaming_interrumpido_no_deja_cache(tmp_path, cache_dir):
+    pages = iter_pages(_codigo(tmp_path), block_chars=500)
+    next(pages)
+    pages.close()
+    assert not os.listdir(cache_dir)
+
+
+def test_pool_de_procesos_sin_fork(tmp_path, cache_dir):
+    paths = []
+    for i in range(2):
+        os.makedirs(tmp_path / str(i))
+        paths.append(_codigo(tmp_path / str(i), n=5 + i))
+    parsed = parse_documents(paths, max_workers=2)
+    assert [len(parsed[p][0].splitlines()) for p in paths] == [5, 6]
+    assert parsing._mp_context().get_start_method() in ("forkserver", "spawn")
+
+
+def test_cache_en_memoria_acotado_por_caracteres(tmp_path, cache_dir, monkeypatch):
+    monkeypatch.setenv("PARSE_MEMORY_CACHE_CHARS", "3000")
+    paths = []
+    for i in range(3):
+        os.makedirs(tmp_path / str(i))
+        paths.append(_codigo(tmp_path / str(i), n=30))
+    parse_documents(paths, max_workers=1)
+    # Cada archivo tiene más de 1000 caracteres: solo entran los dos últimos
+    assert list(parsing._memory_cache) == paths[1:]
+    assert sum(parsing._memory_chars.values()) <= 3000
+    # El desalojado sigue saliendo del cache en disco sin volver a extraerlo
+    monkeypatch.setattr(parsing, "_extract_task", lambda *a: pytest.fail("no debía extraer"))
+    assert parse_documents(paths[:1], max_workers=1)[paths[0]]
+    assert list(parsing._memory_cache) == [paths[2], paths[0]]
@@ -0,0 +1,28 @@
+import os
+import pytest
+
+pytest.importorskip("langchain")
+from plantillas import TemplateRegistry
+
+
+def test_registro_elige_por_nombre_y_se_refresca_al_cambiar_el_archivo(tmp_path, monkeypatch):
+    monkeypatch.setenv("PARSE_CACHE_DIR", str(tmp_path / "parsed"))
+    directorio = tmp_path / "plantillas"
+    directorio.mkdir()
+    (directorio / "poder general.txt").write_text("Otorgante: {nombre}, DNI {dni}", encoding="utf-8")
+    (directorio / "demanda por despido.txt").write_text("Actor: {nombre}", encoding="utf-8")
+    registry = TemplateRegistry(str(directorio), refresh_interval=0)
+    assert registry.select("armame la demanda de despido") == "demanda por despido.txt"
+    assert registry.select("poder general") == "poder general.txt"
+    plantilla = registry.get("poder general.txt")
+    assert plantilla.missing({"nombre": "Juan"}) == {"dni"}
+    assert plantilla.render({"nombre": "Juan"}) == "Otorgante: Juan, DNI {dni}"
+
+    path = directorio / "poder general.txt"
+    path.write_text("Apoderado: {apoderado}", encoding="utf-8")
+    os.utime(path, (plantilla.mtime + 10, plantilla.mtime + 10))
+    assert registry.get("poder general.txt").placeholders == {"apoderado"}
+    # El snapshot reconstruye el mismo registro sin leer los archivos
+    fijo = TemplateRegistry(str(directorio / "no_existe"), snapshot=registry.snapshot())
+    assert fijo.names() == registry.names()
+    assert fijo.get("poder general.txt").render({"apoderado": "Ana"}) == "Apoderado: Ana"
@@ -0,0 +1,68 @@
+import pytest
+from prefix_cache import LlamaCppSlotBackend, LocalStubBackend, PrefixCacheBackend, PrefixCacheManager, prefix_key
+
+PREFIJO = "Datos del cliente Pérez: domicilio en Calle Falsa 123, DNI 12.345.678.\n"
+
+
+def test_prefijo_reutilizado():
+    backend = LocalStubBackend()
+    manager = PrefixCacheManager(backend)
+    manager.complete(PREFIJO, "¿Cuál es el domicilio?")
+    manager.complete(PREFIJO, "¿Cuál es el DNI?")
+    assert (manager.hits, manager.misses) == (1, 1)
+    assert manager.prefill_chars_reused == len(PREFIJO)
+    # El servidor simulado procesó el prefijo una sola vez y luego solo los sufijos
+    assert backend.prefill_chars == len(PREFIJO) + len("¿Cuál es el domicilio?") + len("¿Cuál es el DNI?")
+
+
+def test_prefijo_modificado_invalida_el_cache():
+    backend = LocalStubBackend()
+    manager = PrefixCacheManager(backend)
+    manager.complete(PREFIJO, "¿DNI?")
+    actualizado = PREFIJO + "Nuevo domicilio: Av. Siempreviva 742.\n"
+    manager.complete(actualizado, "¿DNI?")
+    assert (manager.hits, manager.misses) == (0, 2)
+    assert backend.cached_prefixes == {prefix_key(PREFIJO), prefix_key(actualizado)}
+
+
+def test_registro_no_cuenta_como_prefill():
+    manager = PrefixCacheManager(LocalStubBackend())
+    assert manager.register(PREFIJO) == prefix_key(PREFIJO)
+    manager.complete(PREFIJO, "¿DNI?")
+    assert (manager.hits, manager.misses) == (0, 1)
+
+
+def test_slots_fijos_por_prefijo_con_desalojo_lru():
+    backend = LlamaCppSlotBackend("http://127.0.0.1:1/v1", n_slots=2)
+    assert backend.base_url == "http://127.0.0.1:1"
+    a, b, c = (prefix_key(p) for p in ("a", "b", "c"))
+    slot_a, slot_b = backend._slot_for(a), backend._slot_for(b)
+    assert slot_a != slot_b
+    assert backend._slot_for(a) == slot_a
+    # Sin slots libres se desaloja el menos usado (b) y su slot pasa al prefijo nuevo
+    assert backend._slot_for(c) == slot_b
+    assert backend._slot_for(a) == slot_a
+    assert b not in backend._slots
+
+
+def test_backend_base_es_abstracto():
+    with pytest.raises(TypeError):
+        PrefixCacheBackend()
+
+
+def test_guardar_y_restaurar_slots_sin_el_lock(monkeypatch):
+    backend = LlamaCppSlotBackend("http://127.0.0.1:1", n_slots=1, save_slots=True)
+    acciones = []
+
+    def slot_action(slot, action, key):
+        # Otro hilo puede usar el registro de slots mientras dura la llamada al servidor
+        assert backend._lock.acquire(blocking=False)
+        backend._lock.release()
+        acciones.append((slot, action, key))
+
+    monkeypatch.setattr(backend, "_slot_action", slot_action)
+    a, b = prefix_key("a"), prefix_key("b")
+    backend._slot_for(a)
+    backend._slot_for(b)
+    backend._slot_for(a)
+    assert acciones == [(0, "save", a), (0, "save", b), (0, "restore", a)]
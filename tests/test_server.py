@@ -0,0 +1,30 @@
+import threading
+import pytest
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from server import AdmissionPool
+
+
+def test_tarea_vencida_en_la_cola_libera_su_lugar():
+    pool = AdmissionPool(workers=1, queue_size=1)
+    liberar = threading.Event()
+    llamadas = []
+    ocupado, _ = pool.try_submit(liberar.wait, 5)
+    encolado, _ = pool.try_submit(llamadas.append, "no debía correr", timeout=0.05)
+    assert pool.try_submit(llamadas.append, "sin lugar") is None
+    with pytest.raises(FutureTimeoutError):
+        encolado.result(timeout=0.1)
+    pool.record_timeout()
+    liberar.set()
+    assert ocupado.result(timeout=5)[0] is True
+    with pytest.raises(FutureTimeoutError):
+        encolado.result(timeout=5)
+    assert llamadas == []
+    status = pool.status()
+    assert (status["timed_out"], status["expired"], status["rejected"], status["running"]) == (1, 1, 1, 0)
+    # Los dos lugares quedaron libres
+    futures = [pool.try_submit(llamadas.append, i) for i in range(2)]
+    assert all(futures)
+    for future, _ in futures:
+        future.result(timeout=5)
+    assert llamadas == [0, 1]
+    pool.executor.shutdown()
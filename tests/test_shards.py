@@ -0,0 +1,19 @@
+from legal_index import ley_base
+from rag import shard_files
+
+
+def test_ley_base_agrupa_ediciones():
+    assert ley_base("docs/Código Civil 2015.pdf") == "codigo_civil"
+    assert ley_base("docs/Código Civil (ed. 2020).pdf") == "codigo_civil"
+    assert ley_base("docs/Código Civil (1).pdf") == "codigo_civil"
+    # Sin otra palabra que identifique a la ley, el número se conserva
+    assert ley_base("docs/Ley 1420.pdf") == "ley_1420"
+    assert ley_base("docs/Ley 20744.txt") == "ley_20744"
+
+
+def test_shard_files_un_shard_por_ley(tmp_path):
+    for nombre in ("Código Civil 2015.txt", "Código Civil 2020.txt", "Ley de Contrato de Trabajo.txt"):
+        (tmp_path / nombre).write_text("ARTÍCULO 1.- Texto.", encoding="utf-8")
+    grupos = shard_files(str(tmp_path))
+    assert sorted(grupos) == ["codigo_civil", "ley_de_contrato_de_trabajo"]
+    assert len(grupos["codigo_civil"]) == 2
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+import pytest
+from streaming import stream_agent
+
+pytest.importorskip("langchain_core")
+
+
+class _AgenteFalso:
+    """Agente que genera tokens por los callbacks como lo haría el AgentExecutor."""
+
+    def __init__(self, tokens, error=None):
+        self.tokens = tokens
+        self.error = error
+
+    def invoke(self, query, config=None):
+        handler = config["callbacks"][0]
+        handler.on_llm_start({}, [query])
+        for token in self.tokens:
+            handler.on_llm_new_token(token)
+        if self.error:
+            raise self.error
+        handler.on_agent_action(SimpleNamespace(tool="buscar_ley", tool_input="art. 14"))
+        handler.on_tool_start({}, "art. 14")
+        handler.on_tool_end("ARTÍCULO 14.- ...")
+        return {"output": "Sí, corresponde."}
+
+
+def test_separa_razonamiento_herramientas_y_respuesta():
+    tokens = ["Pienso", " algo.", " Final", " Answer:", " Sí,", " corresponde."]
+    eventos = list(stream_agent(_AgenteFalso(tokens), "pregunta"))
+    tipos = [tipo for tipo, _ in eventos]
+    assert tipos[:3] == ["thought"] * 3 and tipos[3] == "answer"
+    assert "".join(d for t, d in eventos if t == "answer") == "Sí, corresponde."
+    assert ("step", "buscar_ley: art. 14") in eventos
+    assert ("observation", "ARTÍCULO 14.- ...") in eventos
+    assert eventos[-2] == ("final", "Sí, corresponde.")
+    assert tipos[-1] == "metrics"
+
+
+def test_sin_tokens_la_respuesta_sale_entera_y_los_errores_se_propagan():
+    eventos = list(stream_agent(_AgenteFalso([]), "pregunta"))
+    assert [t for t, _ in eventos if t == "answer"] == ["answer"]
+    assert ("answer", "Sí, corresponde.") in eventos
+    with pytest.raises(RuntimeError):
+        list(stream_agent(_AgenteFalso(["Pienso"], error=RuntimeError("caído")), "pregunta"))
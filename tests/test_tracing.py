@@ -0,0 +1,49 @@
+import json
+import uuid
+from types import SimpleNamespace
+import pytest
+import tracing
+from tracing import Tracer, span
+
+
+@pytest.fixture
+def tracer(tmp_path, monkeypatch):
+    tracer = Tracer(trace_file=str(tmp_path / "trace.jsonl"), metrics_file=str(tmp_path / "metrics.prom"),
+                    metrics_interval=0.0)
+    monkeypatch.setattr(tracing, "_tracer", tracer)
+    return tracer
+
+
+def test_etapas_anidadas_y_desglose(tracer, tmp_path):
+    with span("request", endpoint="/consulta") as raiz:
+        with span("embed") as s:
+            s.add(texts=3)
+        with pytest.raises(ValueError):
+            with span("llm"):
+                raise ValueError("sin modelo")
+    assert set(raiz.breakdown()) == {"embed", "llm"}
+    tracer.flush()
+    lineas = [json.loads(l) for l in (tmp_path / "trace.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [l["name"] for l in lineas] == ["embed", "llm", "request"]
+    assert len({l["trace_id"] for l in lineas}) == 1
+    assert lineas[0]["parent_id"] == lineas[2]["span_id"] and lineas[0]["texts"] == 3
+    assert lineas[1]["error"] == "ValueError: sin modelo"
+    metricas = (tmp_path / "metrics.prom").read_text(encoding="utf-8")
+    assert 'legisbot_span_seconds_count{span="embed"} 1' in metricas
+    assert 'legisbot_span_errors_total{span="llm"} 1' in metricas
+    assert 'legisbot_span_texts_total{span="embed"} 3' in metricas
+
+
+def test_callback_de_langchain_registra_la_etapa_llm(tracer):
+    pytest.importorskip("langchain_core")
+    from callbacks import TracingCallbackHandler
+    handler = TracingCallbackHandler()
+    run_id = uuid.uuid4()
+    with span("request") as raiz:
+        handler.on_llm_start({"kwargs": {"model_name": "fake"}}, ["hola mundo"], run_id=run_id)
+        respuesta = SimpleNamespace(generations=[[SimpleNamespace(text="respuesta")]],
+                                    llm_output={"token_usage": {"prompt_tokens": 3, "completion_tokens": 2}})
+        handler.on_llm_end(respuesta, run_id=run_id)
+    assert "llm" in raiz.breakdown()
+    assert tracer.counters[("llm", "prompt_chars")] == len("hola mundo")
+    assert tracer.counters[("llm", "completion_tokens")] == 2
@@ -0,0 +1,66 @@
+import pytest
+from fake_server import fake_embedding
+
+pytest.importorskip("langchain_core")
+from vector_store import MmapVectorStore
+
+TEXTOS = {
+    "a": "despido sin causa indemnización por antigüedad",
+    "b": "vacaciones anuales pagas del trabajador",
+    "c": "contrato de locación de inmuebles urbanos",
+    "d": "preaviso en el despido del trabajador",
+}
+
+
+class _Embeddings:
+    def embed_documents(self, texts):
+        return [fake_embedding(t) for t in texts]
+
+    def embed_query(self, text):
+        return fake_embedding(text)
+
+
+def _store(path, dtype="float32"):
+    store = MmapVectorStore(str(path), _Embeddings(), dtype=dtype)
+    store.add_texts(list(TEXTOS.values()), ids=list(TEXTOS),
+                    metadatas=[{"ley": "lct" if k != "c" else "ccyc"} for k in TEXTOS])
+    return store
+
+
+def _top_ids(store, query, k=4, **kwargs):
+    return [store.ids[row] for row, _ in store.search_by_vectors([fake_embedding(query)], k=k, **kwargs)[0]]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_top_k_tras_borrar_compactar_y_reabrir(tmp_path, dtype):
+    store = _store(tmp_path, dtype)
+    assert _top_ids(store, TEXTOS["a"], k=1) == ["a"]
+    store.delete(["a"])  # 1 de 4 no supera COMPACT_RATIO: queda como marca
+    assert "a" not in _top_ids(store, TEXTOS["a"])
+    store.compact()
+    assert len(store.ids) == 3
+    reabierto = MmapVectorStore(str(tmp_path), _Embeddings(), dtype=dtype)
+    assert reabierto.dtype == dtype
+    assert sorted(_top_ids(reabierto, TEXTOS["a"])) == ["b", "c", "d"]
+    assert _top_ids(reabierto, TEXTOS["d"], k=1) == ["d"]
+    assert reabierto.get(["d"])["documents"] == [TEXTOS["d"]]
+
+
+def test_int8_conserva_el_orden_de_float32(tmp_path):
+    exacto = _store(tmp_path / "f32")
+    cuantizado = _store(tmp_path / "i8", "int8")
+    assert (tmp_path / "i8" / "vectors.i8").stat().st_size * 4 == (tmp_path / "f32" / "vectors.f32").stat().st_size
+    for query in ("despido del trabajador", "locación de inmuebles", "vacaciones pagas"):
+        hits_f32 = exacto.search_by_vectors([fake_embedding(query)], k=4)[0]
+        hits_i8 = cuantizado.search_by_vectors([fake_embedding(query)], k=4)[0]
+        assert hits_f32[0][0] == hits_i8[0][0]
+        # Las filas empatadas pueden salir en otro orden: se comparan los scores por fila
+        assert dict(hits_i8) == pytest.approx(dict(hits_f32), abs=0.02)
+
+
+def test_filtro_de_metadata(tmp_path):
+    store = _store(tmp_path)
+    assert _top_ids(store, TEXTOS["a"], filter={"ley": "ccyc"}) == ["c"]
+    assert sorted(_top_ids(store, TEXTOS["c"], filter={"ley": {"$in": ["lct"]}})) == ["a", "b", "d"]
+    store.update_metadatas(["b"], [{"ley": "ccyc"}])
+    assert sorted(_top_ids(MmapVectorStore(str(tmp_path), _Embeddings()), "x", filter={"ley": "ccyc"})) == ["b", "c"]
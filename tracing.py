@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import defaultdict
+from helpers import get_env_var, get_env_float
+
+# Límites de los buckets del histograma de duración (segundos)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_logging_lock = threading.Lock()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger del proyecto ("legisbot.<módulo>"). El nivel sale de LOG_LEVEL (INFO por defecto);
+    con LOG_LEVEL=DEBUG se ven también los detalles de ingesta.
+    """
+    root = logging.getLogger("legisbot")
+    with _logging_lock:
+        if not root.handlers:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+            root.addHandler(handler)
+            root.setLevel((get_env_var("LOG_LEVEL") or "INFO").upper())
+            root.propagate = False
+    return root.getChild(name)
+
+
+_current_span = contextvars.ContextVar("legisbot_span", default=None)
+
+
+class Span:
+    """Etapa medida de una consulta: duración, contadores (tokens, bytes, ...) y desglose de etapas hijas."""
+
+    def __init__(self, name: str, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attrs = attrs
+        self.counts = defaultdict(float)
+        self.children = defaultdict(float)  # nombre de etapa -> segundos acumulados
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, **counts):
+        """Suma contadores numéricos (tokens, bytes, chars, docs...)."""
+        for key, value in counts.items():
+            self.counts[key] += value
+
+    def breakdown(self) -> dict:
+        """Milisegundos por etapa hija (incluidas las nietas, agrupadas por nombre)."""
+        return {name: round(seconds * 1000, 1) for name, seconds in self.children.items()}
+
+    def to_dict(self) -> dict:
+        out = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            **self.attrs,
+            **{k: (int(v) if float(v).is_integer() else v) for k, v in self.counts.items()},
+        }
+        if self.children:
+            out["etapas_ms"] = self.breakdown()
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+class Tracer:
+    """
+    Agrega las etapas terminadas en métricas por nombre (histograma de duración y contadores)
+    y, si se configuró, escribe cada etapa en un archivo JSONL y las métricas en formato
+    de texto de Prometheus.
+    """
+
+    def __init__(self, trace_file: str = None, metrics_file: str = None, metrics_interval: float = 10.0):
+        self.trace_file = trace_file
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self._lock = threading.Lock()
+        self._trace_fh = None
+        self._last_metrics_write = 0.0
+        self.durations = defaultdict(lambda: {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS)})
+        self.counters = defaultdict(float)  # (etapa, contador) -> total
+        self.errors = defaultdict(int)
+
+    def record(self, span: Span):
+        with self._lock:
+            stats = self.durations[span.name]
+            stats["count"] += 1
+            stats["sum"] += span.duration
+            for i, limit in enumerate(BUCKETS):
+                if span.duration <= limit:
+                    stats["buckets"][i] += 1
+            for key, value in span.counts.items():
+                self.counters[(span.name, key)] += value
+            if span.error:
+                self.errors[span.name] += 1
+            if self.trace_file:
+                if self._trace_fh is None:
+                    if os.path.dirname(self.trace_file):
+                        os.makedirs(os.path.dirname(self.trace_file), exist_ok=True)
+                    self._trace_fh = open(self.trace_file, "a", encoding="utf-8")
+                self._trace_fh.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+                # Se vuelca al terminar cada consulta, no en cada etapa
+                if span.parent is None:
+                    self._trace_fh.flush()
+            write_metrics = (self.metrics_file and span.parent is None
+                             and time.time() - self._last_metrics_write >= self.metrics_interval)
+        if write_metrics:
+            self.write_prometheus(self.metrics_file)
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            durations = {name: {**s, "buckets": list(s["buckets"])} for name, s in self.durations.items()}
+            counters = dict(self.counters)
+            errors = dict(self.errors)
+        lines = ["# HELP legisbot_span_seconds Duración de cada etapa.", "# TYPE legisbot_span_seconds histogram"]
+        for name, stats in sorted(durations.items()):
+            for limit, count in zip(BUCKETS, stats["buckets"]):
+                lines.append(f'legisbot_span_seconds_bucket{{span="{name}",le="{limit}"}} {count}')
+            lines.append(f'legisbot_span_seconds_bucket{{span="{name}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'legisbot_span_seconds_sum{{span="{name}"}} {stats["sum"]:.6f}')
+            lines.append(f'legisbot_span_seconds_count{{span="{name}"}} {stats["count"]}')
+        lines += ["# HELP legisbot_span_errors_total Etapas terminadas con excepción.",
+                  "# TYPE legisbot_span_errors_total counter"]
+        for name, count in sorted(errors.items()):
+            lines.append(f'legisbot_span_errors_total{{span="{name}"}} {count}')
+        for metric in sorted({key for _, key in counters}):
+            lines += [f"# TYPE legisbot_span_{metric}_total counter"]
+            for (name, key), value in sorted(counters.items()):
+                if key == metric:
+                    lines.append(f'legisbot_span_{metric}_total{{span="{name}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        text = self.prometheus_text()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._last_metrics_write = time.time()
+
+    def flush(self):
+        with self._lock:
+            if self._trace_fh is not None:
+                self._trace_fh.flush()
+        if self.metrics_file:
+            self.write_prometheus(self.metrics_file)
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Tracer compartido por proceso: TRACE_FILE (JSONL) y METRICS_FILE (Prometheus) son opcionales."""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer(
+                trace_file=get_env_var("TRACE_FILE") or None,
+                metrics_file=get_env_var("METRICS_FILE") or None,
+                metrics_interval=get_env_float("METRICS_INTERVAL", 10.0),
+            )
+        return _tracer
+
+
+class span:
+    """
+    Context manager de una etapa: `with span("embed", textos=n) as s: ...; s.add(tokens=...)`.
+    Se anida con la etapa activa del mismo hilo/contexto; la primera de una consulta es la raíz.
+    """
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self) -> Span:
+        self.span = Span(self.name, _current_span.get(), **self.attrs)
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        s = self.span
+        s.duration = time.perf_counter() - s._t0
+        if exc is not None:
+            s.error = f"{exc_type.__name__}: {exc}"
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Cerrada desde otro contexto (p. ej. un callback en otro hilo): se restaura el padre
+            _current_span.set(s.parent)
+        parent = s.parent
+        while parent is not None:
+            parent.children[s.name] += s.duration
+            parent = parent.parent
+        get_tracer().record(s)
+        return False
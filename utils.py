@@ -2,16 +2,28 @@ import re
 from docx import Document
 import os
 
+PLACEHOLDER_PATTERN = re.compile(r"{([\w\sáéíóúñÁÉÍÓÚÑ]+)}")
+DATO_PATTERN = re.compile(r"([\w\sáéíóúñÁÉÍÓÚÑ]+):\s*(.+)")
+
+def normalizar_campo(nombre):
+    return nombre.strip().lower().replace(" ", "_")
+
 def extraer_datos_cliente(docx_path):
     """
     Extrae datos clave-valor de un DOCX tipo formulario (una línea por dato, formato: Campo: Valor)
     """
     doc = Document(docx_path)
+    return datos_desde_lineas(para.text for para in doc.paragraphs)
+
+def datos_desde_lineas(lineas):
+    """
+    Datos clave-valor de líneas de texto con formato Campo: Valor (las demás se ignoran)
+    """
     datos = {}
-    for para in doc.paragraphs:
-        match = re.match(r"([\w\sáéíóúñÁÉÍÓÚÑ]+):\s*(.+)", para.text)
+    for linea in lineas:
+        match = DATO_PATTERN.match(linea)
         if match:
-            campo = match.group(1).strip().lower().replace(" ", "_")
+            campo = normalizar_campo(match.group(1))
             valor = match.group(2).strip()
             datos[campo] = valor
     return datos
@@ -21,6 +33,6 @@ def reemplazar_placeholders(texto, datos):
     Reemplaza {campo} en texto por el valor correspondiente en datos.
     """
     def repl(match):
-        key = match.group(1).lower().replace(" ", "_")
+        key = normalizar_campo(match.group(1))
         return datos.get(key, match.group(0))
-    return re.sub(r"{([\w\sáéíóúñÁÉÍÓÚÑ]+)}", repl, texto)
\ No newline at end of file
+    return PLACEHOLDER_PATTERN.sub(repl, texto)
@@ -0,0 +1,371 @@
+import os
+import json
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from tracing import get_logger, span
+
+INDEX_FILENAME = "index.json"
+ROWS_FILENAME = "rows.jsonl"
+TEXTS_FILENAME = "texts.bin"
+SCALES_FILENAME = "scales.f32"
+VECTOR_FILENAMES = {"float32": "vectors.f32", "int8": "vectors.i8"}
+# Filas por bloque al calcular similitudes: acota la memoria temporal con índices grandes
+SEARCH_BLOCK_ROWS = 65536
+# Proporción de filas borradas a partir de la cual delete() compacta los archivos
+COMPACT_RATIO = 0.25
+
+log = get_logger("vector_store")
+
+
+def _matches(meta: dict, filtro: dict) -> bool:
+    """Filtro de metadata al estilo Chroma: {"ley": "cpc"}, {"ley": {"$in": [...]}}, {"$and"/"$or": [...]}."""
+    for key, cond in filtro.items():
+        if key == "$and":
+            if not all(_matches(meta, f) for f in cond):
+                return False
+        elif key == "$or":
+            if not any(_matches(meta, f) for f in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = meta.get(key)
+            for op, arg in cond.items():
+                if op == "$eq" and value != arg or op == "$ne" and value == arg:
+                    return False
+                if op == "$in" and value not in arg or op == "$nin" and value in arg:
+                    return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Índice vectorial local para colecciones de lectura frecuente: los embeddings (normalizados)
+    van en una matriz contigua float32, o int8 con una escala por fila, en un archivo que se abre
+    con memory-map; ids, metadata y posición de cada texto van en una tabla lateral JSONL y los
+    textos en un archivo aparte que se lee solo para los resultados. Varios procesos comparten
+    la matriz desde el page cache del sistema operativo sin cargarla en su memoria.
+
+    Las escrituras son solo de anexar (los borrados quedan como marcas hasta compactar), con un
+    único proceso escritor: los lectores ven lo agregado después de abrir al volver a abrir.
+    Implementa lo que usan sync_collection, build_legal_indexes y as_retriever() de Chroma.
+    """
+
+    def __init__(self, persist_directory: str, embedding_function, dtype: str = "float32"):
+        if dtype not in VECTOR_FILENAMES:
+            raise ValueError(f"Tipo de vector no soportado: {dtype} (float32 o int8)")
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self._lock = threading.Lock()
+        os.makedirs(persist_directory, exist_ok=True)
+        self.dim = None
+        self.dtype = self.requested_dtype = dtype
+        self._load()
+
+    # --- Archivos ---
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.persist_directory, name)
+
+    def _load(self):
+        index_path = self._file(INDEX_FILENAME)
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+            if info["dtype"] != self.dtype:
+                log.warning(f"{self.persist_directory}: el índice existente es {info['dtype']}, "
+                            f"se ignora {self.dtype} hasta reconstruirlo")
+            self.dim, self.dtype = info["dim"], info["dtype"]
+        self.ids = []
+        self.metadatas = []
+        self.text_spans = []  # (offset, largo) en texts.bin
+        self.alive = []
+        self.rows_by_id = {}
+        rows_path = self._file(ROWS_FILENAME)
+        if os.path.exists(rows_path):
+            with open(rows_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # escritura cortada: se descarta la última línea incompleta
+                    record = json.loads(line)
+                    if "del" in record:
+                        row = self.rows_by_id.pop(record["del"], None)
+                        if row is not None:
+                            self.alive[row] = False
+                        continue
+                    if "upd" in record:
+                        row = self.rows_by_id.get(record["upd"])
+                        if row is not None:
+                            self.metadatas[row] = record["meta"]
+                        continue
+                    self.rows_by_id[record["id"]] = len(self.ids)
+                    self.ids.append(record["id"])
+                    self.metadatas.append(record["meta"])
+                    self.text_spans.append((record["off"], record["len"]))
+                    self.alive.append(True)
+        self._map()
+
+    def _map(self):
+        """(Re)abre la matriz con memory-map; las filas válidas son las de la tabla lateral."""
+        self._vectors = self._scales = None
+        n = len(self.ids)
+        if not n:
+            return
+        self._vectors = np.memmap(self._file(VECTOR_FILENAMES[self.dtype]), dtype=np.dtype(self.dtype),
+                                  mode="r", shape=(n, self.dim))
+        if self.dtype == "int8":
+            self._scales = np.memmap(self._file(SCALES_FILENAME), dtype=np.float32, mode="r", shape=(n,))
+
+    def _write_index(self):
+        tmp_path = self._file(INDEX_FILENAME) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype}, f)
+        os.replace(tmp_path, self._file(INDEX_FILENAME))
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _encode(self, matrix: np.ndarray):
+        """Filas listas para escribir: float32 tal cual, o int8 simétrico con su escala."""
+        if self.dtype == "float32":
+            return matrix, None
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    # --- API de escritura (misma firma que Chroma) ---
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs) -> list:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [os.urandom(8).hex() for _ in texts]
+        matrix = self._normalize(self.embedding_function.embed_documents(texts))
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._write_index()
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Dimensión de embeddings {matrix.shape[1]} distinta a la del índice ({self.dim})")
+            # Un id repetido reemplaza al anterior, como un upsert
+            repetidos = [i for i in ids if i in self.rows_by_id]
+            if repetidos:
+                self._delete_locked(repetidos)
+            rows, scales = self._encode(matrix)
+            self._truncate_partial()
+            with open(self._file(TEXTS_FILENAME), "ab") as f:
+                offset = f.tell()
+                spans = []
+                for text in texts:
+                    data = text.encode("utf-8")
+                    f.write(data)
+                    spans.append((offset, len(data)))
+                    offset += len(data)
+            with open(self._file(VECTOR_FILENAMES[self.dtype]), "ab") as f:
+                f.write(rows.tobytes())
+            if scales is not None:
+                with open(self._file(SCALES_FILENAME), "ab") as f:
+                    f.write(scales.tobytes())
+            # La tabla lateral se escribe al final: es la que confirma las filas
+            with open(self._file(ROWS_FILENAME), "a", encoding="utf-8") as f:
+                for cid, meta, (off, length) in zip(ids, metadatas, spans):
+                    self.rows_by_id[cid] = len(self.ids)
+                    self.ids.append(cid)
+                    self.metadatas.append(meta or {})
+                    self.text_spans.append((off, length))
+                    self.alive.append(True)
+                    f.write(json.dumps({"id": cid, "meta": meta or {}, "off": off, "len": length},
+                                       ensure_ascii=False) + "\n")
+            self._map()
+        return ids
+
+    def _truncate_partial(self):
+        """Descarta bytes de una escritura cortada que la tabla lateral no llegó a confirmar."""
+        n = len(self.ids)
+        sizes = {
+            TEXTS_FILENAME: max((off + length for off, length in self.text_spans), default=0),
+            VECTOR_FILENAMES[self.dtype]: n * self.dim * np.dtype(self.dtype).itemsize,
+        }
+        if self.dtype == "int8":
+            sizes[SCALES_FILENAME] = n * np.dtype(np.float32).itemsize
+        for name, size in sizes.items():
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def update_metadatas(self, ids: list, metadatas: list):
+        """Reemplaza la metadata de filas existentes (sin tocar vectores ni textos)."""
+        with self._lock:
+            with open(self._file(ROWS_FILENAME), "a", encoding="utf-8") as f:
+                for cid, meta in zip(ids, metadatas):
+                    row = self.rows_by_id.get(cid)
+                    if row is not None:
+                        self.metadatas[row] = meta
+                        f.write(json.dumps({"upd": cid, "meta": meta}, ensure_ascii=False) + "\n")
+
+    def delete(self, ids=None, **kwargs):
+        with self._lock:
+            self._delete_locked(ids or [])
+            muertos = len(self.ids) - len(self.rows_by_id)
+            if self.ids and muertos / len(self.ids) > COMPACT_RATIO:
+                self._compact_locked()
+
+    def _delete_locked(self, ids: list):
+        with open(self._file(ROWS_FILENAME), "a", encoding="utf-8") as f:
+            for cid in ids:
+                row = self.rows_by_id.pop(cid, None)
+                if row is not None:
+                    self.alive[row] = False
+                    f.write(json.dumps({"del": cid}) + "\n")
+
+    def compact(self):
+        """Reescribe el índice sin filas borradas ni actualizaciones de metadata pendientes (p. ej. antes de empaquetarlo)."""
+        with self._lock:
+            if self.ids:
+                self._compact_locked()
+
+    def _compact_locked(self):
+        """Reescribe los archivos sin las filas borradas (los lectores abiertos conservan los anteriores)."""
+        vivas = [row for row, ok in enumerate(self.alive) if ok]
+        if not vivas:
+            self._vectors = self._scales = None
+            # Índice vacío: se borra todo y el próximo add_texts usa el dtype pedido
+            for name in (INDEX_FILENAME, ROWS_FILENAME, TEXTS_FILENAME, SCALES_FILENAME, *VECTOR_FILENAMES.values()):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self.dim, self.dtype = None, self.requested_dtype
+            self._load()
+            return
+        log.info(f"{self.persist_directory}: compactando índice ({len(self.ids) - len(vivas)} filas borradas)")
+        texts = self._read_texts(vivas)
+        records, offset = [], 0
+        with open(self._file(TEXTS_FILENAME) + ".tmp", "wb") as f:
+            for row, text in zip(vivas, texts):
+                data = text.encode("utf-8")
+                f.write(data)
+                records.append({"id": self.ids[row], "meta": self.metadatas[row], "off": offset, "len": len(data)})
+                offset += len(data)
+        vector_file = self._file(VECTOR_FILENAMES[self.dtype])
+        if self._vectors is not None:
+            with open(vector_file + ".tmp", "wb") as f:
+                f.write(np.ascontiguousarray(self._vectors[vivas]).tobytes())
+            if self._scales is not None:
+                with open(self._file(SCALES_FILENAME) + ".tmp", "wb") as f:
+                    f.write(np.ascontiguousarray(self._scales[vivas]).tobytes())
+        with open(self._file(ROWS_FILENAME) + ".tmp", "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._vectors = self._scales = None
+        for name in (TEXTS_FILENAME, VECTOR_FILENAMES[self.dtype], SCALES_FILENAME, ROWS_FILENAME):
+            if os.path.exists(self._file(name) + ".tmp"):
+                os.replace(self._file(name) + ".tmp", self._file(name))
+        self._load()
+
+    # --- API de lectura ---
+
+    def _read_texts(self, rows) -> list:
+        texts = []
+        with open(self._file(TEXTS_FILENAME), "rb") as f:
+            for row in rows:
+                off, length = self.text_spans[row]
+                f.seek(off)
+                texts.append(f.read(length).decode("utf-8"))
+        return texts
+
+    def get(self, ids=None, include=None, **kwargs) -> dict:
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock:
+            rows = ([self.rows_by_id[i] for i in ids if i in self.rows_by_id] if ids is not None
+                    else sorted(self.rows_by_id.values()))
+            result = {"ids": [self.ids[r] for r in rows]}
+            if "metadatas" in include:
+                result["metadatas"] = [self.metadatas[r] for r in rows]
+            if "documents" in include:
+                result["documents"] = self._read_texts(rows) if rows else []
+        return result
+
+    def __len__(self) -> int:
+        return len(self.rows_by_id)
+
+    def _mask(self, filtro: dict = None) -> np.ndarray:
+        mask = np.fromiter(self.alive, dtype=bool, count=len(self.alive))
+        if filtro:
+            mask &= np.fromiter((_matches(m, filtro) for m in self.metadatas), dtype=bool, count=len(self.metadatas))
+        return mask
+
+    def search_by_vectors(self, queries, k: int = 4, filter: dict = None) -> list:
+        """
+        Top-k de varias consultas a la vez: un producto matricial por bloque de filas,
+        descartando antes las filas que no pasan el filtro. Devuelve por consulta [(fila, score)].
+        """
+        queries = self._normalize(queries)
+        with self._lock:
+            vectors, scales, mask = self._vectors, self._scales, self._mask(filter)
+        if vectors is None or not mask.any():
+            return [[] for _ in queries]
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(mask), SEARCH_BLOCK_ROWS):
+            rows = np.flatnonzero(mask[start:start + SEARCH_BLOCK_ROWS]) + start
+            if not len(rows):
+                continue
+            block = np.asarray(vectors[rows], dtype=np.float32)
+            scores = queries @ block.T
+            if scales is not None:
+                scores *= scales[rows]
+            # Se conservan solo los k mejores acumulados: la memoria no depende del tamaño del índice
+            all_scores = np.concatenate([best_scores, scores], axis=1)
+            all_rows = np.concatenate([best_rows, np.broadcast_to(rows, scores.shape)], axis=1)
+            if all_scores.shape[1] > k:
+                top = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+                all_scores = np.take_along_axis(all_scores, top, axis=1)
+                all_rows = np.take_along_axis(all_rows, top, axis=1)
+            best_scores, best_rows = all_scores, all_rows
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [[(int(r), float(s)) for r, s in zip(rows, scores)] for rows, scores in zip(best_rows, best_scores)]
+
+    def _documents(self, hits: list) -> list:
+        texts = self._read_texts([row for row, _ in hits]) if hits else []
+        return [(Document(page_content=text, metadata=dict(self.metadatas[row])), score)
+                for (row, score), text in zip(hits, texts)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        with span("vector_index", backend="mmap") as s:
+            query_vector = self.embedding_function.embed_query(query)
+            hits = self.search_by_vectors([query_vector], k=k, filter=filter)[0]
+            s.add(docs=len(hits))
+            return self._documents(hits)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: dict = None) -> list:
+        """[(Document, similitud coseno)] para una consulta ya embebida."""
+        return self._documents(self.search_by_vectors([embedding], k=k, filter=filter)[0])
+
+    def _select_relevance_score_fn(self):
+        # Los vectores están normalizados: el score ya es similitud coseno
+        return lambda score: score
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, persist_directory: str = None, **kwargs):
+        store = cls(persist_directory or "vector_index", embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store